@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    routingbench
+    ~~~~~~~~~~~~
+
+    Benchmarks the URL routing system with generated maps of increasing
+    size.  Every map is made of sections that mix static rules, rules with
+    `int`, `path` and `any` converters, method restricted rules and rules
+    for user subdomains (or hosts if host matching is enabled).
+
+    For each map size the latency of every single call is recorded for
+    binding to a WSGI environment, matching hits for GET and POST requests,
+    misses, 405 errors and slash redirects, and building URLs.  The median
+    and the 99th percentile are reported per map size, followed by the
+    scaling of the medians relative to the smallest map.
+
+    Example::
+
+        $ python routingbench.py --sizes 10,100,1000 --trie
+        $ python routingbench.py --profile match_hit
+
+    :copyright: 2012 by the Werkzeug Team, see AUTHORS for more details.
+    :license: BSD, see LICENSE for more details.
+"""
+
+import os
+import gc
+import sys
+import random
+from timeit import default_timer as timer
+
+
+# the rules generated for every section of the map
+RULES_PER_SECTION = 8
+
+SCENARIOS = ['bind_to_environ', 'match_hit', 'match_post', 'match_miss',
+             'match_405', 'match_redirect', 'build']
+
+
+def make_map(routing, rule_count, host_matching=False, **options):
+    """Creates a map with about `rule_count` rules."""
+    Rule = routing.Rule
+    if host_matching:
+        host = {'host': 'example.com'}
+        user_host = {'host': '<user>.example.com'}
+    else:
+        host = {}
+        user_host = {'subdomain': '<user>'}
+    rules = []
+    for x in range(max(rule_count // RULES_PER_SECTION, 1)):
+        prefix = '/s%d' % x
+        rules.extend([
+            Rule(prefix + '/', endpoint='index%d' % x, **host),
+            Rule(prefix + '/about', endpoint='about%d' % x, **host),
+            Rule(prefix + '/item/<int:id>', endpoint='item%d' % x,
+                 methods=['GET'], **host),
+            Rule(prefix + '/item/<int:id>', endpoint='item_save%d' % x,
+                 methods=['POST'], **host),
+            Rule(prefix + '/<any(news, blog, docs):kind>/<slug>',
+                 endpoint='article%d' % x, methods=['GET'], **host),
+            Rule(prefix + '/files/<path:filename>', endpoint='files%d' % x,
+                 methods=['GET'], **host),
+            Rule(prefix + '/dashboard/', endpoint='dashboard%d' % x,
+                 **user_host),
+            Rule(prefix + '/settings/<int:page>', endpoint='settings%d' % x,
+                 **user_host)
+        ])
+    return routing.Map(rules, host_matching=host_matching, **options)
+
+
+class RoutingBenchmark(object):
+    """Prepares the calls for all scenarios of one map."""
+
+    def __init__(self, werkzeug, rule_count, rounds, host_matching=False,
+                 **options):
+        self.werkzeug = werkzeug
+        self.routing = werkzeug.routing
+        self.map = make_map(self.routing, rule_count, host_matching,
+                            **options)
+        self.sections = max(rule_count // RULES_PER_SECTION, 1)
+        self.rule_count = len(list(self.map.iter_rules()))
+        self.rounds = rounds
+        self.host_matching = host_matching
+        self.random = random.Random(rule_count)
+        self.adapter = self.bind('example.com', '')
+        self.user_adapter = self.bind('joe.example.com', 'joe')
+
+    def bind(self, host, subdomain, method='GET'):
+        if self.host_matching:
+            return self.map.bind(host, default_method=method)
+        return self.map.bind('example.com', subdomain=subdomain,
+                             default_method=method)
+
+    def section(self):
+        return '/s%d' % self.random.randrange(self.sections)
+
+    def make_calls(self, scenario):
+        """Returns a list of ``(func, args, expected)`` tuples for the
+        scenario.  `expected` is the exception the call raises or `None`.
+        """
+        return [getattr(self, 'make_' + scenario)()
+                for x in range(self.rounds)]
+
+    def make_bind_to_environ(self):
+        create_environ = self.werkzeug.test.create_environ
+        host = self.random.choice(['example.com', 'joe.example.com'])
+        environ = create_environ(self.section() + '/about',
+                                 'http://%s/' % host)
+        if self.host_matching:
+            return self.map.bind_to_environ, (environ,), None
+        return self.map.bind_to_environ, (environ, 'example.com'), None
+
+    def make_match_hit(self):
+        section = self.section()
+        adapter = self.adapter
+        path = self.random.choice([
+            section + '/',
+            section + '/about',
+            section + '/item/%d' % self.random.randrange(1000),
+            section + '/blog/hello-world',
+            section + '/files/css/style.css'
+        ])
+        if self.random.random() < 0.25:
+            adapter = self.user_adapter
+            path = self.random.choice([section + '/dashboard/',
+                                       section + '/settings/2'])
+        return adapter.match, (path,), None
+
+    def make_match_post(self):
+        path = self.section() + '/item/%d' % self.random.randrange(1000)
+        return self.adapter.match, (path, 'POST'), None
+
+    def make_match_miss(self):
+        path = self.random.choice([
+            self.section() + '/missing',
+            self.section() + '/item/foo',
+            '/s%d/about' % (self.sections + 1)
+        ])
+        return self.adapter.match, (path,), self.routing.NotFound
+
+    def make_match_405(self):
+        path = self.section() + '/item/42'
+        return self.adapter.match, (path, 'PUT'), \
+               self.routing.MethodNotAllowed
+
+    def make_match_redirect(self):
+        section = self.section()
+        adapter = self.adapter
+        path = section
+        if self.random.random() < 0.25:
+            adapter = self.user_adapter
+            path = section + '/dashboard'
+        return adapter.match, (path,), self.routing.RequestRedirect
+
+    def make_build(self):
+        x = self.random.randrange(self.sections)
+        return self.adapter.build, self.random.choice([
+            ('index%d' % x,),
+            ('item%d' % x, {'id': 42}),
+            ('article%d' % x, {'kind': 'news', 'slug': 'hello'}),
+            ('files%d' % x, {'filename': 'css/style.css', 'v': 2}),
+            ('settings%d' % x, {'user': 'joe', 'page': 3}, 'GET', True)
+        ]), None
+
+
+def time_calls(calls):
+    """Calls all the functions and returns the time each call took in
+    microseconds.
+    """
+    rv = []
+    gc.collect()
+    gc.disable()
+    try:
+        for func, args, expected in calls:
+            if expected is None:
+                t = timer()
+                func(*args)
+                rv.append(timer() - t)
+                continue
+            t = timer()
+            try:
+                func(*args)
+            except expected:
+                rv.append(timer() - t)
+            else:
+                raise AssertionError('%r%r did not raise %s' %
+                                     (func, args, expected.__name__))
+    finally:
+        gc.enable()
+    return [x * 1000000 for x in rv]
+
+
+def percentile(seq, percent):
+    seq = sorted(seq)
+    if not seq:
+        return 0.0
+    return seq[min(len(seq) * percent // 100, len(seq) - 1)]
+
+
+def run(werkzeug, sizes, scenarios, rounds, options):
+    print('=' * 80)
+    print('WERKZEUG ROUTING BENCHMARK'.center(80))
+    print('-' * 80)
+    print('Version: %s' % werkzeug.__version__)
+    print('Options: %s' % ', '.join('%s=%r' % x for x in
+                                    sorted(options.items())))
+    print('Rounds:  %d' % rounds)
+    results = {}
+    for size in sizes:
+        bench = RoutingBenchmark(werkzeug, size, rounds, **options)
+        print('-' * 80)
+        print('%d rules' % bench.rule_count)
+        print('%44s   %10s   %10s' % ('', 'p50 (us)', 'p99 (us)'))
+        for scenario in scenarios:
+            calls = bench.make_calls(scenario)
+            # warm up caches and lazily compiled state
+            time_calls(calls)
+            timings = time_calls(calls)
+            p50 = percentile(timings, 50)
+            results[scenario, size] = p50
+            print('%44s   %10.2f   %10.2f' % (scenario, p50,
+                                               percentile(timings, 99)))
+
+    print('-' * 80)
+    print('SCALING OF THE MEDIAN (relative to %d rules)' % sizes[0])
+    print('%20s' % '' + ''.join('%10d' % x for x in sizes))
+    for scenario in scenarios:
+        base = results[scenario, sizes[0]] or 1.0
+        print('%20s' % scenario + ''.join(
+            '%9.1fx' % (results[scenario, x] / base) for x in sizes))
+    print('-' * 80)
+
+
+def profile(werkzeug, size, scenario, rounds, options):
+    from cProfile import Profile
+    from pstats import Stats
+    bench = RoutingBenchmark(werkzeug, size, rounds, **options)
+    calls = bench.make_calls(scenario)
+    profiler = Profile()
+    profiler.runcall(time_calls, calls)
+    stats = Stats(profiler)
+    stats.sort_stats('cumulative').print_stats(25)
+
+
+def main():
+    """The main entrypoint."""
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--werkzeug-path', '-p', dest='path', default='..',
+                      help='the path to the werkzeug package. defaults to ..')
+    parser.add_option('--sizes', dest='sizes', default='10,100,1000,5000',
+                      help='comma separated number of rules of the maps')
+    parser.add_option('--scenarios', dest='scenarios',
+                      default=','.join(SCENARIOS),
+                      help='comma separated scenarios to run')
+    parser.add_option('--rounds', '-n', dest='rounds', type='int',
+                      default=2000, help='the calls per scenario and size')
+    parser.add_option('--trie', dest='trie_matching', action='store_true',
+                      default=False, help='enable trie matching')
+    parser.add_option('--host-matching', dest='host_matching',
+                      action='store_true', default=False,
+                      help='match hosts instead of subdomains')
+    parser.add_option('--match-cache', dest='match_cache_size', type='int',
+                      default=0, help='size of the match cache')
+    parser.add_option('--build-cache', dest='build_cache_size', type='int',
+                      default=0, help='size of the build cache')
+    parser.add_option('--profile', dest='profile', metavar='SCENARIO',
+                      help='profile a scenario with the largest map instead')
+    options, args = parser.parse_args()
+    if args:
+        parser.error('Script takes no arguments')
+
+    sys.path.insert(0, os.path.abspath(options.path))
+    import werkzeug
+    import werkzeug.routing
+    import werkzeug.test
+
+    sizes = sorted(int(x) for x in options.sizes.split(','))
+    scenarios = options.scenarios.split(',')
+    for scenario in scenarios + [options.profile or SCENARIOS[0]]:
+        if scenario not in SCENARIOS:
+            parser.error('unknown scenario %r' % scenario)
+    map_options = {
+        'trie_matching':        options.trie_matching,
+        'host_matching':        options.host_matching,
+        'match_cache_size':     options.match_cache_size,
+        'build_cache_size':     options.build_cache_size
+    }
+    if options.profile:
+        profile(werkzeug, sizes[-1], options.profile, options.rounds,
+                map_options)
+    else:
+        run(werkzeug, sizes, scenarios, options.rounds, map_options)
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(__file__) or os.path.curdir)
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('interrupted!', file=sys.stderr)
@@ -16,7 +16,7 @@ import os
 import gc
 import sys
 import subprocess
-from io import StringIO
+from io import BytesIO, StringIO
 from timeit import default_timer as timer
 from types import FunctionType
 
@@ -24,7 +24,7 @@ from types import FunctionType
 # create a new module where we later store all the werkzeug attributes.
 wz = type(sys)('werkzeug_nonlazy')
 sys.path.insert(0, '<DUMMY>')
-null_out = file(os.devnull, 'w')
+null_out = open(os.devnull, 'w')
 
 
 # ±4% are ignored
@@ -80,7 +80,7 @@ def load_werkzeug(path):
 
     # get the real version from the setup file
     try:
-        f = file(os.path.join(path, 'setup.py'))
+        f = open(os.path.join(path, 'setup.py'))
     except IOError:
         pass
     else:
@@ -262,6 +262,12 @@ def run(path, no_header=False):
 
 URL_DECODED_DATA = dict((str(x), str(x)) for x in range(100))
 URL_ENCODED_DATA = '&'.join('%s=%s' % x for x in list(URL_DECODED_DATA.items()))
+# a query string of about 2KB with escapes and unicode values
+URL_DECODED_TEXT = dict(('field_%d' % x, 'some text & symbols/%d \xfc' % x)
+                        for x in range(50))
+URL_ENCODED_TEXT = '&'.join('%s=%s' % (k, v.replace(' ', '+').replace(
+    '&', '%26').replace('/', '%2F').replace('\xfc', '%C3%BC'))
+    for k, v in URL_DECODED_TEXT.items())
 MULTIPART_ENCODED_DATA = '\n'.join((
     '--foo',
     'Content-Disposition: form-data; name=foo',
@@ -275,9 +281,20 @@ MULTIPART_ENCODED_DATA = '\n'.join((
     'Content-Disposition: form-data; name=foo; filename=wzbench.py',
     'Content-Type: text/plain',
     '',
-    file(__file__.rstrip('c')).read(),
+    open(__file__.rstrip('c')).read(),
     '--foo--'
 ))
+MULTIPART_UPLOAD_DATA = b'\r\n'.join((
+    b'--foo',
+    b'Content-Disposition: form-data; name=foo; filename=upload.bin',
+    b'Content-Type: application/octet-stream',
+    b'',
+    bytes(bytearray(range(256))) * 4096,
+    b'--foo--'
+))
+SHORT_LINES_DATA = b'\r\n'.join(b'line %d' % x for x in range(10000))
+LONG_LINES_DATA = b'\n'.join([b'x' * (1024 * 1024)] * 4)
+CHUNKS_DATA = b'&'.join(b'key%d=value%d' % (x, x) for x in range(10000))
 MULTIDICT = None
 REQUEST = None
 TEST_ENV = None
@@ -293,6 +310,14 @@ def time_url_encode():
     wz.url_encode(URL_DECODED_DATA)
 
 
+def time_url_decode_escaped():
+    wz.url_decode(URL_ENCODED_TEXT)
+
+
+def time_url_encode_unicode():
+    wz.url_encode(URL_DECODED_TEXT)
+
+
 def time_parse_form_data_multipart():
     # use a hand written env creator so that we don't bench
     # from_values which is known to be slowish in 0.5.1 and higher.
@@ -307,6 +332,34 @@ def time_parse_form_data_multipart():
     request.form
 
 
+def time_parse_form_data_multipart_upload():
+    # a binary upload of 1MB with a newline every 256 bytes
+    wz.parse_form_data({
+        'REQUEST_METHOD':   'POST',
+        'CONTENT_TYPE':     'multipart/form-data; boundary=foo',
+        'wsgi.input':       BytesIO(MULTIPART_UPLOAD_DATA),
+        'CONTENT_LENGTH':   str(len(MULTIPART_UPLOAD_DATA))
+    })
+
+
+def time_make_line_iter_short_lines():
+    for line in wz.make_line_iter(BytesIO(SHORT_LINES_DATA),
+                                  len(SHORT_LINES_DATA)):
+        pass
+
+
+def time_make_line_iter_long_lines():
+    for line in wz.make_line_iter(BytesIO(LONG_LINES_DATA),
+                                  len(LONG_LINES_DATA)):
+        pass
+
+
+def time_make_chunk_iter():
+    for chunk in wz.wsgi.make_chunk_iter(BytesIO(CHUNKS_DATA), '&',
+                                         len(CHUNKS_DATA)):
+        pass
+
+
 def before_multidict_lookup_hit():
     global MULTIDICT
     MULTIDICT = wz.MultiDict({'foo': 'bar'})
@@ -444,6 +497,87 @@ def after_html_builder():
     TABLE = None
 
 
+def make_routing_adapter(rule_count, trie_matching):
+    rules = []
+    for x in range(rule_count // 2):
+        rules.append(wz.routing.Rule('/section%d/' % x,
+                                     endpoint='section%d' % x))
+        rules.append(wz.routing.Rule('/section%d/<int:id>/<slug>' % x,
+                                     endpoint='section%d/show' % x))
+    url_map = wz.routing.Map(rules, trie_matching=trie_matching)
+    return url_map.bind('example.com')
+
+
+def make_routing_benchmark(rule_count, trie_matching):
+    # match the last rule and a missing URL so that the linear
+    # scan has to go through all the rules.
+    last = '/section%d/42/foo' % (rule_count // 2 - 1)
+    state = {}
+
+    def before():
+        state['adapter'] = make_routing_adapter(rule_count, trie_matching)
+
+    def bench():
+        adapter = state['adapter']
+        adapter.match(last)
+        try:
+            adapter.match('/missing/42/foo')
+        except wz.routing.NotFound:
+            pass
+
+    def after():
+        state.clear()
+
+    name = 'routing_%s_%d' % (trie_matching and 'trie' or 'linear',
+                              rule_count)
+    bench.__name__ = 'time_' + name
+    globals()['before_' + name] = before
+    globals()['time_' + name] = bench
+    globals()['after_' + name] = after
+
+
+for rule_count in 10, 100, 1000, 5000:
+    make_routing_benchmark(rule_count, False)
+    make_routing_benchmark(rule_count, True)
+del rule_count
+
+
+def make_build_benchmark(cache_size):
+    state = {}
+
+    def before():
+        url_map = wz.routing.Map([
+            wz.routing.Rule('/', endpoint='index'),
+            wz.routing.Rule('/blog/', endpoint='blog/index'),
+            wz.routing.Rule('/blog/<int:year>/<int:month>/<slug>',
+                            endpoint='blog/show'),
+            wz.routing.Rule('/user/<username>/', endpoint='user'),
+            wz.routing.Rule('/files/<path:filename>', endpoint='files')
+        ], build_cache_size=cache_size)
+        state['adapter'] = url_map.bind('example.com')
+
+    def bench():
+        build = state['adapter'].build
+        for x in range(20):
+            build('index')
+            build('blog/show', {'year': 2012, 'month': 3, 'slug': 'hello'})
+            build('user', {'username': 'mitsuhiko'})
+            build('files', {'filename': 'css/style.css', 'v': 42})
+
+    def after():
+        state.clear()
+
+    name = 'routing_build_%s' % (cache_size and 'cached' or 'uncached')
+    bench.__name__ = 'time_' + name
+    globals()['before_' + name] = before
+    globals()['time_' + name] = bench
+    globals()['after_' + name] = after
+
+
+make_build_benchmark(0)
+make_build_benchmark(1000)
+
+
 if __name__ == '__main__':
     os.chdir(os.path.dirname(__file__) or os.path.curdir)
     try:
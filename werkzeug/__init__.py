@@ -64,7 +64,8 @@ all_by_module = {
                              'peek_path_info', 'SharedDataMiddleware',
                              'DispatcherMiddleware', 'ClosingIterator',
                              'FileWrapper', 'make_line_iter', 'LimitedStream',
-                             'responder', 'wrap_file', 'extract_path_info'],
+                             'ChunkedInputStream', 'responder', 'wrap_file',
+                             'extract_path_info'],
     'werkzeug.datastructures': ['MultiDict', 'CombinedMultiDict', 'Headers',
                              'EnvironHeaders', 'ImmutableList',
                              'ImmutableDict', 'ImmutableMultiDict',
@@ -8,7 +8,9 @@
     :copyright: (c) 2011 by the Werkzeug Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
+import os
 import re
+import stat
 import codecs
 import mimetypes
 from itertools import repeat
@@ -2447,6 +2449,71 @@ class WWWAuthenticate(UpdateDictMixin, dict):
     del _set_property
 
 
+def _get_fileno(f):
+    """Returns the file descriptor of a file object or `None` if it's not
+    backed by one.
+    """
+    try:
+        return f.fileno()
+    except (AttributeError, IOError, ValueError):
+        return None
+
+
+def _kernel_copyfile(src, dst):
+    """Copies the rest of the file `src` to the file object `dst` without
+    reading it into Python buffers.  Returns `False` if this is not possible
+    because the files are no real files or the system can't copy between
+    them.  Like :func:`shutil.copyfileobj` the source is at its end
+    afterwards.
+    """
+    src_fd = _get_fileno(src)
+    dst_fd = _get_fileno(dst)
+    if src_fd is None or dst_fd is None:
+        return False
+    if not stat.S_ISREG(os.fstat(src_fd).st_mode):
+        return False
+    src.flush()
+    dst.flush()
+    offset = src.tell()
+    end = os.fstat(src_fd).st_size
+
+    copy = None
+    while offset < end:
+        if copy is not None:
+            written = copy(src_fd, dst_fd, offset, end - offset)
+        else:
+            # find the first function that can copy between the files.
+            # copy_file_range works for regular files and can share the
+            # blocks on some filesystems, sendfile also for other targets.
+            for copy in _kernel_copy_functions:
+                try:
+                    written = copy(src_fd, dst_fd, offset, end - offset)
+                except OSError:
+                    continue
+                break
+            else:
+                return False
+        if not written:
+            break
+        offset += written
+
+    src.seek(offset)
+    # the kernel moved the file position of the target, tell the buffered
+    # file object about it.
+    if dst.seekable():
+        dst.seek(0, os.SEEK_CUR)
+    return True
+
+
+_kernel_copy_functions = []
+if hasattr(os, 'copy_file_range'):
+    _kernel_copy_functions.append(lambda src, dst, offset, count:
+                                  os.copy_file_range(src, dst, count, offset))
+if hasattr(os, 'sendfile'):
+    _kernel_copy_functions.append(lambda src, dst, offset, count:
+                                  os.sendfile(dst, src, offset, count))
+
+
 class FileStorage(object):
     """The :class:`FileStorage` class is a thin wrapper over incoming files.
     It is used by the request object to represent uploaded files.  All the
@@ -2525,6 +2592,12 @@ class FileStorage(object):
 
         For secure file saving also have a look at :func:`secure_filename`.
 
+        .. versionchanged:: 0.9
+           If the uploaded file and the destination are real files the
+           data is copied by the operating system with
+           :func:`os.copy_file_range` or :func:`os.sendfile` instead of
+           being read into Python buffers.
+
         :param dst: a filename or open file object the uploaded file
                     is saved to.
         :param buffer_size: the size of the buffer.  This works the same as
@@ -2537,11 +2610,44 @@ class FileStorage(object):
             dst = open(dst, 'wb')
             close_dst = True
         try:
-            copyfileobj(self.stream, dst, buffer_size)
+            if not _kernel_copyfile(self.stream, dst):
+                copyfileobj(self.stream, dst, buffer_size)
         finally:
             if close_dst:
                 dst.close()
 
+    def mmap(self):
+        """Returns a read-only buffer with the whole contents of the file
+        that can be sliced, hashed or searched without reading the file into
+        memory.  If the file is a real file, like the temporary files big
+        uploads are spooled to, it's memory mapped, for in-memory streams
+        the buffer is a view of their data.  The buffer should be used in
+        a `with` statement so that it's released afterwards.
+
+        .. versionadded:: 0.9
+        """
+        from mmap import mmap, ACCESS_READ
+        fileno = _get_fileno(self.stream)
+        if fileno is not None:
+            self.stream.flush()
+            # empty files cannot be mapped
+            if os.fstat(fileno).st_size:
+                return mmap(fileno, 0, access=ACCESS_READ)
+            return memoryview(b'')
+        if hasattr(self.stream, 'getbuffer'):
+            view = self.stream.getbuffer()
+            if hasattr(view, 'toreadonly'):
+                return view.toreadonly()
+            # read only views need Python 3.8, older versions get a copy
+            view.release()
+            return memoryview(self.stream.getvalue())
+        pos = self.stream.tell()
+        try:
+            self.stream.seek(0)
+            return memoryview(self.stream.read())
+        finally:
+            self.stream.seek(pos)
+
     def close(self):
         """Close the underlying file if possible."""
         try:
@@ -9,24 +9,23 @@
     :copyright: (c) 2011 by the Werkzeug Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
-import base64
+import binascii
 import re
+import weakref
 from io import BytesIO
 from tempfile import TemporaryFile
-from itertools import chain, repeat
+from threading import Lock
 from functools import update_wrapper
 
 from werkzeug._internal import _decode_unicode, _empty_stream
-from werkzeug.urls import url_decode_stream
-from werkzeug.wsgi import LimitedStream, make_line_iter
+from werkzeug.urls import IncrementalURLDecoder, _url_decode_string
+from werkzeug.wsgi import LimitedStream, make_chunk_iter_func, \
+     wrap_chunked_input
 from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.datastructures import Headers, FileStorage, MultiDict
 from werkzeug.http import parse_options_header
 
 
-#: an iterator that yields empty strings
-_empty_string_iter = repeat('')
-
 #: a regular expression for multipart boundaries
 _multipart_boundary_re = re.compile('^[ -~]{0,200}[!-~]$')
 
@@ -34,19 +33,158 @@ _multipart_boundary_re = re.compile('^[ -~]{0,200}[!-~]$')
 #: for multipart messages.
 _supported_multipart_encodings = frozenset(['base64', 'quoted-printable'])
 
+#: matches the line endings understood by the multipart parser
+_line_end_re = re.compile(b'\r\n?|\n')
+
+#: matches everything that is not part of the base64 alphabet
+_base64_garbage_re = re.compile(b'[^A-Za-z0-9+/=]+')
+
+
+class MemoryBudget(object):
+    """Accounts for the form data that the requests of a process hold in
+    memory while they are parsed.  Unlike the `max_form_memory_size` of a
+    single request this limits the memory used by many concurrent
+    uploads.  If the limit is reached the :func:`default_stream_factory`
+    spools files to disk and the form parser rejects form fields with a
+    :exc:`~exceptions.RequestEntityTooLarge` error.
+
+    The budget used by the form parser is :data:`upload_memory_budget`.
+
+    .. versionadded:: 0.9
+
+    :param limit: the maximum number of bytes in memory or `None` to only
+                  account for the memory.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        #: the number of bytes currently held in memory.
+        self.usage = 0
+        #: the highest usage so far.
+        self.peak = 0
+        #: the number of reservations that were refused.
+        self.refused = 0
+        self._lock = Lock()
+
+    def reserve(self, size):
+        """Reserves `size` bytes and returns `True` or `False` if that would
+        exceed the limit.
+        """
+        with self._lock:
+            if self.limit is not None and self.usage + size > self.limit:
+                self.refused += 1
+                return False
+            self.usage += size
+            if self.usage > self.peak:
+                self.peak = self.usage
+            return True
+
+    def release(self, size):
+        """Releases `size` previously reserved bytes."""
+        with self._lock:
+            self.usage -= size
+
+    def get_stats(self):
+        """Returns a dict with the `limit`, the current `usage`, the `peak`
+        usage and the number of `refused` reservations.
+        """
+        with self._lock:
+            return dict(limit=self.limit, usage=self.usage, peak=self.peak,
+                        refused=self.refused)
+
+    def __repr__(self):
+        return '<%s %d of %r bytes>' % (self.__class__.__name__,
+                                        self.usage, self.limit)
+
+
+#: the :class:`MemoryBudget` shared by all the form parsers and the
+#: :func:`default_stream_factory` of the process.  Unlimited by default,
+#: set its `limit` to enable it.
+upload_memory_budget = MemoryBudget()
+
+
+def _release_reservation(reservation):
+    """Releases the bytes a :class:`_BudgetedSpooledFile` reserved.  The
+    reservation is a list with the number of bytes or `None` once it was
+    released.
+    """
+    if reservation[0]:
+        upload_memory_budget.release(reservation[0])
+    reservation[0] = None
+
+
+class _BudgetedSpooledFile(object):
+    """An upload file that is kept in memory as long as the
+    :data:`upload_memory_budget` allows it.  Every write reserves the bytes
+    the file grows by, if a reservation is refused the data is moved to a
+    temporary file.  The reservation is released when the file is rolled
+    over, closed or garbage collected.
+    """
+
+    def __init__(self):
+        self._file = BytesIO()
+        self._reservation = [0]
+        self._release = weakref.finalize(self, _release_reservation,
+                                         self._reservation)
+
+    def write(self, data):
+        reserved = self._reservation[0]
+        if reserved is not None:
+            grow = self._file.tell() + len(data) - reserved
+            if grow > 0:
+                if upload_memory_budget.reserve(grow):
+                    self._reservation[0] = reserved + grow
+                else:
+                    self.rollover()
+        return self._file.write(data)
+
+    def rollover(self):
+        """Moves the data to a temporary file."""
+        if self._reservation[0] is None:
+            return
+        f = TemporaryFile('wb+')
+        f.write(self._file.getvalue())
+        f.seek(self._file.tell())
+        self._file.close()
+        self._file = f
+        self._release()
+
+    def close(self):
+        self._release()
+        self._file.close()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
 
 def default_stream_factory(total_content_length, filename, content_type,
                            content_length=None):
-    """The stream factory that is used per default."""
-    if total_content_length > 1024 * 500:
+    """The stream factory that is used per default.  Uploads of requests
+    up to 500KB are kept in memory as long as the
+    :data:`upload_memory_budget` allows it, the bytes are reserved as they
+    are written.  The `total_content_length` of chunked requests is `None`,
+    their uploads are always spooled.
+    """
+    if total_content_length is None or total_content_length > 1024 * 500:
         return TemporaryFile('wb+')
-    return BytesIO()
+    return _BudgetedSpooledFile()
 
 
 def parse_form_data(environ, stream_factory=None, charset='utf-8',
                     errors='replace', max_form_memory_size=None,
                     max_content_length=None, cls=None,
-                    silent=True):
+                    silent=True, multipart_parser_class=None,
+                    file_handler=None, max_file_size=None,
+                    max_value_memory_size=None):
     """Parse the form data in the environ and return it as tuple in the form
     ``(stream, form, files)``.  You should only call this method if the
     transport method is `POST`, `PUT`, or `PATCH`.
@@ -67,6 +205,13 @@ def parse_form_data(environ, stream_factory=None, charset='utf-8',
     .. versionadded:: 0.5.1
        The optional `silent` flag was added.
 
+    .. versionadded:: 0.9
+       The optional `multipart_parser_class`, `file_handler` and
+       `max_file_size` parameters were added.
+
+    .. versionadded:: 0.9
+       The optional `max_value_memory_size` parameter was added.
+
     :param environ: the WSGI environment to be used for parsing.
     :param stream_factory: An optional callable that returns a new read and
                            writeable file descriptor.  This callable works
@@ -85,11 +230,29 @@ def parse_form_data(environ, stream_factory=None, charset='utf-8',
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
     :param silent: If set to False parsing errors will not be caught.
+    :param multipart_parser_class: an optional class to parse multipart
+                                   data with.  Defaults to
+                                   :class:`MultiPartParser`.
+    :param file_handler: an optional function that is called with the name,
+                         filename and headers of every uploaded file and
+                         returns a sink to stream the file to instead of
+                         the `stream_factory` or `None`.  See
+                         :class:`FormDataParser` for details.
+    :param max_file_size: If this is provided and an uploaded file is
+                          bigger a :exc:`~exceptions.RequestEntityTooLarge`
+                          exception is raised.
+    :param max_value_memory_size: If this is provided url encoded values
+                                  that are bigger are written to the
+                                  `stream_factory` and added to the files.
+                                  See :class:`FormDataParser` for details.
     :return: A tuple in the form ``(stream, form, files)``.
     """
     return FormDataParser(stream_factory, charset, errors,
                           max_form_memory_size, max_content_length,
-                          cls, silent).parse_from_environ(environ)
+                          cls, silent, multipart_parser_class,
+                          file_handler, max_file_size,
+                          max_value_memory_size) \
+        .parse_from_environ(environ)
 
 
 def exhaust_stream(f):
@@ -111,6 +274,36 @@ class FormDataParser(object):
 
     .. versionadded:: 0.8
 
+    .. versionadded:: 0.9
+       The `multipart_parser_class`, `file_handler` and `max_file_size`
+       parameters were added.
+
+    .. versionadded:: 0.9
+       The `max_value_memory_size` parameter was added.
+
+    Uploaded files are written to the streams returned by the
+    `stream_factory` by default, which spills big files to temporary files.
+    A `file_handler` can push the data of some or all files somewhere else
+    as it is parsed instead.  It's called with the name of the field, the
+    filename and the :class:`Headers` of the part and returns `None` to use
+    the stream factory or a sink.  A sink is either a callable or an
+    object with a `write` method that is called with every chunk of the
+    file.  The next chunk is only read from the client after it returns, so
+    a slow sink slows down the upload instead of buffering it.  Once the
+    file is complete the `close` method of the sink is called if it has
+    one.  If the parsing fails before, for example because the client went
+    away or the file is bigger than `max_file_size`, the `abort` method is
+    called instead, or `close` if it has none.  The files dict contains a
+    :class:`FileStorage` for the file with the sink as stream.
+
+    Url encoded form data is kept in memory and limited by
+    `max_form_memory_size`.  If `max_value_memory_size` is set the values
+    are decoded as they are read instead and the values that get bigger
+    are written to the streams of the `stream_factory` like uploaded
+    files.  They are added to the files dict as :class:`FileStorage`
+    objects with the unquoted bytes of the value and don't count against
+    `max_form_memory_size`, but against `max_file_size`.
+
     :param stream_factory: An optional callable that returns a new read and
                            writeable file descriptor.  This callable works
                            the same as :meth:`~BaseResponse._get_file_stream`.
@@ -128,12 +321,26 @@ class FormDataParser(object):
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
     :param silent: If set to False parsing errors will not be caught.
+    :param multipart_parser_class: an optional class to parse multipart
+                                   data with.  Defaults to
+                                   :class:`MultiPartParser`.
+    :param file_handler: an optional function that returns sinks for
+                         uploaded files as explained above.
+    :param max_file_size: If this is provided and an uploaded file is
+                          bigger a :exc:`~exceptions.RequestEntityTooLarge`
+                          exception is raised.
+    :param max_value_memory_size: the maximum number of bytes of a url
+                                  encoded value that is kept in memory.
+                                  Bigger values are written to the
+                                  `stream_factory` as explained above.
     """
 
     def __init__(self, stream_factory=None, charset='utf-8',
                  errors='replace', max_form_memory_size=None,
                  max_content_length=None, cls=None,
-                 silent=True):
+                 silent=True, multipart_parser_class=None,
+                 file_handler=None, max_file_size=None,
+                 max_value_memory_size=None):
         if stream_factory is None:
             stream_factory = default_stream_factory
         self.stream_factory = stream_factory
@@ -145,6 +352,12 @@ class FormDataParser(object):
             cls = MultiDict
         self.cls = cls
         self.silent = silent
+        if multipart_parser_class is None:
+            multipart_parser_class = MultiPartParser
+        self.multipart_parser_class = multipart_parser_class
+        self.file_handler = file_handler
+        self.max_file_size = max_file_size
+        self.max_value_memory_size = max_value_memory_size
 
     def get_parse_func(self, mimetype, options):
         return self.parse_functions.get(mimetype)
@@ -157,6 +370,9 @@ class FormDataParser(object):
         """
         content_type = environ.get('CONTENT_TYPE', '')
         mimetype, options = parse_options_header(content_type)
+        stream = wrap_chunked_input(environ, self.max_content_length)
+        if stream is not None:
+            return self.parse(stream, mimetype, None, options)
         try:
             content_length = int(environ['CONTENT_LENGTH'])
         except (KeyError, ValueError):
@@ -170,17 +386,24 @@ class FormDataParser(object):
 
         :param stream: an input stream
         :param mimetype: the mimetype of the data
-        :param content_length: the content length of the incoming data
+        :param content_length: the content length of the incoming data or
+                               `None` if `stream` is a
+                               :class:`~werkzeug.wsgi.ChunkedInputStream`
+                               that enforces the maximum length itself.
         :param options: optional mimetype parameters (used for
                         the multipart boundary for instance)
         :return: A tuple in the form ``(stream, form, files)``.
         """
         if self.max_content_length is not None and \
+           content_length is not None and \
            content_length > self.max_content_length:
             raise RequestEntityTooLarge()
         if options is None:
             options = {}
-        input_stream = LimitedStream(stream, content_length)
+        if content_length is None:
+            input_stream = stream
+        else:
+            input_stream = LimitedStream(stream, content_length)
 
         parse_func = self.get_parse_func(mimetype, options)
         if parse_func is not None:
@@ -194,21 +417,113 @@ class FormDataParser(object):
 
     @exhaust_stream
     def _parse_multipart(self, stream, mimetype, content_length, options):
-        parser = MultiPartParser(self.stream_factory, self.charset, self.errors,
-                                 max_form_memory_size=self.max_form_memory_size,
-                                 cls=self.cls)
+        parser = self.multipart_parser_class(
+            self.stream_factory, self.charset, self.errors,
+            max_form_memory_size=self.max_form_memory_size, cls=self.cls,
+            file_handler=self.file_handler, max_file_size=self.max_file_size)
         form, files = parser.parse(stream, options.get('boundary'),
                                    content_length)
         return _empty_stream, form, files
 
     @exhaust_stream
     def _parse_urlencoded(self, stream, mimetype, content_length, options):
-        if self.max_form_memory_size is not None and \
-           content_length > self.max_form_memory_size:
-            raise RequestEntityTooLarge()
-        form = url_decode_stream(stream, self.charset,
-                                 errors=self.errors, cls=self.cls)
-        return _empty_stream, form, self.cls()
+        if self.max_value_memory_size is not None:
+            return self._spool_urlencoded(stream, content_length)
+        # the data of chunked requests is limited and reserved while it
+        # is read because the length is not known in advance.
+        reserved = 0
+        if content_length is not None:
+            if self.max_form_memory_size is not None and \
+               content_length > self.max_form_memory_size:
+                raise RequestEntityTooLarge()
+            if not upload_memory_budget.reserve(content_length):
+                raise RequestEntityTooLarge()
+            reserved = content_length
+        try:
+            decoder = URLEncodedDecoder(self.charset, self.errors,
+                max_form_memory_size=self.max_form_memory_size)
+            read = make_chunk_iter_func(stream, content_length, 10 * 1024)
+            form = []
+            for data in iter(read, b''):
+                if content_length is None:
+                    if not upload_memory_budget.reserve(len(data)):
+                        raise RequestEntityTooLarge()
+                    reserved += len(data)
+                form.extend(value for event, value in decoder.feed(data))
+            form.extend(value for event, value in decoder.close())
+        finally:
+            upload_memory_budget.release(reserved)
+        return _empty_stream, self.cls(form), self.cls()
+
+    def _spool_urlencoded(self, stream, content_length):
+        """Parses url encoded data with the :class:`IncrementalURLDecoder`
+        and writes values bigger than `max_value_memory_size` to the
+        `stream_factory`.
+        """
+        decoder = IncrementalURLDecoder(self.charset, self.errors)
+        read = make_chunk_iter_func(stream, content_length, 10 * 1024)
+        limit = self.max_form_memory_size
+        # the bytes of the keys and the values kept in memory.  They are
+        # reserved in the memory budget until the form is parsed.
+        state = {'size': 0}
+
+        def iter_events():
+            for data in iter(read, b''):
+                for event in decoder.feed(data):
+                    yield event
+                if limit is not None and \
+                   state['size'] + decoder.buffered_size > limit:
+                    raise RequestEntityTooLarge()
+            for event in decoder.close():
+                yield event
+
+        def keep(size):
+            if limit is not None and state['size'] + size > limit or \
+               not upload_memory_budget.reserve(size):
+                raise RequestEntityTooLarge()
+            state['size'] += size
+
+        form = []
+        files = []
+        try:
+            for event, value in iter_events():
+                if event == 'key':
+                    key = value
+                    keep(len(key))
+                    parts = []
+                    value_size = 0
+                    container = None
+                elif event == 'value':
+                    value_size += len(value)
+                    if container is None and \
+                       value_size > self.max_value_memory_size:
+                        container = self.stream_factory(
+                            content_length, None, None, None)
+                        for part in parts:
+                            container.write(part)
+                        in_memory = value_size - len(value)
+                        upload_memory_budget.release(in_memory)
+                        state['size'] -= in_memory
+                        parts = None
+                    if container is None:
+                        keep(len(value))
+                        parts.append(value)
+                        continue
+                    if self.max_file_size is not None and \
+                       value_size > self.max_file_size:
+                        raise RequestEntityTooLarge()
+                    container.write(value)
+                elif container is None:
+                    form.append((key, _decode_unicode(b''.join(parts),
+                                                      self.charset,
+                                                      self.errors)))
+                else:
+                    container.seek(0)
+                    files.append((key, FileStorage(container, None, key,
+                                                   content_length=value_size)))
+        finally:
+            upload_memory_budget.release(state['size'])
+        return _empty_stream, self.cls(form), self.cls(files)
 
     #: mapping of mimetypes to parsing functions
     parse_functions = {
@@ -265,13 +580,258 @@ def parse_multipart_headers(iterable):
     return Headers.linked(result)
 
 
+class MultiPartDecoder(object):
+    """Parses multipart data incrementally.  Instead of reading from a
+    stream the data is pushed to the decoder with :meth:`feed` as it
+    arrives, so it can be used from servers that are not allowed to block.
+    The decoder keeps only the data that could start a boundary in memory.
+
+    :meth:`feed` and :meth:`close` return lists of events that are tuples
+    in the form ``(event, value)``:
+
+    ``('part_start', headers)``
+        a new part starts.  The value is a :class:`Headers` object.
+    ``('part_data', data)``
+        a chunk of the part's data as bytestring.  Transfer encodings are
+        not decoded.
+    ``('part_end', None)``
+        the current part is complete.
+
+    After the closing boundary :attr:`complete` is `True`, the data that
+    follows it is ignored.  Malformed data raises a :exc:`ValueError`.
+
+    .. versionadded:: 0.9
+
+    :param boundary: the boundary of the multipart data.
+    """
+
+    def __init__(self, boundary):
+        if not boundary:
+            raise ValueError('Missing boundary')
+        self.delimiter = ('--' + boundary).encode('ascii')
+        self.buffer = b''
+        self.pos = 0
+        self.state = 'preamble'
+        #: `True` after the closing boundary was found.
+        self.complete = False
+        self._header_lines = []
+        self._at_part_start = False
+
+    def feed(self, data):
+        """Parses the next chunk of data and returns the events."""
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return self._process(False)
+
+    def close(self):
+        """Signals the end of the data and returns the remaining events.
+        Raises a :exc:`ValueError` if the closing boundary is missing.
+        """
+        rv = self._process(True)
+        if not self.complete:
+            raise ValueError('unexpected end of stream')
+        return rv
+
+    def _read_line(self, eof):
+        """Returns the next line including its line ending or `None` if
+        more data is needed.  At the end of the data the rest is returned.
+        """
+        match = _line_end_re.search(self.buffer, self.pos)
+        if match is None:
+            if not eof:
+                return None
+            end = len(self.buffer)
+        # a carriage return at the end of the buffer could be the first
+        # half of a CRLF.
+        elif match.end() == len(self.buffer) and match.group() == b'\r' \
+             and not eof:
+            return None
+        else:
+            end = match.end()
+        rv = self.buffer[self.pos:end]
+        self.pos = end
+        return rv
+
+    def _check_boundary(self, idx, eof):
+        """Checks if the delimiter found at `idx` starts a boundary line.
+        Returns `None` if more data is needed to tell, `False` if it's part
+        of the data and otherwise a tuple in the form ``(data_end, line_end,
+        last)``.
+        """
+        buffer = self.buffer
+        if self._at_part_start and idx == self.pos:
+            data_end = idx
+        elif buffer[idx - 1:idx] == b'\n':
+            data_end = idx - 1
+            if idx - 2 >= self.pos and buffer[idx - 2:idx - 1] == b'\r':
+                data_end -= 1
+        elif buffer[idx - 1:idx] == b'\r':
+            data_end = idx - 1
+        else:
+            return False
+
+        end = idx + len(self.delimiter)
+        if len(buffer) - end < 2 and not eof:
+            return None
+        last = buffer[end:end + 2] == b'--'
+        if last:
+            end += 2
+        while end < len(buffer) and buffer[end:end + 1] in b' \t':
+            end += 1
+        if end == len(buffer):
+            if not eof:
+                return None
+        elif buffer[end:end + 1] == b'\r':
+            if end + 1 == len(buffer) and not eof:
+                return None
+            end += 1
+            if buffer[end:end + 1] == b'\n':
+                end += 1
+        elif buffer[end:end + 1] == b'\n':
+            end += 1
+        else:
+            return False
+        return data_end, end, last
+
+    def _process(self, eof):
+        events = []
+        while 1:
+            if self.state == 'preamble':
+                # there might be some additional newlines before the first
+                # boundary.  There is at least one application that sends
+                # them (the python setuptools package).
+                line = self._read_line(eof)
+                if line is None:
+                    break
+                terminator = line.strip()
+                if not terminator:
+                    if line:
+                        continue
+                elif terminator == self.delimiter:
+                    self.state = 'headers'
+                    continue
+                raise ValueError('Expected boundary at start of multipart '
+                                 'data')
+
+            elif self.state == 'headers':
+                line = self._read_line(eof)
+                if line is None:
+                    break
+                self._header_lines.append(line)
+                line, line_terminated = _line_parse(line)
+                if line and line_terminated:
+                    continue
+                # either the empty line that ends the headers or the end
+                # of the data in which case the parsing fails.
+                headers = parse_multipart_headers(self._header_lines)
+                self._header_lines = []
+                self._at_part_start = True
+                self.state = 'data'
+                events.append(('part_start', headers))
+
+            elif self.state == 'data':
+                buffer = self.buffer
+                idx = buffer.find(self.delimiter, self.pos)
+                while idx != -1:
+                    rv = self._check_boundary(idx, eof)
+                    if rv is None:
+                        break
+                    elif rv:
+                        data_end, line_end, last = rv
+                        if data_end > self.pos:
+                            events.append(('part_data',
+                                           buffer[self.pos:data_end]))
+                        events.append(('part_end', None))
+                        self.pos = line_end
+                        if last:
+                            self.complete = True
+                            self.state = 'epilogue'
+                        else:
+                            self.state = 'headers'
+                        break
+                    idx = buffer.find(self.delimiter, idx + 1)
+                if self.state != 'data':
+                    continue
+
+                # the line ending in front of the delimiter and all but one
+                # byte of the delimiter could be at the end of the buffer.
+                if idx == -1:
+                    safe_end = len(buffer) - len(self.delimiter) - 1
+                else:
+                    safe_end = idx - 2
+                if safe_end > self.pos:
+                    events.append(('part_data', buffer[self.pos:safe_end]))
+                    self.pos = safe_end
+                    self._at_part_start = False
+                break
+
+            else:
+                self.pos = len(self.buffer)
+                break
+        return events
+
+
+class URLEncodedDecoder(object):
+    """Parses url encoded form data incrementally like the
+    :class:`MultiPartDecoder`.  The events are tuples in the form
+    ``('field', (key, value))`` for every complete pair.
+
+    .. versionadded:: 0.9
+
+    :param charset: the charset of the values.
+    :param errors: the decoding error behavior.
+    :param separator: the pair separator to be used, defaults to ``&``
+    :param max_form_memory_size: the maximum number of bytes to be accepted.
+                                 If more data is fed a
+                                 :exc:`~exceptions.RequestEntityTooLarge`
+                                 exception is raised.
+    """
+
+    def __init__(self, charset='utf-8', errors='replace', separator=b'&',
+                 max_form_memory_size=None):
+        self.charset = charset
+        self.errors = errors
+        self.separator = separator
+        self.max_form_memory_size = max_form_memory_size
+        self.size = 0
+        self._pending = []
+
+    def feed(self, data):
+        """Parses the next chunk of data and returns the events."""
+        self.size += len(data)
+        if self.max_form_memory_size is not None and \
+           self.size > self.max_form_memory_size:
+            raise RequestEntityTooLarge()
+        self._pending.append(data)
+        if self.separator not in data:
+            return []
+        data = b''.join(self._pending)
+        pos = data.rindex(self.separator)
+        self._pending = [data[pos + len(self.separator):]]
+        return self._make_events(data[:pos])
+
+    def close(self):
+        """Signals the end of the data and returns the remaining events."""
+        data = b''.join(self._pending)
+        self._pending = []
+        return self._make_events(data)
+
+    def _make_events(self, data):
+        return [('field', item) for item in _url_decode_string(
+            data.decode('ascii'), self.separator.decode('ascii'),
+            self.charset, False, True, self.errors)]
+
+
 class MultiPartParser(object):
     def __init__(self, stream_factory=None, charset='utf-8', errors='replace',
-                 max_form_memory_size=None, cls=None, buffer_size=10 * 1024):
+                 max_form_memory_size=None, cls=None, buffer_size=64 * 1024,
+                 file_handler=None, max_file_size=None):
         self.stream_factory = stream_factory
         self.charset = charset
         self.errors = errors
         self.max_form_memory_size = max_form_memory_size
+        self.file_handler = file_handler
+        self.max_file_size = max_file_size
         if stream_factory is None:
             stream_factory = default_stream_factory
         if cls is None:
@@ -337,6 +897,17 @@ class MultiPartParser(object):
                                         filename, content_length)
         return filename, container
 
+    def start_file_handling(self, name, filename, headers):
+        """Asks the file handler for a sink for the file part.  Returns
+        `None` if there is no file handler or it does not want to handle
+        the part.
+
+        .. versionadded:: 0.9
+        """
+        if self.file_handler is not None:
+            return self.file_handler(name, self._fix_ie_filename(filename),
+                                     headers)
+
     def in_memory_threshold_reached(self, bytes):
         raise RequestEntityTooLarge()
 
@@ -353,114 +924,166 @@ class MultiPartParser(object):
             self.fail('Boundary longer than buffer size')
 
     def parse(self, file, boundary, content_length):
-        next_part = ('--' + boundary).encode('ascii')
-        last_part = next_part + b'--'
+        try:
+            decoder = MultiPartDecoder(boundary)
+        except ValueError as e:
+            self.fail(str(e))
+        read = make_chunk_iter_func(file, content_length, self.buffer_size,
+                                    True)
 
         form = []
         files = []
         in_memory = 0
+        reserved = 0
+        sink = None
 
-        iterator = chain(make_line_iter(file, limit=content_length,
-                                        buffer_size=self.buffer_size),
-                         _empty_string_iter)
-
-        terminator = self._find_terminator(iterator)
-        if terminator != next_part:
-            self.fail('Expected boundary at start of multipart data')
-
-        while terminator != last_part:
-            headers = parse_multipart_headers(iterator)
-
-            disposition = headers.get('content-disposition')
-            if disposition is None:
-                self.fail('Missing Content-Disposition header')
-            disposition, extra = parse_options_header(disposition)
-            transfer_encoding = self.get_part_encoding(headers)
-            name = extra.get('name')
-            filename = extra.get('filename')
-            part_charset = self.get_part_charset(headers)
-
-            # if no content type is given we stream into memory.  A list is
-            # used as a temporary container.
-            if filename is None:
-                is_file = False
-                container = []
-                _write = container.append
-                guard_memory = self.max_form_memory_size is not None
-
-            # otherwise we parse the rest of the headers and ask the stream
-            # factory for something we can write in.
-            else:
-                is_file = True
-                guard_memory = False
-                filename, container = self.start_file_streaming(
-                    filename, headers, content_length)
-                _write = container.write
-
-            buf = b''
-            for line in iterator:
-                if not line:
-                    self.fail('unexpected end of stream')
-
-                if line[:2] == b'--':
-                    terminator = line.rstrip()
-                    if terminator in (next_part, last_part):
-                        break
-
-                if transfer_encoding is not None:
-                    try:
-                        if transfer_encoding == 'base64':
-                            line = base64.b64decode(line)
+        try:
+            while not decoder.complete:
+                data = read()
+                try:
+                    if data:
+                        events = decoder.feed(data)
+                    else:
+                        events = decoder.close()
+                except ValueError as e:
+                    self.fail(str(e))
+
+                for event, value in events:
+                    if event == 'part_start':
+                        headers = value
+                        disposition = headers.get('content-disposition')
+                        if disposition is None:
+                            self.fail('Missing Content-Disposition header')
+                        disposition, extra = parse_options_header(disposition)
+                        transfer_encoding = self.get_part_encoding(headers)
+                        name = extra.get('name')
+                        filename = extra.get('filename')
+                        part_charset = self.get_part_charset(headers)
+                        file_size = 0
+
+                        # if no content type is given we stream into memory.
+                        # A list is used as a temporary container.
+                        if filename is None:
+                            is_file = False
+                            container = []
+                            _write = container.append
+                            guard_memory = \
+                                self.max_form_memory_size is not None
+
+                        # otherwise we ask the file handler for a sink to
+                        # push the data to or the stream factory for
+                        # something we can write in.
                         else:
-                            line = line.decode(transfer_encoding)
-                    except Exception:
-                        self.fail('could not decode transfer encoded chunk')
-
-                # we have something in the buffer from the last iteration.
-                # this is usually a newline delimiter.
-                if buf:
-                    _write(buf)
-                    buf = b''
-
-                # If the line ends with windows CRLF we write everything except
-                # the last two bytes.  In all other cases however we write
-                # everything except the last byte.  If it was a newline, that's
-                # fine, otherwise it does not matter because we will write it
-                # the next iteration.  this ensures we do not write the
-                # final newline into the stream.  That way we do not have to
-                # truncate the stream.  However we do have to make sure that
-                # if something else than a newline is in there we write it
-                # out.
-                if line[-2:] == b'\r\n':
-                    buf = b'\r\n'
-                    cutoff = -2
-                else:
-                    buf = line[-1:]
-                    cutoff = -1
-                _write(line[:cutoff])
-
-                # if we write into memory and there is a memory size limit we
-                # count the number of bytes in memory and raise an exception if
-                # there is too much data in memory.
-                if guard_memory:
-                    in_memory += len(line)
-                    if in_memory > self.max_form_memory_size:
-                        self.in_memory_threshold_reached(in_memory)
-            else: # pragma: no cover
-                raise ValueError('unexpected end of part')
-
-            # if we have a leftover in the buffer that is not a newline
-            # character we have to flush it, otherwise we will chop of
-            # certain values.
-            if buf not in (b'', b'\r', b'\n', b'\r\n'):
-                _write(buf)
-
-            if is_file:
-                container.seek(0)
-                files.append((name, FileStorage(container, filename, name,
-                                                headers=headers)))
-            else:
-                form.append((name, _decode_unicode(b''.join(container),
-                                                   part_charset, self.errors)))
+                            is_file = True
+                            guard_memory = False
+                            sink = self.start_file_handling(name, filename,
+                                                            headers)
+                            if sink is not None:
+                                filename = self._fix_ie_filename(filename)
+                                _write = getattr(sink, 'write', sink)
+                            else:
+                                filename, container = \
+                                    self.start_file_streaming(
+                                        filename, headers, content_length)
+                                _write = container.write
+
+                        transfer_decoder = None
+                        if transfer_encoding is not None:
+                            transfer_decoder = _TransferDecoder(
+                                transfer_encoding)
+
+                    elif event == 'part_data':
+                        # if we write into memory and there is a memory size
+                        # limit we count the number of bytes in memory and
+                        # raise an exception if there is too much data in
+                        # memory.
+                        if guard_memory:
+                            in_memory += len(value)
+                            if in_memory > self.max_form_memory_size:
+                                self.in_memory_threshold_reached(in_memory)
+                        # the fields are accounted for in the memory budget
+                        # of the process until the parsing is done.
+                        if not is_file:
+                            if not upload_memory_budget.reserve(len(value)):
+                                self.in_memory_threshold_reached(in_memory)
+                            reserved += len(value)
+                        if transfer_decoder is not None:
+                            try:
+                                value = transfer_decoder.decode(value)
+                            except binascii.Error:
+                                self.fail('could not decode transfer '
+                                          'encoded chunk')
+                        if is_file and self.max_file_size is not None:
+                            file_size += len(value)
+                            if file_size > self.max_file_size:
+                                raise RequestEntityTooLarge()
+                        _write(value)
+
+                    else:
+                        if transfer_decoder is not None:
+                            try:
+                                _write(transfer_decoder.flush())
+                            except binascii.Error:
+                                self.fail('could not decode transfer '
+                                          'encoded chunk')
+                        if sink is not None:
+                            close = getattr(sink, 'close', None)
+                            if close is not None:
+                                close()
+                            stream = None
+                            if hasattr(sink, 'write'):
+                                stream = sink
+                            sink = None
+                            files.append((name, FileStorage(stream, filename,
+                                name, headers=headers)))
+                        elif is_file:
+                            container.seek(0)
+                            files.append((name, FileStorage(container,
+                                filename, name, headers=headers)))
+                        else:
+                            form.append((name, _decode_unicode(
+                                b''.join(container), part_charset,
+                                self.errors)))
+        except:
+            # the sink of a part that was not received completely is aborted
+            # so that it can clean up, for example if the client went away.
+            if sink is not None:
+                abort = getattr(sink, 'abort', None) or \
+                        getattr(sink, 'close', None)
+                if abort is not None:
+                    abort()
+            raise
+        finally:
+            upload_memory_budget.release(reserved)
 
         return self.cls(form), self.cls(files)
+
+
+class _TransferDecoder(object):
+    """Decodes the chunks of a base64 or quoted-printable encoded part.
+    Bytes that cannot be decoded without the next chunk are held back.
+    """
+
+    def __init__(self, transfer_encoding):
+        self.transfer_encoding = transfer_encoding
+        self.pending = b''
+
+    def decode(self, data):
+        data = self.pending + data
+        if self.transfer_encoding == 'base64':
+            data = _base64_garbage_re.sub(b'', data)
+            cutoff = len(data) - len(data) % 4
+        else:
+            cutoff = data.rfind(b'\n') + 1
+        self.pending = data[cutoff:]
+        return self._decode(data[:cutoff])
+
+    def flush(self):
+        data = self.pending
+        self.pending = b''
+        return self._decode(data)
+
+    def _decode(self, data):
+        if self.transfer_encoding == 'base64':
+            return binascii.a2b_base64(data)
+        return binascii.a2b_qp(data)
@@ -97,9 +97,20 @@
 """
 import re
 import posixpath
+from bisect import bisect_right
+from hashlib import sha1
+from itertools import chain
+from pickle import dump, load, HIGHEST_PROTOCOL
 from pprint import pformat
+from threading import Lock
+from collections import OrderedDict
 from urllib.parse import urljoin
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
 
+from werkzeug import __version__
 from werkzeug.urls import url_encode, url_quote
 from werkzeug.utils import redirect, format_string
 from werkzeug.exceptions import HTTPException, NotFound, MethodNotAllowed
@@ -119,6 +130,7 @@ _rule_re = re.compile(r'''
     >
 ''', re.VERBOSE)
 _simple_rule_re = re.compile(r'<([^>]+)>')
+_simple_url_re = re.compile(r"[a-zA-Z0-9/?%&=+:@!$'()*,._~-]*\Z")
 _converter_args_re = re.compile(r'''
     ((?P<name>\w+)\s*=\s*)?
     (?P<value>
@@ -219,6 +231,24 @@ def get_converter(map, name, args):
     return map.converters[name](map, *args, **kwargs)
 
 
+def _sort_by_keys(items, keys):
+    """Sorts a list and the parallel list of its sort keys in place.  The
+    sort is stable like :meth:`list.sort`.
+    """
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    items[:] = [items[x] for x in order]
+    keys[:] = [keys[x] for x in order]
+
+
+def _insort(items, keys, item, key):
+    """Inserts an item into a list sorted by the parallel list of keys after
+    all items with an equal key.
+    """
+    idx = bisect_right(keys, key)
+    items.insert(idx, item)
+    keys.insert(idx, key)
+
+
 class RoutingException(Exception):
     """Special exceptions that require the application to redirect, notifying
     about missing urls, etc.
@@ -572,6 +602,7 @@ class Rule(RuleFactory):
         else:
             self.arguments = set()
         self._trace = self._converters = self._regex = self._weights = None
+        self._build_plan = self._converter_specs = self._regex_source = None
 
     def empty(self):
         """Return an unbound copy of this rule.  This can be useful if you
@@ -614,13 +645,14 @@ class Rule(RuleFactory):
         """Compiles the regular expression and stores it."""
         assert self.map is not None, 'rule not bound'
 
-        if self.map.host_matching:
-            domain_rule = self.host or ''
-        else:
-            domain_rule = self.subdomain or ''
+        state = self.map.get_compiled_state(self)
+        if state is not None:
+            self._load_compiled_state(state)
+            return
 
         self._trace = []
         self._converters = {}
+        self._converter_specs = []
         self._weights = []
         regex_parts = []
 
@@ -636,25 +668,90 @@ class Rule(RuleFactory):
                     convobj = get_converter(self.map, converter, arguments)
                     regex_parts.append('(?P<%s>%s)' % (variable, convobj.regex))
                     self._converters[variable] = convobj
+                    self._converter_specs.append((variable, converter,
+                                                  arguments))
                     self._trace.append((True, variable))
                     self._weights.append((1, convobj.weight))
                     self.arguments.add(str(variable))
 
-        _build_regex(domain_rule)
+        _build_regex(self._get_domain_rule())
         regex_parts.append('\\|')
         self._trace.append((False, '|'))
         _build_regex(self.is_leaf and self.rule or self.rule.rstrip('/'))
         if not self.is_leaf:
             self._trace.append((False, '/'))
+        self._compile_builder()
 
         if self.build_only:
             return
-        regex = r'^%s%s$' % (
+        self._regex_source = r'^%s%s$' % (
             ''.join(regex_parts),
             (not self.is_leaf or not self.strict_slashes) and \
                 '(?<!/)(?P<__suffix__>/?)' or ''
         )
-        self._regex = re.compile(regex, re.UNICODE)
+        self._compile_regex()
+
+    def _get_domain_rule(self):
+        """The rule for the domain part, the host if the map does host
+        matching, the subdomain otherwise.
+
+        :internal:
+        """
+        if self.map.host_matching:
+            return self.host or ''
+        return self.subdomain or ''
+
+    def _compile_regex(self):
+        """Compiles the regular expression from its source.  For rules loaded
+        from precompiled state this happens on the first match.
+
+        :internal:
+        """
+        self._regex = re.compile(self._regex_source, re.UNICODE)
+        return self._regex
+
+    def get_compile_key(self):
+        """Returns a hash of everything besides the map configuration the
+        compiled state of this rule depends on.
+
+        :internal:
+        """
+        definition = (self.rule, self._get_domain_rule(),
+                      self.strict_slashes, self.build_only)
+        return sha1(repr(definition).encode('utf-8')).hexdigest()
+
+    def get_compiled_state(self):
+        """Returns the compiled state of the rule as tuple of builtin types
+        that can be passed to :meth:`_load_compiled_state` of a rule with
+        the same compile key.
+
+        :internal:
+        """
+        plan = [(data, to_url is not None) for data, to_url
+                in self._build_plan]
+        return self._trace, self._weights, self._converter_specs, \
+               self._regex_source, plan
+
+    def _load_compiled_state(self, state):
+        """Restores the state returned by :meth:`get_compiled_state`.  Only
+        the converters are created again, the regular expression is compiled
+        when the rule is matched the first time.
+
+        :internal:
+        """
+        trace, weights, specs, self._regex_source, plan = state
+        self._trace = list(trace)
+        self._weights = list(weights)
+        self._converter_specs = list(specs)
+        self._converters = {}
+        for variable, converter, arguments in specs:
+            self._converters[variable] = get_converter(self.map, converter,
+                                                       arguments)
+            self.arguments.add(str(variable))
+        self._regex = None
+        self._build_plan = [(data, is_dynamic and
+                             self._converters[data].to_url or None)
+                            for data, is_dynamic in plan]
 
     def match(self, path):
         """Check if the rule matches a given path. Path is a string in the
@@ -668,7 +765,7 @@ class Rule(RuleFactory):
         :internal:
         """
         if not self.build_only:
-            m = self._regex.search(path)
+            m = (self._regex or self._compile_regex()).search(path)
             if m is not None:
                 groups = m.groupdict()
                 # we have a folder like part of the url without a trailing
@@ -698,6 +795,78 @@ class Rule(RuleFactory):
 
                 return result
 
+    def get_match_methods(self):
+        """Returns the methods of the requests this rule has to be tested
+        for or `None` if it has to be tested for all requests.  Rules that
+        redirect because of a missing trailing slash or because they are
+        aliases do that before their methods are checked.
+
+        :internal:
+        """
+        if self.alias or (not self.is_leaf and self.strict_slashes):
+            return None
+        return self.methods
+
+    def is_cacheable(self):
+        """Checks if matching and building this rule always gives the same
+        results for the same input so that they can be cached.
+
+        :internal:
+        """
+        if self.redirect_to is not None and \
+           not isinstance(self.redirect_to, str):
+            return False
+        for converter in self._converters.values():
+            if not converter.cacheable:
+                return False
+        return True
+
+    def get_static_paths(self):
+        """For rules without arguments this returns the strings in the form
+        ``"subdomain|/path"`` that :meth:`match` accepts as a dict.  The
+        values are `True` for the paths that are missing the trailing slash
+        and trigger a redirect in strict slashes mode.
+
+        :internal:
+        """
+        trace = self._trace
+        if not self.is_leaf:
+            trace = trace[:-1]
+        path = ''.join([data for is_dynamic, data in trace])
+        if self.is_leaf:
+            rv = {path: False}
+            if not self.strict_slashes:
+                rv[path + '/'] = False
+        else:
+            rv = {path: self.strict_slashes, path + '/': False}
+        # like the regular expression, also accept a trailing newline
+        for path, redirect in list(rv.items()):
+            rv[path + '\n'] = redirect
+        return rv
+
+    def _compile_builder(self):
+        """Compiles the trace into a list of ``(data, to_url)`` tuples that
+        :meth:`build` can join.  Adjacent static parts are merged and quoted
+        right away, for dynamic parts `to_url` is the bound method of the
+        converter.
+
+        :internal:
+        """
+        self._build_plan = plan = []
+        static = []
+        for is_dynamic, data in self._trace:
+            if not is_dynamic:
+                static.append(data)
+                continue
+            if static:
+                plan.append((url_quote(''.join(static), self.map.charset,
+                                       safe='/:|+'), None))
+                del static[:]
+            plan.append((data, self._converters[data].to_url))
+        if static:
+            plan.append((url_quote(''.join(static), self.map.charset,
+                                   safe='/:|+'), None))
+
     def build(self, values, append_unknown=True):
         """Assembles the relative url for that rule and the subdomain.
         If building doesn't work for some reasons `None` is returned.
@@ -706,21 +875,19 @@ class Rule(RuleFactory):
         """
         tmp = []
         add = tmp.append
-        processed = set(self.arguments)
-        for is_dynamic, data in self._trace:
-            if is_dynamic:
-                try:
-                    add(self._converters[data].to_url(values[data]))
-                except ValidationError:
-                    return
-                processed.add(data)
-            else:
-                add(url_quote(data, self.map.charset, safe='/:|+'))
+        for data, to_url in self._build_plan:
+            if to_url is None:
+                add(data)
+                continue
+            try:
+                add(to_url(values[data]))
+            except ValidationError:
+                return
         domain_part, url = (''.join(tmp)).split('|', 1)
 
         if append_unknown:
             query_vars = MultiDict(values)
-            for key in processed:
+            for key in self.arguments:
                 if key in query_vars:
                     del query_vars[key]
 
@@ -825,11 +992,101 @@ class Rule(RuleFactory):
         )
 
 
+#: the categories of regular expressions that contain the slash.
+_slash_categories = frozenset(['CATEGORY_NOT_DIGIT', 'CATEGORY_NOT_SPACE',
+                               'CATEGORY_NOT_WORD', 'CATEGORY_UNI_NOT_DIGIT',
+                               'CATEGORY_UNI_NOT_SPACE',
+                               'CATEGORY_UNI_NOT_WORD'])
+_slash = ord('/')
+_part_isolating_regexes = {}
+
+
+def _set_matches_slash(items):
+    """Checks if a parsed character set contains the slash."""
+    negate = False
+    rv = False
+    for op, av in items:
+        op = str(op).upper()
+        if op == 'NEGATE':
+            negate = True
+        elif op == 'LITERAL':
+            rv = rv or av == _slash
+        elif op == 'RANGE':
+            rv = rv or av[0] <= _slash <= av[1]
+        elif op == 'CATEGORY':
+            rv = rv or str(av).upper() in _slash_categories
+        else:
+            rv = True
+    return rv != negate
+
+
+def _pattern_matches_slash(pattern):
+    """Checks if a parsed regular expression can match a slash.  Unknown
+    constructs are assumed to match one.
+    """
+    for op, av in pattern:
+        op = str(op).upper()
+        if op == 'LITERAL':
+            matches = av == _slash
+        elif op == 'NOT_LITERAL':
+            matches = av != _slash
+        elif op == 'IN':
+            matches = _set_matches_slash(av)
+        elif op in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            # they don't consume characters
+            matches = False
+        elif op == 'SUBPATTERN':
+            matches = _pattern_matches_slash(av[-1])
+        elif op in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            matches = _pattern_matches_slash(av[2])
+        elif op == 'BRANCH':
+            matches = any(_pattern_matches_slash(x) for x in av[1])
+        elif op == 'ATOMIC_GROUP':
+            matches = _pattern_matches_slash(av)
+        else:
+            matches = True
+        if matches:
+            return True
+    return False
+
+
+def _is_part_isolating(converter):
+    """Returns the `part_isolating` attribute of a converter or if it is
+    `None` whether its regular expression cannot match slashes.
+    """
+    if converter.part_isolating is not None:
+        return converter.part_isolating
+    regex = converter.regex
+    rv = _part_isolating_regexes.get(regex)
+    if rv is None:
+        try:
+            rv = not _pattern_matches_slash(sre_parse.parse(regex))
+        except Exception:
+            rv = False
+        _part_isolating_regexes[regex] = rv
+    return rv
+
+
 class BaseConverter(object):
     """Base class for all converters."""
     regex = '[^/]+'
     weight = 100
 
+    #: `False` if the regular expression of the converter can match
+    #: slashes.  The trie matcher of the :class:`Map` uses this to decide
+    #: if a converter is confined to a single path segment.  If it's `None`
+    #: this is worked out from the :attr:`regex`.
+    #:
+    #: .. versionadded:: 0.9
+    part_isolating = None
+
+    #: set this to `False` if :meth:`to_python` or :meth:`to_url` depend on
+    #: anything but the value passed, for example the database.  The match
+    #: and build caches of the :class:`Map` skip rules with such converters.
+    #:
+    #: .. versionadded:: 0.9
+    cacheable = True
+
     def __init__(self, map):
         self.map = map
 
@@ -888,6 +1145,7 @@ class AnyConverter(BaseConverter):
     def __init__(self, map, *items):
         BaseConverter.__init__(self, map)
         self.regex = '(?:%s)' % '|'.join([re.escape(x) for x in items])
+        self.part_isolating = not [x for x in items if '/' in x]
 
 
 class PathConverter(BaseConverter):
@@ -901,6 +1159,7 @@ class PathConverter(BaseConverter):
     """
     regex = '[^/].*?'
     weight = 200
+    part_isolating = False
 
 
 class NumberConverter(BaseConverter):
@@ -980,6 +1239,201 @@ DEFAULT_CONVERTERS = {
 }
 
 
+class _LRUCache(object):
+    """A thread safe mapping that holds up to `maxsize` items.  If it grows
+    larger the least recently used items are dropped.
+
+    :internal:
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                rv = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return rv
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def get_info(self):
+        return {
+            'hits':     self.hits,
+            'misses':   self.misses,
+            'size':     len(self._items),
+            'maxsize':  self.maxsize
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+
+#: the value types that can be part of a build cache key.  Instances of other
+#: types could change their URL representation without changing their hash.
+_build_cache_types = frozenset([str, int, float, bool])
+
+
+class _TrieNode(object):
+    """A single state of the :class:`RuleTrie`.
+
+    :internal:
+    """
+    __slots__ = ('static', 'dynamic', 'rules', 'tails')
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = None
+        self.rules = []
+        self.tails = []
+
+
+#: marker for a rule part with a converter that can match slashes
+_tail_marker = object()
+
+
+class RuleTrie(object):
+    """Indexes the rules of a map by their domain part and their path
+    segments.  Static segments are looked up in a dict, segments with
+    converters go through a wildcard state and rules with converters that
+    can match slashes accept all the remaining segments.  This way only the
+    rules that can possibly match a path have to test their regular
+    expressions and the time spent is proportional to the depth of the path
+    instead of the number of rules.
+
+    The candidates are returned ordered by the sort keys the rules were
+    added with, so matching them one after another gives exactly the same
+    result as testing all the rules of the map.  Rules can be added at any
+    time.
+
+    .. versionadded:: 0.9
+
+    :internal:
+    """
+
+    def __init__(self):
+        self.rules = []
+        self.domains = {}
+        self.any_domain = _TrieNode()
+        self.always = []
+
+    def _get_key(self, rule, parts):
+        key = []
+        for is_dynamic, data in parts:
+            if is_dynamic:
+                if not _is_part_isolating(rule._converters[data]):
+                    return _tail_marker
+                key = None
+            elif key is not None:
+                key.append(data)
+        if key is not None:
+            return ''.join(key)
+
+    def add(self, rule, key):
+        """Adds a bound rule with a unique key that decides the position of
+        the rule among the candidates.
+        """
+        index = len(self.rules)
+        self.rules.append((key, rule))
+        trace = rule._trace
+        if not rule.is_leaf:
+            trace = trace[:-1]
+        sep = trace.index((False, '|'))
+        key = self._get_key(rule, trace[:sep])
+        if key is _tail_marker:
+            self.always.append(index)
+            return
+        elif key is None:
+            node = self.any_domain
+        else:
+            node = self.domains.setdefault(key, _TrieNode())
+
+        # the path part always starts with a slash, so the first
+        # segment is empty and skipped.
+        segments = [[]]
+        for is_dynamic, data in trace[sep + 1:]:
+            if is_dynamic:
+                segments[-1].append((True, data))
+                continue
+            bits = data.split('/')
+            segments[-1].append((False, bits[0]))
+            for bit in bits[1:]:
+                segments.append([(False, bit)])
+
+        for segment in segments[1:]:
+            key = self._get_key(rule, segment)
+            if key is _tail_marker:
+                node.tails.append(index)
+                return
+            elif key is None:
+                if node.dynamic is None:
+                    node.dynamic = _TrieNode()
+                node = node.dynamic
+            else:
+                node = node.static.setdefault(key, _TrieNode())
+        node.rules.append(index)
+
+    def find(self, domain_part, path):
+        """Returns the rules that could match the domain part and path in
+        the order they have to be tested.
+        """
+        # the rule regexes accept an optional trailing slash and ``$``
+        # also matches before a trailing newline, so look for rules with
+        # and without those.
+        paths = [path.lstrip('/')]
+        if paths[0][-1:] == '\n':
+            paths.append(paths[0][:-1])
+        for path in paths[:]:
+            if path[-1:] == '/':
+                paths.append(path[:-1])
+
+        starts = [self.any_domain]
+        node = self.domains.get(domain_part)
+        if node is not None:
+            starts.append(node)
+
+        found = set(self.always)
+        for path in paths:
+            segments = path and path.split('/') or []
+            depth = len(segments)
+            stack = [(node, 0) for node in starts]
+            while stack:
+                node, pos = stack.pop()
+                found.update(node.tails)
+                if pos == depth:
+                    found.update(node.rules)
+                    continue
+                child = node.static.get(segments[pos])
+                if child is not None:
+                    stack.append((child, pos + 1))
+                if node.dynamic is not None:
+                    stack.append((node.dynamic, pos + 1))
+
+        rules = sorted([self.rules[index] for index in found])
+        return [rule for key, rule in rules]
+
+
+#: the version of the format written by :meth:`Map.dump_compiled`
+_compiled_format = 1
+
+
 class Map(object):
     """The map class stores all the URL rules and some configuration
     parameters.  Some of the configuration values are only stored on the
@@ -1006,12 +1460,37 @@ class Map(object):
                           feature and disables the subdomain one.  If
                           enabled the `host` parameter to rules is used
                           instead of the `subdomain` one.
+    :param trie_matching: if set to `True` the rules are indexed by their
+                          path segments so that matching only has to test
+                          the rules that can possibly match instead of all
+                          of them.  The results are the same, but for maps
+                          with many rules this is a lot faster.
+    :param build_cache_size: if set to a number greater than zero, up to
+                             that many built URLs are remembered by the map
+                             and returned from :meth:`MapAdapter.build`
+                             without building them again.  Only values that
+                             are strings, numbers or booleans are cached.
+    :param match_cache_size: if set to a number greater than zero, up to
+                             that many results of :meth:`MapAdapter.match`
+                             are remembered by the map, including the
+                             redirects and errors raised.  Rules with
+                             converters that are not `cacheable` or with a
+                             callable `redirect_to` are not cached.
+    :param adapter_cache_size: the number of adapters for different hosts,
+                               script names and URL schemes that
+                               :meth:`bind_to_environ` remembers and copies
+                               instead of inspecting the environment again.
+                               Set it to zero to disable the cache.
 
     .. versionadded:: 0.5
         `sort_parameters` and `sort_key` was added.
 
     .. versionadded:: 0.7
         `encoding_errors` and `host_matching` was added.
+
+    .. versionadded:: 0.9
+        `trie_matching`, `build_cache_size`, `match_cache_size` and
+        `adapter_cache_size` were added.
     """
 
     #: .. versionadded:: 0.6
@@ -1021,9 +1500,17 @@ class Map(object):
     def __init__(self, rules=None, default_subdomain='', charset='utf-8',
                  strict_slashes=True, redirect_defaults=True,
                  converters=None, sort_parameters=False, sort_key=None,
-                 encoding_errors='replace', host_matching=False):
+                 encoding_errors='replace', host_matching=False,
+                 trie_matching=False, build_cache_size=0,
+                 match_cache_size=0, adapter_cache_size=32):
         self._rules = []
         self._rules_by_endpoint = {}
+        self._rule_keys = []
+        self._endpoint_keys = {}
+        self._rules_added = 0
+        self._precompiled = {}
+        self._unindexed_rules = []
+        self._sort_pending = False
         self._remap = True
 
         self.default_subdomain = default_subdomain
@@ -1032,6 +1519,19 @@ class Map(object):
         self.strict_slashes = strict_slashes
         self.redirect_defaults = redirect_defaults
         self.host_matching = host_matching
+        self.trie_matching = trie_matching
+        self.build_cache_size = build_cache_size
+        self.match_cache_size = match_cache_size
+        self.adapter_cache_size = adapter_cache_size
+        self._build_cache = self._match_cache = None
+        if build_cache_size:
+            self._build_cache = _LRUCache(build_cache_size)
+        if match_cache_size:
+            self._match_cache = _LRUCache(match_cache_size)
+        self._adapter_cache = None
+        if adapter_cache_size:
+            self._adapter_cache = _LRUCache(adapter_cache_size)
+        self._reset_indexes()
 
         self.converters = self.default_converters.copy()
         if converters:
@@ -1040,8 +1540,7 @@ class Map(object):
         self.sort_parameters = sort_parameters
         self.sort_key = sort_key
 
-        for rulefactory in rules or ():
-            self.add(rulefactory)
+        self.add_many(rules or ())
 
     def is_endpoint_expecting(self, endpoint, *arguments):
         """Iterate over all rules and check if the endpoint expects
@@ -1083,10 +1582,48 @@ class Map(object):
         """
         for rule in rulefactory.get_rules(self):
             rule.bind(self)
-            self._rules.append(rule)
-            self._rules_by_endpoint.setdefault(rule.endpoint, []).append(rule)
+            self._insert_rule(rule)
         self._remap = True
 
+    def add_many(self, rulefactories):
+        """Add many rules or factories at once.  Unlike :meth:`add` the
+        rules are not inserted at their sorted positions one after another
+        but appended and sorted once the map is used the next time.  This
+        is what the constructor uses and is a lot faster for large numbers
+        of rules.
+
+        .. versionadded:: 0.9
+
+        :param rulefactories: an iterable of :class:`Rule`\s or
+                              :class:`RuleFactory`\s.
+        """
+        self._sort_pending = True
+        for rulefactory in rulefactories:
+            self.add(rulefactory)
+
+    def _insert_rule(self, rule):
+        """Inserts a bound rule into the list of rules and the list of rules
+        for its endpoint.  The sort keys end with a counter so that rules
+        that compare equal stay in the order they were added, just like
+        they would if the lists were sorted again.
+
+        :internal:
+        """
+        match_key = (rule.match_compare_key(), self._rules_added)
+        build_key = (rule.build_compare_key(), self._rules_added)
+        self._rules_added += 1
+        rules = self._rules_by_endpoint.setdefault(rule.endpoint, [])
+        keys = self._endpoint_keys.setdefault(rule.endpoint, [])
+        if self._sort_pending:
+            self._rules.append(rule)
+            self._rule_keys.append(match_key)
+            rules.append(rule)
+            keys.append(build_key)
+        else:
+            _insort(self._rules, self._rule_keys, rule, match_key)
+            _insort(rules, keys, rule, build_key)
+            self._unindexed_rules.append((match_key, rule))
+
     def bind(self, server_name, script_name=None, subdomain=None,
              url_scheme='http', default_method='GET', path_info=None,
              query_args=None):
@@ -1162,6 +1699,29 @@ class Map(object):
         :param subdomain: optionally the current subdomain (see above).
         """
         environ = _get_environ(environ)
+        cache = self._adapter_cache
+        if cache is None:
+            adapter = self._bind_to_environ(environ, server_name, subdomain)
+        else:
+            key = (environ.get('HTTP_HOST'), environ.get('SERVER_NAME'),
+                   environ.get('SERVER_PORT'), environ['wsgi.url_scheme'],
+                   environ.get('SCRIPT_NAME'), server_name, subdomain)
+            adapter = cache.get(key)
+            if adapter is None:
+                adapter = self._bind_to_environ(environ, server_name,
+                                                subdomain)
+                cache.set(key, adapter)
+        return adapter.copy(environ.get('PATH_INFO'),
+                            environ['REQUEST_METHOD'],
+                            environ.get('QUERY_STRING', ''))
+
+    def _bind_to_environ(self, environ, server_name, subdomain):
+        """Binds the map to the host, script name and URL scheme of the
+        environment.  The adapter returned is used as template for the
+        adapters of all requests to the same host.
+
+        :internal:
+        """
         if server_name is None:
             if 'HTTP_HOST' in environ:
                 server_name = environ['HTTP_HOST']
@@ -1193,25 +1753,295 @@ class Map(object):
             else:
                 subdomain = '.'.join([_f for _f in cur_server_name[:offset] if _f])
         return Map.bind(self, server_name, environ.get('SCRIPT_NAME'),
-                        subdomain, environ['wsgi.url_scheme'],
-                        environ['REQUEST_METHOD'], environ.get('PATH_INFO'),
-                        query_args=environ.get('QUERY_STRING', ''))
+                        subdomain, environ['wsgi.url_scheme'])
 
     def update(self):
         """Called before matching and building to keep the compiled rules
         in the correct order after things changed.
         """
-        if self._remap:
-            self._rules.sort(key=lambda x: x.match_compare_key())
-            for rules in list(self._rules_by_endpoint.values()):
-                rules.sort(key=lambda x: x.build_compare_key())
-            self._remap = False
+        if not self._remap:
+            return
+        if self._sort_pending:
+            _sort_by_keys(self._rules, self._rule_keys)
+            for endpoint, rules in self._rules_by_endpoint.items():
+                _sort_by_keys(rules, self._endpoint_keys[endpoint])
+            self._sort_pending = False
+            self._reset_indexes()
+            self._unindexed_rules = list(zip(self._rule_keys, self._rules))
+
+        # rules added one by one were inserted at their sorted positions
+        # already, so only those have to be added to the indexes.
+        for key, rule in self._unindexed_rules:
+            self._index_rule(rule, key)
+        self._unindexed_rules = []
+        self._dynamic_rules = self._rules[self._static_count:]
+        for cache in self._build_cache, self._match_cache:
+            if cache is not None:
+                cache.clear()
+        self._remap = False
+
+    def _reset_indexes(self):
+        """Empties the lookup structures derived from the rules.
+
+        :internal:
+        """
+        self._static_index = {}
+        self._static_keys = {}
+        self._static_count = 0
+        self._dynamic_rules = []
+        self._method_rules = {}
+        self._any_method_rules = ([], [], [], [])
+        self._trie = self.trie_matching and RuleTrie() or None
+        self._uncacheable_rules = []
+        self._uncacheable_endpoints = set()
+
+    def _index_rule(self, rule, key):
+        """Adds a rule to the lookup structures.  Rules without arguments
+        are sorted first and matched with a dict lookup instead of their
+        regular expressions.
+
+        :internal:
+        """
+        if not rule.arguments:
+            self._static_count += 1
+            if not rule.build_only:
+                for path, redirect in rule.get_static_paths().items():
+                    _insort(self._static_index.setdefault(path, []),
+                            self._static_keys.setdefault(path, []),
+                            (rule, redirect), key)
+        elif rule.build_only:
+            pass
+        elif self._trie is not None:
+            self._trie.add(rule, key)
+        else:
+            self._partition_rule(rule, key)
+        if not rule.is_cacheable():
+            self._uncacheable_endpoints.add(rule.endpoint)
+            if not rule.build_only:
+                self._uncacheable_rules.append(rule)
+
+    def _partition_rule(self, rule, key):
+        """Adds a rule with arguments to the lists of rules that have to be
+        tested for a method and the lists of rules that are skipped for it.
+        Methods no rule accepts share the lists for the rules that are
+        tested for all methods.
+
+        :internal:
+        """
+        methods = rule.get_match_methods()
+        for method in methods or ():
+            if method not in self._method_rules:
+                self._method_rules[method] = tuple(map(list,
+                    self._any_method_rules))
+        for method, lists in chain([(None, self._any_method_rules)],
+                                   self._method_rules.items()):
+            if methods is None or method in methods:
+                _insort(lists[0], lists[1], rule, key)
+            else:
+                _insort(lists[2], lists[3], rule, key)
+
+    def dump_compiled(self, file):
+        """Writes the compiled state of all rules, that is what parsing the
+        rule strings, creating the converters and assembling the regular
+        expressions produced, into a file.  Other processes can pass that
+        file to :meth:`load_compiled` before they add the same rules to
+        skip most of that work.
+
+        The file is a pickle, so only load files you created yourself.
+
+        .. versionadded:: 0.9
+
+        :param file: a filename or file object opened for writing bytes.
+        """
+        self.update()
+        states = {}
+        for rule in self._rules:
+            states[rule.get_compile_key()] = rule.get_compiled_state()
+        close_file = False
+        if isinstance(file, str):
+            file = open(file, 'wb')
+            close_file = True
+        try:
+            dump((self._get_compile_config_key(), states), file,
+                 HIGHEST_PROTOCOL)
+        finally:
+            if close_file:
+                file.close()
+
+    def load_compiled(self, file):
+        """Loads the compiled state of rules written by :meth:`dump_compiled`.
+        Rules added to the map afterwards restore their state from the file
+        if their definition did not change, all others are compiled as
+        usual.  The regular expressions of restored rules are only compiled
+        once they are matched.
+
+        The whole file is ignored if it was written by another Werkzeug
+        version or for a map with different converters, charset or host
+        matching.  In that case `False` is returned, `True` otherwise.
+
+        .. versionadded:: 0.9
+
+        :param file: a filename or file object opened for reading bytes.
+        """
+        close_file = False
+        if isinstance(file, str):
+            file = open(file, 'rb')
+            close_file = True
+        try:
+            config_key, states = load(file)
+        finally:
+            if close_file:
+                file.close()
+        if config_key != self._get_compile_config_key():
+            return False
+        self._precompiled = states
+        return True
+
+    def _get_compile_config_key(self):
+        """Returns a hash of the map configuration that affects the compiled
+        state of the rules.
+
+        :internal:
+        """
+        converters = sorted([(name, cls.__module__, cls.__name__)
+                             for name, cls in self.converters.items()])
+        config = (_compiled_format, __version__, converters,
+                  self.charset, self.host_matching)
+        return sha1(repr(config).encode('utf-8')).hexdigest()
+
+    def get_compiled_state(self, rule):
+        """Returns the compiled state loaded by :meth:`load_compiled` for a
+        rule or `None` if there is none.
+
+        :internal:
+        """
+        if self._precompiled:
+            return self._precompiled.get(rule.get_compile_key())
+
+    def get_cache_info(self):
+        """Returns the statistics of the caches as dict with the keys
+        ``'match'``, ``'build'`` and ``'adapter'``.  The values are dicts
+        with the number of ``hits`` and ``misses``, the current ``size`` and
+        the ``maxsize`` of the cache or `None` if the cache is disabled.
+
+        .. versionadded:: 0.9
+        """
+        rv = {}
+        for name, cache in ('match', self._match_cache), \
+                           ('build', self._build_cache), \
+                           ('adapter', self._adapter_cache):
+            rv[name] = cache is not None and cache.get_info() or None
+        return rv
+
+    def get_static_matches(self, path):
+        """Returns a list of ``(rule, redirect)`` tuples for the rules without
+        arguments that match a path in the form ``"subdomain|/path"``.  If
+        `redirect` is `True` the path is missing the trailing slash.
+
+        :internal:
+        """
+        return self._static_index.get(path, ())
+
+    def get_match_candidates(self, domain_part, path, method=None):
+        """Returns the rules with arguments that have to be tested in order
+        to match the given domain part and path.  Unless `trie_matching` is
+        enabled these are all of them.  If a method is given, only the rules
+        that accept it or could redirect are returned.
+
+        :internal:
+        """
+        if self._trie is None:
+            if method is None:
+                return self._dynamic_rules
+            return self._method_rules.get(method, self._any_method_rules)[0]
+        rules = self._trie.find(domain_part, path)
+        if method is None:
+            return rules
+        rv = []
+        for rule in rules:
+            methods = rule.get_match_methods()
+            if methods is None or method in methods:
+                rv.append(rule)
+        return rv
+
+    def get_method_mismatches(self, domain_part, path, method):
+        """Returns the rules with arguments :meth:`get_match_candidates`
+        skips for the method.  If they match the path their methods are
+        the valid methods for the 405 error.
+
+        :internal:
+        """
+        if self._trie is None:
+            return self._method_rules.get(method, self._any_method_rules)[2]
+        rv = []
+        for rule in self._trie.find(domain_part, path):
+            methods = rule.get_match_methods()
+            if methods is not None and method not in methods:
+                rv.append(rule)
+        return rv
 
     def __repr__(self):
         rules = self.iter_rules()
         return '%s(%s)' % (self.__class__.__name__, pformat(list(rules)))
 
 
+def _make_match_error(rv):
+    """Creates the exception for a match result in the form the match cache
+    stores them in.
+    """
+    if rv[0] == 'redirect':
+        return RequestRedirect(rv[1])
+    elif rv[0] == 'method':
+        return MethodNotAllowed(valid_methods=list(rv[1]))
+    return NotFound()
+
+
+#: the state of a worker process of :meth:`MapAdapter.match_many` and
+#: :meth:`MapAdapter.build_many`.
+_pool_state = None
+
+
+def _init_pool_worker(state):
+    global _pool_state
+    _pool_state = state
+
+
+def _pool_match(path):
+    match_rule, method, query_args, rule_indexes = _pool_state
+    try:
+        rule, values = match_rule(path, method, query_args)
+    except RequestRedirect as e:
+        return ('redirect', e.new_url)
+    except MethodNotAllowed as e:
+        return ('method', e.valid_methods)
+    except NotFound:
+        return ('missing',)
+    return ('match', rule_indexes[id(rule)], values)
+
+
+def _pool_build(values):
+    build, args = _pool_state
+    try:
+        return build(args[0], values, *args[1:])
+    except BuildError as e:
+        return e
+
+
+def _map_in_pool(processes, func, items, state):
+    """Calls the function for all items in forked worker processes that
+    inherit the state.  The items and return values have to be picklable.
+    """
+    from multiprocessing import get_context
+    pool = get_context('fork').Pool(processes, _init_pool_worker, (state,))
+    try:
+        rv = pool.map(func, items, max(len(items) // (processes * 4), 1))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return rv
+
+
 class MapAdapter(object):
     """Returned by :meth:`Map.bind` or :meth:`Map.bind_to_environ` and does
     the URL matching and building based on runtime information.
@@ -1230,6 +2060,24 @@ class MapAdapter(object):
         self.default_method = default_method
         self.query_args = query_args
 
+    def copy(self, path_info=None, default_method='GET', query_args=None):
+        """Returns a copy of the adapter for another request to the same
+        host, script name and URL scheme.  This is a lot cheaper than
+        binding the map again.
+
+        .. versionadded:: 0.9
+
+        :param path_info: the new default path info.
+        :param default_method: the new default method.
+        :param query_args: the new query arguments.
+        """
+        rv = object.__new__(self.__class__)
+        rv.__dict__.update(self.__dict__)
+        rv.path_info = path_info or ''
+        rv.default_method = default_method
+        rv.query_args = query_args
+        return rv
+
     def dispatch(self, view_func, path=None, method=None, path_info=None,
                  catch_http_exceptions=False):
         """Does the complete dispatching process.  `view_func` is called with
@@ -1382,21 +2230,22 @@ class MapAdapter(object):
             query_args = self.query_args
         method = (method or self.default_method).upper()
 
-        path_ = '%s|/%s' % (self.map.host_matching and self.server_name or
-                            self.subdomain, path.lstrip('/'))
+        if self.map._match_cache is None:
+            rule, rv = self._match_rule(path, method, query_args)
+        else:
+            rule, rv = self._cached_match_rule(path, method, query_args)
+        if return_rule:
+            return rule, rv
+        return rule.endpoint, rv
+
+    def _match_rule(self, path, method, query_args):
+        """Helper for :meth:`match`.  Returns the matching rule and the
+        converted values or raises the HTTP exception.
 
+        :internal:
+        """
         have_match_for = set()
-        for rule in self.map._rules:
-            try:
-                rv = rule.match(path_)
-            except RequestSlash:
-                raise RequestRedirect(self.make_redirect_url(
-                    path + '/', query_args))
-            except RequestAliasRedirect as e:
-                raise RequestRedirect(self.make_alias_redirect_url(
-                    path_, rule.endpoint, e.matched_values, method, query_args))
-            if rv is None:
-                continue
+        for rule, rv in self._iter_matches(path, method, query_args):
             if rule.methods is not None and method not in rule.methods:
                 have_match_for.update(rule.methods)
                 continue
@@ -1423,15 +2272,166 @@ class MapAdapter(object):
                     self.script_name
                 ), redirect_url)))
 
-            if return_rule:
-                return rule, rv
-            else:
-                return rule.endpoint, rv
+            return rule, rv
 
         if have_match_for:
             raise MethodNotAllowed(valid_methods=list(have_match_for))
         raise NotFound()
 
+    def match_many(self, paths, method=None, return_rule=False,
+                   query_args=None, processes=None):
+        """Matches many paths at once, for example to check the links of a
+        site.  Returns a list with the return value of :meth:`match` for
+        every path in the same order.  If matching a path raises an HTTP
+        exception like :exc:`NotFound` or a :exc:`RequestRedirect`, the
+        exception is put into the list instead.
+
+        For very large numbers of paths the work can be split across
+        `processes` worker processes.  The workers are forked from the
+        current process, so this only works on platforms that support
+        :func:`os.fork`.
+
+        .. versionadded:: 0.9
+
+        :param paths: an iterable of paths.
+        :param method: the HTTP method used for matching all paths.
+                       Overrides the method specified on binding.
+        :param return_rule: return the rules that matched instead of just
+                            the endpoints.
+        :param query_args: optional query arguments that are used for
+                           automatic redirects.
+        :param processes: the number of worker processes or `None` to match
+                          all paths in the current process.
+        """
+        self.map.update()
+        if query_args is None:
+            query_args = self.query_args
+        method = (method or self.default_method).upper()
+        if self.map._match_cache is None:
+            match_rule = self._match_rule
+        else:
+            match_rule = self._cached_match_rule
+        paths = list(paths)
+        for idx, path in enumerate(paths):
+            if not isinstance(path, str):
+                paths[idx] = path.decode(self.map.charset,
+                                         self.map.encoding_errors)
+
+        rv = []
+        if processes is not None:
+            rules = self.map._rules
+            rule_indexes = dict((id(x), idx) for idx, x in enumerate(rules))
+            for result in _map_in_pool(processes, _pool_match, paths,
+                                       (match_rule, method, query_args,
+                                        rule_indexes)):
+                if result[0] != 'match':
+                    rv.append(_make_match_error(result))
+                elif return_rule:
+                    rv.append((rules[result[1]], result[2]))
+                else:
+                    rv.append((rules[result[1]].endpoint, result[2]))
+            return rv
+
+        for path in paths:
+            try:
+                rule, values = match_rule(path, method, query_args)
+            except HTTPException as e:
+                rv.append(e)
+            else:
+                rv.append((return_rule and rule or rule.endpoint, values))
+        return rv
+
+    def _cached_match_rule(self, path, method, query_args):
+        """Like :meth:`_match_rule` but looks up the result in the match
+        cache of the map first.  Redirects are only cached if there are no
+        query arguments as those end up in the redirect URL.
+
+        :internal:
+        """
+        cache = self.map._match_cache
+        key = (self.server_name, self.subdomain, self.script_name,
+               self.url_scheme, path, method)
+        rv = cache.get(key)
+        if rv is None or (query_args and rv[0] == 'redirect'):
+            try:
+                rule, values = self._match_rule(path, method, query_args)
+            except RequestRedirect as e:
+                if query_args:
+                    raise
+                rv = ('redirect', e.new_url)
+            except MethodNotAllowed as e:
+                rv = ('method', tuple(e.valid_methods))
+            except NotFound:
+                rv = ('missing',)
+            else:
+                rv = ('match', rule, values)
+            if self._is_match_cacheable(path):
+                cache.set(key, rv)
+
+        if rv[0] == 'match':
+            return rv[1], dict(rv[2])
+        raise _make_match_error(rv)
+
+    def _is_match_cacheable(self, path):
+        """Checks that none of the rules with converters that opted out of
+        caching or callable redirect targets were involved in matching the
+        path.  Their values are only converted if the regular expression
+        matches.
+
+        :internal:
+        """
+        path_ = '%s|/%s' % (self._get_domain_part(), path.lstrip('/'))
+        for rule in self.map._uncacheable_rules:
+            regex = rule._regex or rule._compile_regex()
+            if regex.search(path_) is not None:
+                return False
+        return True
+
+    def _get_domain_part(self):
+        """The domain part the rules are matched against.  This is the
+        host if host matching is enabled, the subdomain otherwise.
+
+        :internal:
+        """
+        return '%s' % (self.map.host_matching and self.server_name or
+                       self.subdomain)
+
+    def _iter_matches(self, path, method, query_args):
+        """Helper for :meth:`match`.  Yields ``(rule, values)`` tuples for the
+        rules that match the path in the order of the map.  Redirects for
+        missing trailing slashes and aliases are raised right away.
+
+        :internal:
+        """
+        domain_part = self._get_domain_part()
+        path_ = '%s|/%s' % (domain_part, path.lstrip('/'))
+
+        for rule, redirect in self.map.get_static_matches(path_):
+            if redirect:
+                raise RequestRedirect(self.make_redirect_url(
+                    path + '/', query_args))
+            if rule.alias and self.map.redirect_defaults:
+                raise RequestRedirect(self.make_alias_redirect_url(
+                    path_, rule.endpoint, {}, method, query_args))
+            yield rule, {}
+
+        # the rules that do not accept the method are only looked up and
+        # tested if no other rule matched and the allowed methods are needed.
+        lookups = self.map.get_match_candidates, \
+                  self.map.get_method_mismatches
+        for rule in chain.from_iterable(lookup(domain_part, path, method)
+                                        for lookup in lookups):
+            try:
+                rv = rule.match(path_)
+            except RequestSlash:
+                raise RequestRedirect(self.make_redirect_url(
+                    path + '/', query_args))
+            except RequestAliasRedirect as e:
+                raise RequestRedirect(self.make_alias_redirect_url(
+                    path_, rule.endpoint, e.matched_values, method, query_args))
+            if rv is not None:
+                yield rule, rv
+
     def test(self, path=None, method=None, path_info=None):
         """Test if a rule would match.  Works like `match` but returns `True`
         if the URL matches, or `False` if it does not exist.
@@ -1551,6 +2551,22 @@ class MapAdapter(object):
                 if rv is not None:
                     return rv
 
+    def _get_build_cache_key(self, endpoint, values, method, append_unknown):
+        """Helper for :meth:`build`.  Returns the key for the build cache of
+        the map or `None` if the values cannot be cached.
+
+        :internal:
+        """
+        if endpoint in self.map._uncacheable_endpoints:
+            return
+        items = []
+        for key, value in values.items():
+            if value.__class__ not in _build_cache_types:
+                return
+            items.append((key, value.__class__, value))
+        return endpoint, method, self.default_method, \
+            append_unknown, frozenset(items)
+
     def build(self, endpoint, values=None, method=None, force_external=False,
               append_unknown=True):
         """Building URLs works pretty much the other way round.  Instead of
@@ -1615,9 +2631,20 @@ class MapAdapter(object):
         else:
             values = {}
 
-        rv = self._partial_build(endpoint, values, method, append_unknown)
+        cache = self.map._build_cache
+        cache_key = None
+        if cache is not None:
+            cache_key = self._get_build_cache_key(endpoint, values, method,
+                                                  append_unknown)
+        rv = None
+        if cache_key is not None:
+            rv = cache.get(cache_key)
         if rv is None:
-            raise BuildError(endpoint, values, method)
+            rv = self._partial_build(endpoint, values, method, append_unknown)
+            if rv is None:
+                raise BuildError(endpoint, values, method)
+            if cache_key is not None:
+                cache.set(cache_key, rv)
         domain_part, path = rv
 
         host = self.get_host(domain_part)
@@ -1626,10 +2653,57 @@ class MapAdapter(object):
         if not force_external and (
             (self.map.host_matching and host == self.server_name) or
             (not self.map.host_matching and domain_part == self.subdomain)):
-            return str(urljoin(self.script_name, './' + path.lstrip('/')))
+            url = self.script_name + path.lstrip('/')
+            # joining removes dot segments, empty segments and some special
+            # characters.  Most URLs have none of them, so only pay for the
+            # urljoin if necessary.
+            if _simple_url_re.match(url) is None or '//' in url or \
+               '/.' in url or url[-1:] == '?':
+                url = urljoin(self.script_name, './' + path.lstrip('/'))
+            return str(url)
         return str('%s://%s%s/%s' % (
             self.url_scheme,
             host,
             self.script_name[:-1],
             path.lstrip('/')
         ))
+
+    def build_many(self, endpoint, values_list, method=None,
+                   force_external=False, append_unknown=True,
+                   processes=None):
+        """Builds the URLs of an endpoint for many dicts of values, for
+        example to generate a sitemap.  Returns a list with the return value
+        of :meth:`build` for all values in the same order.  If building a
+        URL fails the :exc:`BuildError` is put into the list instead.
+
+        Like for :meth:`match_many` the work can be split across `processes`
+        forked worker processes.  The values have to be picklable then.
+
+        .. versionadded:: 0.9
+
+        :param endpoint: the endpoint of the URLs to build.
+        :param values_list: an iterable of dicts with the values for the
+                            URLs.
+        :param method: the HTTP method for the rule if there are different
+                       URLs for different methods on the same endpoint.
+        :param force_external: enforce full canonical external URLs.
+        :param append_unknown: unknown parameters are appended to the
+                               generated URLs as query string arguments.
+        :param processes: the number of worker processes or `None` to build
+                          all URLs in the current process.
+        """
+        self.map.update()
+        if processes is not None:
+            return _map_in_pool(processes, _pool_build, list(values_list),
+                                (self.build, (endpoint, method,
+                                              force_external,
+                                              append_unknown)))
+        rv = []
+        build = self.build
+        for values in values_list:
+            try:
+                rv.append(build(endpoint, values, method, force_external,
+                                append_unknown))
+            except BuildError as e:
+                rv.append(e)
+        return rv
@@ -41,20 +41,73 @@ import os
 import socket
 import sys
 import time
+import select
 import _thread
 import signal
 import subprocess
+import selectors
+import asyncio
+import threading
+from queue import Queue, Full, Empty
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
 from urllib.parse import unquote
 from socketserver import ThreadingMixIn, ForkingMixIn
 from http.server import HTTPServer, BaseHTTPRequestHandler
+try:
+    import ssl
+except ImportError:
+    ssl = None
 
 import werkzeug
 from werkzeug._internal import _log
-from werkzeug.exceptions import InternalServerError
+from werkzeug.exceptions import InternalServerError, ServiceUnavailable
+from werkzeug.wsgi import ChunkedInputStream, LimitedStream, FileWrapper
 
 
 class WSGIRequestHandler(BaseHTTPRequestHandler, object):
-    """A request handler that implements WSGI dispatching."""
+    """A request handler that implements WSGI dispatching.
+
+    The handler speaks HTTP/1.1 and keeps connections open for more
+    requests if the client supports it.  Responses without a
+    ``Content-Length`` header are sent with ``Transfer-Encoding: chunked``
+    to HTTP/1.1 clients and the connection is closed after them for
+    older ones.  Request bodies the application did not read are skipped
+    before the next request is read, unless they are bigger than
+    :attr:`max_skip_size`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    #: the seconds an idle connection is kept open for the next request.
+    #: Servers with a limited number of threads or processes need them for
+    #: other clients, idle connections are closed earlier if the server
+    #: has connections waiting, see :meth:`wait_for_request`.
+    keep_alive_timeout = 5
+
+    #: the seconds between the checks for waiting connections while a
+    #: connection is idle.
+    idle_check_interval = 0.1
+
+    #: the maximum number of requests handled on one connection before
+    #: it's closed or `None` for no limit.
+    max_keep_alive_requests = 100
+
+    #: the maximum number of unread request body bytes that are skipped
+    #: to keep the connection open.  If more data is left the connection
+    #: is closed instead.
+    max_skip_size = 64 * 1024
+
+    #: the maximum number of buffers passed to one call of
+    #: :meth:`~socket.socket.sendmsg`.
+    max_send_buffers = 512
+
+    #: the maximum size of request bodies sent with ``Transfer-Encoding:
+    #: chunked`` or `None` for no limit.  Such bodies are decoded by a
+    #: :class:`~werkzeug.wsgi.ChunkedInputStream` which raises a
+    #: :exc:`~werkzeug.exceptions.RequestEntityTooLarge` error if the limit
+    #: is exceeded.
+    max_chunked_size = None
 
     @property
     def server_version(self):
@@ -79,6 +132,7 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
             'wsgi.multithread':     self.server.multithread,
             'wsgi.multiprocess':    self.server.multiprocess,
             'wsgi.run_once':        False,
+            'wsgi.file_wrapper':    FileWrapper,
             'werkzeug.server.shutdown':
                                     shutdown_server,
             'SERVER_SOFTWARE':      self.server_version,
@@ -101,6 +155,20 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
             if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
                 environ[key] = value
 
+        transfer_encoding = self.headers.get('Transfer-Encoding', '')
+        if transfer_encoding.split(',')[-1].strip().lower() == 'chunked':
+            environ['wsgi.input'] = ChunkedInputStream(self.rfile,
+                                                       self.max_chunked_size)
+            environ['wsgi.input_terminated'] = True
+            environ['CONTENT_LENGTH'] = ''
+        else:
+            # the application must not read into the next request
+            try:
+                content_length = max(int(environ['CONTENT_LENGTH']), 0)
+            except ValueError:
+                content_length = 0
+            environ['wsgi.input'] = LimitedStream(self.rfile, content_length)
+
         return environ
 
     def run_wsgi(self):
@@ -108,30 +176,71 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         environ = self.make_environ()
         headers_set = []
         headers_sent = []
+        chunked = []
 
         def write(data):
+            send([data])
+
+        def send(chunks, end=False):
             assert headers_set, 'write() before start_response'
+            buffers = []
             if not headers_sent:
                 status, response_headers = headers_sent[:] = headers_set
                 code, msg = status.split(None, 1)
-                self.send_response(int(code), msg)
+                code = int(code)
+                self.send_response(code, msg)
                 header_keys = set()
                 for key, value in response_headers:
                     self.send_header(key, value)
                     key = key.lower()
                     header_keys.add(key)
-                if 'content-length' not in header_keys:
+                    if key == 'connection' and value.lower() == 'close':
+                        self.close_connection = True
+                if self.max_keep_alive_requests is not None and \
+                   self.requests_handled + 1 >= self.max_keep_alive_requests:
+                    self.close_connection = True
+                if 'content-length' in header_keys or code in (204, 304) or \
+                   100 <= code < 200:
+                    pass
+                elif self.request_version >= 'HTTP/1.1' and \
+                     self.command != 'HEAD' and \
+                     'transfer-encoding' not in header_keys:
+                    chunked.append(True)
+                    self.send_header('Transfer-Encoding', 'chunked')
+                else:
                     self.close_connection = True
-                    self.send_header('Connection', 'close')
+                if 'connection' not in header_keys:
+                    if self.close_connection:
+                        self.send_header('Connection', 'close')
+                    elif self.request_version < 'HTTP/1.1':
+                        self.send_header('Connection', 'keep-alive')
                 if 'server' not in header_keys:
                     self.send_header('Server', self.version_string())
                 if 'date' not in header_keys:
                     self.send_header('Date', self.date_time_string())
-                self.end_headers()
-
-            assert isinstance(data, bytes), 'applications must write bytes'
-            self.wfile.write(data)
-            self.wfile.flush()
+                # the headers are sent together with the first data
+                self._headers_buffer.append(b'\r\n')
+                buffers.append(b''.join(self._headers_buffer))
+                self._headers_buffer = []
+
+            # responses to HEAD requests have no body even if the
+            # application returns one.
+            if self.command == 'HEAD':
+                chunks = ()
+            for data in chunks:
+                assert isinstance(data, bytes), \
+                    'applications must write bytes'
+                if not data:
+                    continue
+                if chunked:
+                    buffers.append(('%x\r\n' % len(data)).encode('ascii'))
+                    buffers.append(data)
+                    buffers.append(b'\r\n')
+                else:
+                    buffers.append(data)
+            if end and chunked:
+                buffers.append(b'0\r\n\r\n')
+            self.write_buffers(buffers)
 
         def start_response(status, response_headers, exc_info=None):
             if exc_info:
@@ -148,11 +257,19 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         def execute(app):
             application_iter = app(environ, start_response)
             try:
+                if isinstance(application_iter, (list, tuple)):
+                    # all the data is there already, so it's sent at once
+                    send(application_iter, end=True)
+                    return
+                if isinstance(application_iter, FileWrapper):
+                    send([])
+                    if self.command == 'HEAD' or not chunked and \
+                       self.send_file(application_iter.file, headers_set[1]):
+                        return
                 for data in application_iter:
                     write(data)
-                # make sure the headers are sent
-                if not headers_sent:
-                    write(b'')
+                # make sure the headers are sent and the response ends
+                send([], end=True)
             finally:
                 if hasattr(application_iter, 'close'):
                     application_iter.close()
@@ -161,8 +278,12 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         try:
             execute(app)
         except (socket.error, socket.timeout) as e:
+            self.close_connection = True
             self.connection_dropped(e, environ)
         except Exception:
+            # a response that was started cannot be completed
+            if headers_sent:
+                self.close_connection = True
             if self.server.passthrough_errors:
                 raise
             from werkzeug.debug.tbtools import get_current_traceback
@@ -177,10 +298,85 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
                 pass
             self.server.log('error', 'Error on request:\n%s',
                             traceback.plaintext)
+        if not self.close_connection:
+            self.skip_input(environ['wsgi.input'])
+
+    def write_buffers(self, buffers):
+        """Writes a list of bytes to the connection.  If the socket
+        supports it they are passed to :meth:`~socket.socket.sendmsg` at
+        once instead of being joined or written one by one.
+        """
+        if not buffers:
+            return
+        sock = self.connection
+        if self.server.ssl_context is not None or \
+           not hasattr(sock, 'sendmsg') or len(buffers) == 1:
+            sock.sendall(b''.join(buffers))
+            return
+        buffers = [memoryview(buf) for buf in buffers if buf]
+        while buffers:
+            sent = sock.sendmsg(buffers[:self.max_send_buffers])
+            while sent:
+                if sent < len(buffers[0]):
+                    buffers[0] = buffers[0][sent:]
+                    break
+                sent -= len(buffers.pop(0))
+            while buffers and not buffers[0]:
+                buffers.pop(0)
+
+    def send_file(self, file, response_headers):
+        """Sends the rest of a file with :func:`os.sendfile` if possible
+        and returns `True`, or `False` if it has to be read and sent in
+        Python.  If the response has a ``Content-Length`` no more than
+        that is sent.
+        """
+        if self.server.ssl_context is not None or \
+           not hasattr(self.connection, 'sendfile'):
+            return False
+        try:
+            file.fileno()
+            offset = file.tell()
+        except (AttributeError, OSError, ValueError):
+            return False
+        count = None
+        for key, value in response_headers:
+            if key.lower() == 'content-length':
+                count = int(value)
+        try:
+            self.connection.sendfile(file, offset, count)
+        except ValueError:
+            # not a binary file
+            return False
+        return True
+
+    def skip_input(self, stream):
+        """Skips what's left of the request body so that the next request
+        can be read from the connection.  If too much is left or the body
+        is broken the connection is closed instead.
+        """
+        try:
+            if isinstance(stream, LimitedStream) and \
+               stream.limit - stream._pos <= self.max_skip_size:
+                stream.exhaust()
+            elif not stream.is_exhausted:
+                self.close_connection = True
+        except Exception:
+            self.close_connection = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # the responses are written with as few calls as possible, so
+        # waiting for more data before sending a packet only adds latency.
+        try:
+            self.connection.setsockopt(socket.IPPROTO_TCP,
+                                       socket.TCP_NODELAY, 1)
+        except (socket.error, AttributeError):
+            pass
 
     def handle(self):
         """Handles a request ignoring dropped connections."""
         rv = None
+        self.requests_handled = 0
         try:
             rv = BaseHTTPRequestHandler.handle(self)
         except (socket.error, socket.timeout) as e:
@@ -211,13 +407,64 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         nothing happens.
         """
 
+    def wait_for_request(self):
+        """Waits for the next request on a connection that is kept alive
+        and returns `True` if there is data to read.  `False` is returned
+        if nothing arrived within the :attr:`keep_alive_timeout` or as soon
+        as the `has_waiting_connections` method of the server returns
+        `True`, so that a server with a limited number of threads or
+        processes does not refuse or delay other clients because its
+        workers wait for idle connections.
+        """
+        has_waiting_connections = getattr(self.server,
+                                          'has_waiting_connections', None)
+        if has_waiting_connections is None or \
+           self.server.ssl_context is not None:
+            return True
+        # a pipelined request might be buffered already
+        self.connection.settimeout(0)
+        try:
+            if self.rfile.peek(1):
+                return True
+        finally:
+            self.connection.settimeout(self.timeout)
+        deadline = time.time() + self.keep_alive_timeout
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self.connection, selectors.EVENT_READ)
+            while 1:
+                timeout = deadline - time.time()
+                if timeout <= 0 or has_waiting_connections():
+                    return False
+                if selector.select(min(timeout, self.idle_check_interval)):
+                    return True
+        finally:
+            selector.close()
+
     def handle_one_request(self):
-        """Handle a single HTTP request."""
-        self.raw_requestline = self.rfile.readline()
+        """Handle a single HTTP request.  Idle connections are closed after
+        :attr:`keep_alive_timeout` seconds or earlier if the server needs
+        the worker for other connections, see :meth:`wait_for_request`.
+        """
+        if self.requests_handled:
+            if not self.wait_for_request():
+                self.close_connection = 1
+                return
+            self.connection.settimeout(self.keep_alive_timeout)
+        try:
+            self.raw_requestline = self.rfile.readline()
+        except socket.timeout:
+            self.raw_requestline = None
+        finally:
+            if self.requests_handled:
+                self.connection.settimeout(self.timeout)
         if not self.raw_requestline:
             self.close_connection = 1
         elif self.parse_request():
-            return self.run_wsgi()
+            try:
+                return self.run_wsgi()
+            finally:
+                self.requests_handled += 1
 
     def send_response(self, code, message=None):
         """Send the response header and log the response code."""
@@ -225,9 +472,11 @@ class WSGIRequestHandler(BaseHTTPRequestHandler, object):
         if message is None:
             message = code in self.responses and self.responses[code][0] or ''
         if self.request_version != 'HTTP/0.9':
-            self.wfile.write(("%s %d %s\r\n" %
-                              (self.protocol_version, code, message)
-                             ).encode('ascii'))
+            if not hasattr(self, '_headers_buffer'):
+                self._headers_buffer = []
+            self._headers_buffer.append(("%s %d %s\r\n" %
+                                         (self.protocol_version, code,
+                                          message)).encode('latin1'))
 
     def version_string(self):
         return BaseHTTPRequestHandler.version_string(self).strip()
@@ -435,16 +684,206 @@ class BaseWSGIServer(HTTPServer, object):
             con = _SSLConnectionFix(con)
         return con, info
 
+    def has_waiting_connections(self):
+        """Returns `True` if connections wait until the server can handle
+        them.  The request handler closes idle keep-alive connections then.
+        This server handles one connection at a time, so every connection
+        in the listening socket waits.
+        """
+        return bool(select.select([self.socket], [], [], 0)[0])
+
 
 class ThreadedWSGIServer(ThreadingMixIn, BaseWSGIServer):
     """A WSGI server that does threading."""
     multithread = True
 
+    # every connection gets its own thread
+    has_waiting_connections = None
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """A WSGI server that handles the connections with a fixed number of
+    worker threads.  Accepted connections wait in a queue of `backlog`
+    entries until a thread is free.  If the queue is full the connection
+    is answered with a *503 Service Unavailable* error right away, so a
+    burst of slow clients cannot create an unbounded number of threads.
+    With a `backlog` of ``0`` connections are only accepted if a thread is
+    free.
+
+    .. versionadded:: 0.9
+    """
+    multithread = True
+
+    #: the seconds a refused connection is kept open to read the rest of
+    #: the request.  Closing a connection with unread data resets it and
+    #: the client might lose the error response.
+    linger_timeout = 1.0
+
+    def __init__(self, host, port, app, max_threads=10, backlog=None,
+                 handler=None, passthrough_errors=False, ssl_context=None):
+        BaseWSGIServer.__init__(self, host, port, app, handler,
+                                passthrough_errors, ssl_context)
+        if backlog is None:
+            backlog = max_threads
+        if max_threads < 1 or backlog < 0:
+            raise ValueError('at least one thread and a backlog of zero or '
+                             'more connections are required')
+        self.max_threads = max_threads
+        self.backlog = backlog
+        self.busy = 0
+        self.rejected = 0
+        # the connections that are queued or handled by a thread
+        self._pending = 0
+        self._queue = Queue()
+        self._closing = Queue(max_threads + backlog)
+        self._lock = threading.Lock()
+        self._threads = []
+        for target in [self._closer] + [self._worker] * max_threads:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def get_stats(self):
+        """Returns a dict with the number of `threads`, the `busy` threads,
+        the connections that are `queued` and the `rejected` connections.
+        """
+        return {
+            'threads':      self.max_threads,
+            'busy':         self.busy,
+            'queued':       self._queue.qsize(),
+            'backlog':      self.backlog,
+            'rejected':     self.rejected
+        }
+
+    def has_waiting_connections(self):
+        """Returns `True` if connections wait in the queue or, without a
+        backlog, if all the threads are busy.  Idle keep-alive connections
+        are closed then to free their threads.
+        """
+        if self.backlog:
+            return self._pending > self.max_threads
+        return self._pending >= self.max_threads
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            accept = self._pending < self.max_threads + self.backlog
+            if accept:
+                self._pending += 1
+            else:
+                self.rejected += 1
+        if accept:
+            self._queue.put((request, client_address))
+        else:
+            self.reject_request(request, client_address)
+
+    def reject_request(self, request, client_address):
+        """Called for connections that do not fit into the queue.  Sends
+        a *503 Service Unavailable* error without reading the request and
+        closes the connection once the client sent the request or after
+        the :attr:`linger_timeout`.
+        """
+        error = ServiceUnavailable()
+        body = error.get_body({}).encode('utf-8')
+        headers = ['HTTP/1.0 %d %s' % (error.code, error.name)]
+        for key, value in error.get_headers({}):
+            headers.append('%s: %s' % (key, value))
+        headers.append('Content-Length: %d' % len(body))
+        headers.append('Connection: close')
+        try:
+            request.sendall(('\r\n'.join(headers) + '\r\n\r\n')
+                            .encode('latin1') + body)
+            request.shutdown(socket.SHUT_WR)
+            self._closing.put_nowait(request)
+        except (socket.error, socket.timeout, Full):
+            self.close_request(request)
+
+    def _closer(self):
+        selector = selectors.DefaultSelector()
+        deadlines = {}
+
+        def close(request):
+            selector.unregister(request)
+            del deadlines[request]
+            self.close_request(request)
+
+        while 1:
+            if deadlines:
+                for key, events in selector.select(0.05):
+                    try:
+                        data = key.fileobj.recv(4096)
+                    except (socket.error, socket.timeout):
+                        data = b''
+                    if not data:
+                        close(key.fileobj)
+                now = time.time()
+                for request, deadline in list(deadlines.items()):
+                    if deadline < now:
+                        close(request)
+                request = False
+            else:
+                request = self._closing.get()
+            while request is not None:
+                if request is not False:
+                    selector.register(request, selectors.EVENT_READ)
+                    deadlines[request] = time.time() + self.linger_timeout
+                try:
+                    request = self._closing.get_nowait()
+                except Empty:
+                    break
+            else:
+                for request in list(deadlines):
+                    close(request)
+                selector.close()
+                return
+
+    def _worker(self):
+        while 1:
+            item = self._queue.get()
+            if item is None:
+                break
+            request, client_address = item
+            with self._lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self.busy -= 1
+                    self._pending -= 1
+
+    def server_close(self):
+        BaseWSGIServer.server_close(self)
+        # the queued connections are not handled anymore
+        while 1:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                self.close_request(item[0])
+                with self._lock:
+                    self._pending -= 1
+        if self._threads:
+            self._closing.put(None)
+        for x in range(len(self._threads) - 1):
+            self._queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
 
 class ForkingWSGIServer(ForkingMixIn, BaseWSGIServer):
     """A WSGI server that does forking."""
     multiprocess = True
 
+    # every connection gets its own process
+    has_waiting_connections = None
+
     def __init__(self, host, port, app, processes=40, handler=None,
                  passthrough_errors=False, ssl_context=None):
         BaseWSGIServer.__init__(self, host, port, app, handler,
@@ -452,18 +891,738 @@ class ForkingWSGIServer(ForkingMixIn, BaseWSGIServer):
         self.max_children = processes
 
 
+class PreforkWSGIServer(BaseWSGIServer):
+    """A WSGI server that forks a number of long lived worker processes
+    when it starts serving.  The workers accept the connections on the
+    listening socket they share and handle them one after another, so
+    the fork happens once per worker and not for every request like in
+    the :class:`ForkingWSGIServer`.  The parent process restarts workers
+    that exit, for example after they handled `max_requests` connections,
+    and terminates them when it's stopped.
+
+    If `reuse_port` is enabled every worker listens on its own socket with
+    ``SO_REUSEPORT`` so that the kernel distributes the connections
+    between them.  That is only supported on Linux and some BSDs.  The
+    sockets stay open in the parent process so that a restarted worker
+    takes over the connections its predecessor did not accept.
+
+    .. versionadded:: 0.9
+    """
+    multiprocess = True
+
+    #: the seconds a worker waits for a connection before it checks if
+    #: the parent process is still alive.
+    timeout = 1.0
+
+    def __init__(self, host, port, app, processes=4, max_requests=None,
+                 reuse_port=False, handler=None, passthrough_errors=False,
+                 ssl_context=None):
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise TypeError('SO_REUSEPORT is not supported on this system')
+        self.processes = processes
+        self.max_requests = max_requests
+        self.reuse_port = reuse_port
+        #: maps the pids of the running workers to their slot
+        self.workers = {}
+        self._stopping = False
+        self._parent = os.getpid()
+        BaseWSGIServer.__init__(self, host, port, app, handler,
+                                passthrough_errors, ssl_context)
+        self.sockets = [self.socket]
+        if reuse_port:
+            for x in range(processes - 1):
+                sock = socket.socket(self.address_family, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                sock.bind(self.server_address)
+                sock.listen(self.request_queue_size)
+                if ssl_context is not None:
+                    from OpenSSL import tsafe
+                    sock = tsafe.Connection(self.ssl_context, sock)
+                self.sockets.append(sock)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        BaseWSGIServer.server_bind(self)
+
+    def server_close(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def serve_forever(self):
+        """Forks the workers and restarts them if they exit until the
+        server is shut down or the process is interrupted.
+        """
+        self._stopping = False
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            # workers ask the parent to shut down with SIGTERM
+            previous_handler = signal.signal(signal.SIGTERM,
+                                             self._handle_sigterm)
+        try:
+            while not self._stopping:
+                slots = set(range(self.processes))
+                for slot in slots.difference(self.workers.values()):
+                    self.spawn_worker(slot)
+                # only the workers are waited for, other children of the
+                # process belong to the application.
+                reaped = failed = False
+                for pid in list(self.workers):
+                    try:
+                        exited, status = os.waitpid(pid, os.WNOHANG)
+                    except ChildProcessError:
+                        exited, status = pid, 0
+                    if not exited:
+                        continue
+                    reaped = True
+                    self.workers.pop(pid, None)
+                    if status and not self._stopping:
+                        self.log('error', 'Worker %d exited with status %d',
+                                 pid, status)
+                        failed = True
+                if failed:
+                    # don't fork a worker that fails on startup in a loop
+                    time.sleep(1)
+                elif not reaped:
+                    time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_workers()
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+    def _handle_sigterm(self, signum, frame):
+        self._stopping = True
+
+    def shutdown(self):
+        """Stops the workers and makes :meth:`serve_forever` return."""
+        self._stopping = True
+        self.stop_workers()
+
+    def spawn_worker(self, slot=0):
+        """Forks a new worker process for the given slot and returns its
+        pid.  The slot is the index of the socket the worker listens on
+        if `reuse_port` is enabled.
+        """
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = slot
+            return pid
+        status = 1
+        try:
+            if self.reuse_port:
+                self.socket = self.sockets[slot]
+            self.serve_worker()
+            status = 0
+        except KeyboardInterrupt:
+            status = 0
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    def stop_workers(self):
+        """Terminates the workers and waits for them to exit."""
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            self.workers.pop(pid, None)
+
+    def serve_worker(self):
+        """Handles connections in a worker process until it handled
+        `max_requests` connections or the parent process went away.
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # the parent is interrupted as well and terminates the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.workers = {}
+        # all workers wake up for a connection, the ones that don't get it
+        # must not block in accept.
+        self.socket.setblocking(False)
+        self._handled = 0
+        while self.max_requests is None or \
+              self._handled < self.max_requests:
+            if os.getppid() != self._parent:
+                break
+            if self.shutdown_signal:
+                os.kill(self._parent, signal.SIGTERM)
+                break
+            self.handle_request()
+
+    def process_request(self, request, client_address):
+        BaseWSGIServer.process_request(self, request, client_address)
+        self._handled += 1
+
+
+class _AsyncioConnection(asyncio.Protocol):
+    """A connection of the :class:`AsyncioWSGIServer`.  The received data
+    is collected in a buffer.  The request lines and headers are parsed
+    from it in the event loop and the threads that run the application
+    read the request body from it.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = server.loop
+        self.buffer = bytearray()
+        self.eof = False
+        self.transport = None
+        self._data_waiter = None
+        self._drain_waiter = None
+        self._reading_paused = False
+        self._writing_paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+        self.task = self.loop.create_task(self.handle())
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        self.eof = True
+        self._wakeup()
+        self.resume_writing()
+
+    def eof_received(self):
+        self.eof = True
+        self._wakeup()
+        # keep the connection open to send the response
+        return True
+
+    def data_received(self, data):
+        self.buffer += data
+        if len(self.buffer) > self.server.max_buffer_size and \
+           not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+        self._wakeup()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        waiter, self._drain_waiter = self._drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _wakeup(self):
+        waiter, self._data_waiter = self._data_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _wait_for_data(self):
+        if self._reading_paused:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        self._data_waiter = self.loop.create_future()
+        await self._data_waiter
+
+    async def read_head(self):
+        """Returns the request line and the headers of the next request,
+        an empty string if they are too long or `None` if the connection
+        was closed.
+        """
+        while 1:
+            # empty lines in front of a request are ignored
+            while self.buffer[:2] == b'\r\n':
+                del self.buffer[:2]
+            end = self.buffer.find(b'\r\n\r\n')
+            if end != -1:
+                head = bytes(self.buffer[:end])
+                del self.buffer[:end + 4]
+                return head
+            if len(self.buffer) > self.server.max_header_size:
+                return b''
+            if self.eof:
+                return None
+            await self._wait_for_data()
+
+    async def read(self, size):
+        while not self.buffer and not self.eof:
+            await self._wait_for_data()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def readline(self, size):
+        while 1:
+            end = self.buffer.find(b'\n', 0, size)
+            if end != -1:
+                size = end + 1
+                break
+            if len(self.buffer) >= size or self.eof:
+                break
+            await self._wait_for_data()
+        return await self.read(size)
+
+    async def write(self, data):
+        if self.transport.is_closing():
+            raise ConnectionResetError('connection lost')
+        self.transport.write(data)
+        if self._writing_paused:
+            self._drain_waiter = self.loop.create_future()
+            await self._drain_waiter
+
+    async def handle(self):
+        server = self.server
+        requests = 0
+        try:
+            while not self.transport.is_closing():
+                try:
+                    head = await asyncio.wait_for(self.read_head(),
+                                                  server.keep_alive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                if head is None:
+                    break
+                request = head and server.parse_request(head)
+                if not request:
+                    await self.write(b'HTTP/1.1 400 Bad Request\r\n'
+                                     b'Content-Length: 0\r\n'
+                                     b'Connection: close\r\n\r\n')
+                    break
+                requests += 1
+                keep_alive = await self.loop.run_in_executor(
+                    server.executor, server.run_wsgi, self, request,
+                    requests)
+                if server.shutdown_signal:
+                    server.stop()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception:
+            if server.passthrough_errors:
+                server.stop(sys.exc_info())
+            else:
+                import traceback
+                server.log('error', 'Error on request:\n%s',
+                           traceback.format_exc())
+        finally:
+            self.transport.close()
+
+
+class _AsyncioInput(object):
+    """A blocking stream over the buffer of an :class:`_AsyncioConnection`
+    for the threads that run the application.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(
+            coro, self.connection.loop).result()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = sys.maxsize
+        # like a buffered file this only returns less data at the end
+        chunks = []
+        while size > 0:
+            chunk = self._call(self.connection.read(size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = self.connection.server.max_header_size
+        return self._call(self.connection.readline(size))
+
+
+class AsyncioWSGIServer(object):
+    """A WSGI server that handles the connections with :mod:`asyncio`.
+    The requests are parsed in the event loop and the application is
+    called in a pool of `max_threads` threads that streams the request
+    body from the connection and the response to it.  Connections that
+    wait for the next request only cost a buffer and a task, so many idle
+    keep-alive connections don't need a thread each.
+
+    The `ssl_context` has to be a :class:`ssl.SSLContext`.  The server
+    supports the same keep-alive and chunked responses as the
+    :class:`WSGIRequestHandler` but no custom request handlers.
+
+    .. versionadded:: 0.9
+    """
+    multithread = True
+    multiprocess = False
+    request_queue_size = 128
+
+    #: the seconds a connection waits for the headers of the next request.
+    keep_alive_timeout = 5
+
+    #: the maximum number of requests handled on one connection.
+    max_keep_alive_requests = 100
+
+    #: the maximum size of the request line and headers of a request.
+    max_header_size = 64 * 1024
+
+    #: the number of received bytes after which reading from the
+    #: connection is paused until the application reads the data.
+    max_buffer_size = 256 * 1024
+
+    #: the maximum number of unread request body bytes that are skipped
+    #: to keep the connection open.
+    max_skip_size = 64 * 1024
+
+    def __init__(self, host, port, app, max_threads=10,
+                 passthrough_errors=False, ssl_context=None):
+        if ssl_context is not None and \
+           (ssl is None or not isinstance(ssl_context, ssl.SSLContext)):
+            raise TypeError('The asyncio server only supports '
+                            'ssl.SSLContext objects.')
+        self.app = app
+        self.max_threads = max_threads
+        self.passthrough_errors = passthrough_errors
+        self.ssl_context = ssl_context
+        self.address_family = select_ip_version(host, port)
+        self.socket = socket.socket(self.address_family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, int(port)))
+        self.socket.listen(self.request_queue_size)
+        self.server_address = self.socket.getsockname()
+        self.shutdown_signal = False
+        self.connections = set()
+        self.loop = None
+        self.executor = None
+        self._stopped = threading.Event()
+        self._error = None
+
+    def log(self, type, message, *args):
+        _log(type, message, *args)
+
+    def serve_forever(self):
+        """Runs the event loop until :meth:`shutdown` is called or the
+        process is interrupted.
+        """
+        self.shutdown_signal = False
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(self.max_threads)
+        # a future of the new loop, asyncio.Event binds itself to the
+        # current loop of the thread on Python < 3.10
+        self._stop = self.loop.create_future()
+        self._stopped.clear()
+        try:
+            self.loop.run_until_complete(self._serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+            self.loop.close()
+            self._stopped.set()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error[1].with_traceback(error[2])
+
+    async def _serve(self):
+        server = await self.loop.create_server(
+            lambda: _AsyncioConnection(self), sock=self.socket,
+            ssl=self.ssl_context)
+        await self._stop
+        server.close()
+        tasks = [connection.task for connection in self.connections]
+        for connection in list(self.connections):
+            connection.transport.close()
+        if tasks:
+            # give the application a moment to finish running requests
+            done, pending = await asyncio.wait(tasks, timeout=5)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        await server.wait_closed()
+
+    def stop(self, error=None):
+        """Stops the server from the event loop."""
+        if error is not None and self._error is None:
+            self._error = error
+        if not self._stop.done():
+            self._stop.set_result(None)
+
+    def shutdown(self):
+        """Stops the server from another thread and waits until
+        :meth:`serve_forever` returned.
+        """
+        if self.loop is not None and not self._stopped.is_set():
+            self.loop.call_soon_threadsafe(self.stop)
+            self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+
+    def parse_request(self, head):
+        """Parses the request line and headers and returns a tuple in the
+        form ``(method, path, version, headers)`` or `None` if they are
+        malformed.
+        """
+        lines = head.decode('latin1').split('\r\n')
+        words = lines[0].split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            return None
+        headers = []
+        for line in lines[1:]:
+            if line[:1] in (' ', '\t') and headers:
+                headers[-1] = (headers[-1][0],
+                               headers[-1][1] + ' ' + line.strip())
+                continue
+            key, sep, value = line.partition(':')
+            if not sep or not key.strip():
+                return None
+            headers.append((key.strip(), value.strip()))
+        return words[0], words[1], words[2], headers
+
+    def make_environ(self, connection, request):
+        method, path, version, headers = request
+        path_info, _, query = path.partition('?')
+        peer = connection.transport.get_extra_info('peername') or ('', 0)
+        environ = {
+            'wsgi.version':         (1, 0),
+            'wsgi.url_scheme':      self.ssl_context is None and 'http'
+                                    or 'https',
+            'wsgi.input':           None,
+            'wsgi.errors':          sys.stderr,
+            'wsgi.multithread':     self.multithread,
+            'wsgi.multiprocess':    self.multiprocess,
+            'wsgi.run_once':        False,
+            'wsgi.file_wrapper':    FileWrapper,
+            'werkzeug.server.shutdown':
+                                    self._set_shutdown_signal,
+            'SERVER_SOFTWARE':      'Werkzeug/' + werkzeug.__version__,
+            'REQUEST_METHOD':       method,
+            'SCRIPT_NAME':          '',
+            'PATH_INFO':            unquote(path_info, encoding='latin1'),
+            'QUERY_STRING':         query,
+            'CONTENT_TYPE':         '',
+            'CONTENT_LENGTH':       '',
+            'REMOTE_ADDR':          peer[0],
+            'REMOTE_PORT':          peer[1],
+            'SERVER_NAME':          self.server_address[0],
+            'SERVER_PORT':          str(self.server_address[1]),
+            'SERVER_PROTOCOL':      version
+        }
+        for key, value in headers:
+            key = key.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+                if key in environ:
+                    value = environ[key] + ',' + value
+            environ[key] = value
+
+        stream = _AsyncioInput(connection)
+        transfer_encoding = environ.get('HTTP_TRANSFER_ENCODING', '')
+        if transfer_encoding.split(',')[-1].strip().lower() == 'chunked':
+            environ['wsgi.input'] = ChunkedInputStream(stream)
+            environ['wsgi.input_terminated'] = True
+            environ['CONTENT_LENGTH'] = ''
+        else:
+            try:
+                content_length = max(int(environ['CONTENT_LENGTH']), 0)
+            except ValueError:
+                content_length = 0
+            environ['wsgi.input'] = LimitedStream(stream, content_length)
+        return environ
+
+    def _set_shutdown_signal(self):
+        self.shutdown_signal = True
+
+    def run_wsgi(self, connection, request, requests):
+        """Runs the application for a request in a thread of the executor
+        and returns `True` if the connection can be kept open.
+        """
+        environ = self.make_environ(connection, request)
+        method, path, version = request[:3]
+        connection_header = environ.get('HTTP_CONNECTION', '').lower()
+        keep_alive = [connection_header != 'close' and
+                      (version >= 'HTTP/1.1' or
+                       connection_header == 'keep-alive')]
+        if self.max_keep_alive_requests is not None and \
+           requests >= self.max_keep_alive_requests:
+            keep_alive[0] = False
+        headers_set = []
+        headers_sent = []
+        chunked = []
+
+        def call(coro):
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+        if version >= 'HTTP/1.1' and \
+           environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+            call(connection.write(b'HTTP/1.1 100 Continue\r\n\r\n'))
+
+        def write(data):
+            send([data])
+
+        def send(chunks, end=False):
+            assert headers_set, 'write() before start_response'
+            buffers = []
+            if not headers_sent:
+                status, response_headers = headers_sent[:] = headers_set
+                code = int(status.split(None, 1)[0])
+                self.log_request(connection, request, code)
+                header_keys = set()
+                lines = ['HTTP/1.1 ' + status]
+                for key, value in response_headers:
+                    lines.append('%s: %s' % (key, value))
+                    key = key.lower()
+                    header_keys.add(key)
+                    if key == 'connection' and value.lower() == 'close':
+                        keep_alive[0] = False
+                if 'content-length' in header_keys or code in (204, 304) or \
+                   100 <= code < 200:
+                    pass
+                elif version >= 'HTTP/1.1' and method != 'HEAD' and \
+                     'transfer-encoding' not in header_keys:
+                    chunked.append(True)
+                    lines.append('Transfer-Encoding: chunked')
+                else:
+                    keep_alive[0] = False
+                if 'connection' not in header_keys:
+                    if not keep_alive[0]:
+                        lines.append('Connection: close')
+                    elif version < 'HTTP/1.1':
+                        lines.append('Connection: keep-alive')
+                if 'server' not in header_keys:
+                    lines.append('Server: ' + environ['SERVER_SOFTWARE'])
+                if 'date' not in header_keys:
+                    lines.append('Date: ' + formatdate(usegmt=True))
+                lines.append('\r\n')
+                buffers.append('\r\n'.join(lines).encode('latin1'))
+            # responses to HEAD requests have no body
+            if method == 'HEAD':
+                chunks = ()
+            for data in chunks:
+                assert isinstance(data, bytes), \
+                    'applications must write bytes'
+                if not data:
+                    continue
+                if chunked:
+                    buffers.append(('%x\r\n' % len(data)).encode('ascii'))
+                    buffers.append(data)
+                    buffers.append(b'\r\n')
+                else:
+                    buffers.append(data)
+            if end and chunked:
+                buffers.append(b'0\r\n\r\n')
+            if buffers:
+                call(connection.write(b''.join(buffers)))
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info:
+                try:
+                    if headers_sent:
+                        raise exc_info[0](exc_info[1]).with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif headers_set:
+                raise AssertionError('Headers already set')
+            headers_set[:] = [status, response_headers]
+            return write
+
+        def execute(app):
+            application_iter = app(environ, start_response)
+            try:
+                if isinstance(application_iter, (list, tuple)):
+                    send(application_iter, end=True)
+                    return
+                for data in application_iter:
+                    write(data)
+                send([], end=True)
+            finally:
+                if hasattr(application_iter, 'close'):
+                    application_iter.close()
+                application_iter = None
+
+        try:
+            execute(self.app)
+        except (socket.error, socket.timeout):
+            return False
+        except Exception:
+            if self.passthrough_errors:
+                raise
+            if headers_sent:
+                keep_alive[0] = False
+            from werkzeug.debug.tbtools import get_current_traceback
+            traceback = get_current_traceback(ignore_system_exceptions=True)
+            try:
+                if not headers_sent:
+                    del headers_set[:]
+                execute(InternalServerError())
+            except Exception:
+                pass
+            self.log('error', 'Error on request:\n%s', traceback.plaintext)
+
+        if keep_alive[0]:
+            stream = environ['wsgi.input']
+            try:
+                if isinstance(stream, LimitedStream) and \
+                   stream.limit - stream._pos <= self.max_skip_size:
+                    stream.exhaust()
+                elif not stream.is_exhausted:
+                    keep_alive[0] = False
+            except Exception:
+                keep_alive[0] = False
+        return keep_alive[0]
+
+    def log_request(self, connection, request, code):
+        peer = connection.transport.get_extra_info('peername') or ('-',)
+        self.log('info', '%s - - [%s] "%s" %s -\n', peer[0],
+                 time.strftime('%d/%b/%Y %H:%M:%S'),
+                 ' '.join(request[:3]), code)
+
+
 def make_server(host, port, app=None, threaded=False, processes=1,
                 request_handler=None, passthrough_errors=False,
-                ssl_context=None):
+                ssl_context=None, max_threads=None, backlog=None,
+                prefork=False, max_requests=None, reuse_port=False,
+                use_asyncio=False):
     """Create a new server instance that is either threaded, or forks
-    or just processes one request after another.
+    or just processes one request after another.  If `max_threads` is
+    given a threaded server uses a pool of that many threads and a queue
+    of `backlog` connections, see :class:`ThreadPoolWSGIServer`.  If
+    `prefork` is set the server forks `processes` workers that handle
+    `max_requests` connections each, see :class:`PreforkWSGIServer`.  If
+    `use_asyncio` is set an :class:`AsyncioWSGIServer` with `max_threads`
+    threads for the application is created.
+
+    .. versionadded:: 0.9
+       The `max_threads`, `backlog`, `prefork`, `max_requests`,
+       `reuse_port` and `use_asyncio` parameters were added.
     """
     if threaded and processes > 1:
         raise ValueError("cannot have a multithreaded and "
                          "multi process server.")
+    elif use_asyncio:
+        if processes > 1 or request_handler is not None:
+            raise ValueError("the asyncio server cannot fork and does "
+                             "not use request handlers.")
+        return AsyncioWSGIServer(host, port, app, max_threads or 10,
+                                 passthrough_errors, ssl_context)
+    elif threaded and max_threads is not None:
+        return ThreadPoolWSGIServer(host, port, app, max_threads, backlog,
+                                    request_handler, passthrough_errors,
+                                    ssl_context)
     elif threaded:
         return ThreadedWSGIServer(host, port, app, request_handler,
                                   passthrough_errors, ssl_context)
+    elif prefork:
+        return PreforkWSGIServer(host, port, app, processes, max_requests,
+                                 reuse_port, request_handler,
+                                 passthrough_errors, ssl_context)
     elif processes > 1:
         return ForkingWSGIServer(host, port, app, processes, request_handler,
                                  passthrough_errors, ssl_context)
@@ -587,10 +1746,17 @@ def restart_with_reloader():
             return exit_code
 
 
+def _interrupt(signum, frame):
+    """Handles a signal like an interrupt, so that the reloader returns
+    like after a :exc:`KeyboardInterrupt`.
+    """
+    raise KeyboardInterrupt()
+
+
 def run_with_reloader(main_func, extra_files=None, interval=1):
     """Run the given function in an independent python interpreter."""
     import signal
-    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    signal.signal(signal.SIGTERM, _interrupt)
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
         _thread.start_new_thread(main_func, ())
         try:
@@ -607,7 +1773,9 @@ def run_simple(hostname, port, application, use_reloader=False,
                use_debugger=False, use_evalex=True,
                extra_files=None, reloader_interval=1, threaded=False,
                processes=1, request_handler=None, static_files=None,
-               passthrough_errors=False, ssl_context=None):
+               passthrough_errors=False, ssl_context=None, max_threads=None,
+               backlog=None, prefork=False, max_requests=None,
+               reuse_port=False, use_asyncio=False):
     """Start an application using wsgiref and with an optional reloader.  This
     wraps `wsgiref` to fix the wrong default reporting of the multithreaded
     WSGI variable and adds optional multithreading and fork support.
@@ -623,6 +1791,10 @@ def run_simple(hostname, port, application, use_reloader=False,
        Added support for automatically loading a SSL context from certificate
        file and private key.
 
+    .. versionadded:: 0.9
+       `max_threads`, `backlog`, `prefork`, `max_requests`,
+       `reuse_port` and `use_asyncio` were added.
+
     :param hostname: The host for the application.  eg: ``'localhost'``
     :param port: The port for the server.  eg: ``8080``
     :param application: the WSGI application to execute
@@ -655,6 +1827,24 @@ def run_simple(hostname, port, application, use_reloader=False,
                         the string ``'adhoc'`` if the server should
                         automatically create one, or `None` to disable SSL
                         (which is the default).
+    :param max_threads: if given a threaded server handles the requests
+                        with a pool of this many threads instead of a new
+                        thread per request.
+    :param backlog: the number of connections that wait for a thread of
+                    the pool before they are refused with a *503* error.
+                    Defaults to `max_threads`, with ``0`` connections are
+                    refused if no thread is free.
+    :param prefork: if set `processes` worker processes are forked when
+                    the server starts and handle the requests instead of
+                    a new process per request.
+    :param max_requests: the number of connections a forked worker handles
+                         before it's replaced by a new one.  Defaults to
+                         no limit.
+    :param reuse_port: set this to `True` to let every forked worker listen
+                       on its own socket with ``SO_REUSEPORT``.
+    :param use_asyncio: set this to `True` to handle the connections with
+                        :mod:`asyncio` and run the application in a pool of
+                        `max_threads` threads.
     """
     if use_debugger:
         from werkzeug.debug import DebuggedApplication
@@ -666,7 +1856,9 @@ def run_simple(hostname, port, application, use_reloader=False,
     def inner():
         make_server(hostname, port, application, threaded,
                     processes, request_handler,
-                    passthrough_errors, ssl_context).serve_forever()
+                    passthrough_errors, ssl_context, max_threads,
+                    backlog, prefork, max_requests,
+                    reuse_port, use_asyncio).serve_forever()
 
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
         display_hostname = hostname != '*' and hostname or 'localhost'
@@ -19,9 +19,13 @@
 
 
 
+import os
+import shutil
 import unittest
 import pickle
+from io import BytesIO
 from copy import copy
+from tempfile import TemporaryFile, mkdtemp
 from werkzeug.testsuite import WerkzeugTestCase
 
 from werkzeug import datastructures
@@ -603,6 +607,50 @@ class ImmutableListTestCase(WerkzeugTestCase):
         self.assert_not_equal(t, l)
 
 
+class FileStorageTestCase(WerkzeugTestCase):
+
+    def test_save(self):
+        data = b'werkzeug' * 10000
+        tmpdir = mkdtemp()
+        try:
+            for stream in TemporaryFile('wb+'), BytesIO():
+                stream.write(data)
+                stream.seek(0)
+                storage = datastructures.FileStorage(stream, 'test.txt')
+                storage.read(8)
+                filename = os.path.join(tmpdir, 'test.txt')
+                storage.save(filename)
+                self.assert_equal(storage.read(), b'')
+                with open(filename, 'rb') as f:
+                    self.assert_equal(f.read(), data[8:])
+
+                storage.seek(0)
+                with open(filename, 'wb') as f:
+                    f.write(b'foo')
+                    storage.save(f)
+                    f.write(b'bar')
+                    self.assert_equal(f.tell(), len(data) + 6)
+                with open(filename, 'rb') as f:
+                    self.assert_equal(f.read(), b'foo' + data + b'bar')
+                storage.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_mmap(self):
+        data = b'werkzeug' * 10000
+        for stream in TemporaryFile('wb+'), BytesIO():
+            stream.write(data)
+            storage = datastructures.FileStorage(stream, 'test.txt')
+            with storage.mmap() as buf:
+                self.assert_equal(len(buf), len(data))
+                self.assert_equal(buf[-8:], b'werkzeug')
+                self.assert_raises(TypeError, buf.__setitem__, 0, 42)
+            storage.close()
+        storage = datastructures.FileStorage(TemporaryFile('wb+'), 'test.txt')
+        self.assert_equal(len(storage.mmap()), 0)
+        storage.close()
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(MultiDictTestCase))
@@ -615,4 +663,5 @@ def suite():
     suite.addTest(unittest.makeSuite(HeadersTestCase))
     suite.addTest(unittest.makeSuite(EnvironHeadersTestCase))
     suite.addTest(unittest.makeSuite(HeaderSetTestCase))
+    suite.addTest(unittest.makeSuite(FileStorageTestCase))
     return suite
@@ -11,6 +11,7 @@
 
 
 
+import gc
 import unittest
 from io import BytesIO
 from os.path import join, dirname
@@ -20,7 +21,7 @@ from werkzeug.testsuite import WerkzeugTestCase
 from werkzeug import formparser
 from werkzeug.test import create_environ, Client
 from werkzeug.wrappers import Request, Response
-from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
 
 
 @Request.application
@@ -332,6 +333,269 @@ class MultiPartTestCase(WerkzeugTestCase):
                                      method='POST')
         self.assert_equal(req.form['test'], 'Sk\xe5ne l\xe4n')
 
+    def test_boundary_at_buffer_edges(self):
+        parser = formparser.MultiPartParser(formparser.default_stream_factory,
+                                            buffer_size=1024)
+        for padding in range(900, 1100):
+            contents = b'\r\n'.join((b'x' * padding, b'--fo', b'--foo-', b''))
+            data = b'--foo\r\nContent-Disposition: form-data; name="test"; ' \
+                   b'filename="test.txt"\r\n\r\n' + contents + b'\r\n--foo\r\n' \
+                   b'Content-Disposition: form-data; name="x"\r\n\r\n\r\n--foo--'
+            form, files = parser.parse(BytesIO(data), 'foo', len(data))
+            self.assert_equal(files['test'].read(), contents)
+            self.assert_equal(form['x'], '')
+
+    def test_transfer_encoding(self):
+        parser = formparser.MultiPartParser(charset='latin1', buffer_size=1024)
+        data = b'--foo\r\nContent-Disposition: form-data; name="test"\r\n' \
+               b'Content-Transfer-Encoding: base64\r\n\r\n' + \
+               b'U2vlbmUg\r\nbORu\r\n' * 200 + b'\r\n--foo\r\n' \
+               b'Content-Disposition: form-data; name="qp"\r\n' \
+               b'Content-Transfer-Encoding: quoted-printable\r\n\r\n' \
+               b'Sk=E5ne=\r\n l=E4n\r\n--foo--'
+        form, files = parser.parse(BytesIO(data), 'foo', len(data))
+        self.assert_equal(form['test'], 'Sk\xe5ne l\xe4n' * 200)
+        self.assert_equal(form['qp'], 'Sk\xe5ne l\xe4n')
+
+    def test_file_handler(self):
+        class Sink(object):
+            def __init__(self):
+                self.chunks = []
+                self.state = 'open'
+            def write(self, data):
+                self.chunks.append(data)
+            def close(self):
+                self.state = 'closed'
+            def abort(self):
+                self.state = 'aborted'
+
+        sinks = []
+        chunks = []
+        def file_handler(name, filename, headers):
+            if name == 'spooled':
+                return None
+            elif name == 'callable':
+                return chunks.append
+            sinks.append(Sink())
+            return sinks[-1]
+
+        data = b'--foo\r\nContent-Disposition: form-data; name="test"; ' \
+               b'filename="C:\\\\test.bin"\r\n\r\n' + b'x' * 100000 + b'\r\n' \
+               b'--foo\r\nContent-Disposition: form-data; name="spooled"; ' \
+               b'filename="spooled.txt"\r\n\r\nspooled\r\n' \
+               b'--foo\r\nContent-Disposition: form-data; name="callable"; ' \
+               b'filename="callable.txt"\r\n\r\ncallable\r\n--foo--'
+        req = Request.from_values(input_stream=BytesIO(data),
+                                  content_length=len(data),
+                                  content_type='multipart/form-data; boundary=foo',
+                                  method='POST')
+        req.file_handler = file_handler
+        files = req.files
+        self.assert_equal(len(sinks), 1)
+        self.assert_equal(sinks[0].state, 'closed')
+        self.assert_equal(b''.join(sinks[0].chunks), b'x' * 100000)
+        self.assertTrue(files['test'].stream is sinks[0])
+        self.assert_equal(files['test'].filename, 'test.bin')
+        self.assert_equal(files['spooled'].read(), b'spooled')
+        self.assert_equal(chunks, [b'callable'])
+        self.assert_equal(files['callable'].read(), b'')
+
+        # files that are too big and clients that go away abort the sink
+        req = Request.from_values(input_stream=BytesIO(data),
+                                  content_length=len(data),
+                                  content_type='multipart/form-data; boundary=foo',
+                                  method='POST')
+        req.file_handler = file_handler
+        req.max_file_size = 50000
+        self.assert_raises(RequestEntityTooLarge, lambda: req.files)
+        self.assert_equal(sinks[-1].state, 'aborted')
+
+        env = create_environ(input_stream=BytesIO(data[:50000]), method='POST',
+                             content_type='multipart/form-data; boundary=foo')
+        env['CONTENT_LENGTH'] = str(len(data))
+        req = Request(env)
+        req.file_handler = file_handler
+        self.assert_raises(ClientDisconnected, lambda: req.files)
+        self.assert_equal(sinks[-1].state, 'aborted')
+
+    def test_memory_budget(self):
+        budget = formparser.upload_memory_budget
+        data = b'--foo\r\nContent-Disposition: form-data; name="foo"\r\n\r\n' + \
+               b'x' * 1000 + b'\r\n--foo\r\nContent-Disposition: form-data; ' \
+               b'name="bar"; filename="bar.txt"\r\n\r\nbar\r\n--foo--'
+        def parse():
+            return formparser.parse_form_data(create_environ(data=data,
+                method='POST', content_type='multipart/form-data; boundary=foo'))
+
+        usage = budget.usage
+        stream, form, files = parse()
+        self.assertTrue(isinstance(files['bar'].stream._file, BytesIO))
+        self.assert_equal(budget.usage, usage + 3)
+        self.assert_equal(files['bar'].read(), b'bar')
+        files['bar'].close()
+        self.assert_equal(budget.usage, usage)
+
+        budget.limit = usage + 1001
+        try:
+            stream, form, files = parse()
+            self.assert_equal(form['foo'], 'x' * 1000)
+            self.assertTrue(not isinstance(files['bar'].stream._file, BytesIO))
+            self.assert_equal(files['bar'].read(), b'bar')
+            files['bar'].close()
+            self.assert_equal(budget.usage, usage)
+
+            budget.limit = usage + 500
+            refused = budget.refused
+            self.assert_raises(RequestEntityTooLarge, parse)
+            self.assert_equal(budget.refused, refused + 1)
+            self.assert_equal(budget.get_stats()['usage'], usage)
+        finally:
+            budget.limit = None
+
+    def test_memory_budget_reserves_written_bytes(self):
+        budget = formparser.upload_memory_budget
+        data = b''.join(b'--foo\r\nContent-Disposition: form-data; '
+                        b'name="f%d"; filename="f.txt"\r\n\r\n' % i +
+                        b'x' * 100 + b'\r\n' for i in range(20)) + b'--foo--'
+        usage = budget.usage
+        budget.limit = usage + 1500
+        try:
+            stream, form, files = formparser.parse_form_data(create_environ(
+                data=data, method='POST',
+                content_type='multipart/form-data; boundary=foo'))
+            self.assert_equal(budget.usage, usage + 1500)
+            in_memory = [f for f in files.values()
+                         if isinstance(f.stream._file, BytesIO)]
+            self.assert_equal(len(in_memory), 15)
+            for f in files.values():
+                self.assert_equal(f.read(), b'x' * 100)
+                f.close()
+            self.assert_equal(budget.usage, usage)
+        finally:
+            budget.limit = None
+
+    def test_memory_budget_released_with_requests(self):
+        budget = formparser.upload_memory_budget
+        data = b''.join(b'--foo\r\nContent-Disposition: form-data; '
+                        b'name="f%d"; filename="f.txt"\r\n\r\n' % i +
+                        b'x' * 20000 + b'\r\n' for i in range(5)) + b'--foo--'
+        def make_request():
+            return Request.from_values(input_stream=BytesIO(data),
+                content_length=len(data), method='POST',
+                content_type='multipart/form-data; boundary=foo')
+
+        # uploads of other tests that are garbage
+        gc.collect()
+        usage = budget.usage
+        budget.limit = usage + 100000
+        try:
+            request = make_request()
+            self.assert_equal(len(request.files), 5)
+            self.assert_equal(budget.usage, usage + 100000)
+            # dropped requests give the memory back
+            del request
+            gc.collect()
+            self.assert_equal(budget.usage, usage)
+
+            with make_request() as request:
+                self.assert_equal(len(request.files), 5)
+                self.assert_equal(budget.usage, usage + 100000)
+            self.assert_equal(budget.usage, usage)
+            self.assert_equal(len(Request.from_values(data={'a': '1'},
+                method='POST').form), 1)
+        finally:
+            budget.limit = None
+
+    def test_spooled_urlencoded_values(self):
+        data = b'foo=bar&blob=' + b'%41' * 3000 + b'&baz=' + b'x' * 100
+        def parse(**options):
+            return formparser.parse_form_data(create_environ(data=data,
+                method='POST',
+                content_type='application/x-www-form-urlencoded'), **options)
+
+        stream, form, files = parse(max_value_memory_size=1000,
+                                    max_form_memory_size=500)
+        self.assert_equal(list(form.items(multi=True)),
+                          [('foo', 'bar'), ('baz', 'x' * 100)])
+        self.assert_equal(files['blob'].name, 'blob')
+        self.assert_equal(files['blob'].content_length, 3000)
+        self.assert_equal(files['blob'].read(), b'A' * 3000)
+
+        self.assert_raises(RequestEntityTooLarge, parse,
+                           max_value_memory_size=1000,
+                           max_form_memory_size=100)
+        self.assert_raises(RequestEntityTooLarge, parse,
+                           max_value_memory_size=1000, max_file_size=2000)
+        stream, form, files = parse(max_value_memory_size=5000)
+        self.assert_equal(form['blob'], 'A' * 3000)
+        self.assert_equal(len(files), 0)
+
+    def test_multipart_decoder(self):
+        data = b'\r\n--foo\r\nContent-Disposition: form-data; name="foo"\r\n' \
+               b'\r\nHello\r\nWorld\r\n--foo\r\nContent-Disposition: ' \
+               b'form-data; name="bar"; filename="bar.txt"\r\n\r\n' \
+               b'--foo-\r\n--foo--\r\nepilogue'
+        decoder = formparser.MultiPartDecoder('foo')
+        events = []
+        for idx in range(len(data)):
+            events.extend(decoder.feed(data[idx:idx + 1]))
+        events.extend(decoder.close())
+        self.assertTrue(decoder.complete)
+
+        parts = []
+        for event, value in events:
+            if event == 'part_start':
+                parts.append([value['content-disposition'], b''])
+            elif event == 'part_data':
+                parts[-1][1] += value
+        self.assert_equal(parts, [
+            ['form-data; name="foo"', b'Hello\r\nWorld'],
+            ['form-data; name="bar"; filename="bar.txt"', b'--foo-']
+        ])
+        self.assert_equal([x[0] for x in events if x[0] != 'part_data'],
+                          ['part_start', 'part_end'] * 2)
+
+        decoder = formparser.MultiPartDecoder('foo')
+        decoder.feed(data[:60])
+        self.assert_raises(ValueError, decoder.close)
+        self.assert_raises(ValueError, formparser.MultiPartDecoder, None)
+
+    def test_chunked_multipart(self):
+        data = b'--foo\r\nContent-Disposition: form-data; name="foo"\r\n\r\n' \
+               b'bar\r\n--foo\r\nContent-Disposition: form-data; name="f"; ' \
+               b'filename="f.txt"\r\n\r\n' + b'x' * 1000 + b'\r\n--foo--'
+        body = b''.join(b'%x\r\n%s\r\n' % (len(data[x:x + 77]), data[x:x + 77])
+                        for x in range(0, len(data), 77)) + b'0\r\n\r\n'
+        def parse(**options):
+            environ = create_environ(input_stream=BytesIO(body), method='POST',
+                content_type='multipart/form-data; boundary=foo')
+            environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+            return formparser.parse_form_data(environ, **options)
+
+        stream, form, files = parse()
+        self.assert_equal(form['foo'], 'bar')
+        self.assert_equal(files['f'].read(), b'x' * 1000)
+        self.assertTrue(not isinstance(files['f'].stream, BytesIO))
+        files['f'].close()
+        self.assert_raises(RequestEntityTooLarge, parse, max_content_length=500)
+
+    def test_urlencoded_decoder(self):
+        data = b'foo=Hello+World&bar=%C3%A4&baz'
+        decoder = formparser.URLEncodedDecoder()
+        events = []
+        for idx in range(len(data)):
+            events.extend(decoder.feed(data[idx:idx + 1]))
+        events.extend(decoder.close())
+        self.assert_equal(events, [
+            ('field', ('foo', 'Hello World')),
+            ('field', ('bar', '\xe4')),
+            ('field', ('baz', ''))
+        ])
+
+        decoder = formparser.URLEncodedDecoder(max_form_memory_size=10)
+        decoder.feed(data[:10])
+        self.assert_raises(RequestEntityTooLarge, decoder.feed, data[10:])
+
 
 class InternalFunctionsTestCase(WerkzeugTestCase):
 
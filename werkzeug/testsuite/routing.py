@@ -9,6 +9,7 @@
     :license: BSD, see LICENSE for more details.
 """
 import unittest
+from io import BytesIO
 
 from werkzeug.testsuite import WerkzeugTestCase
 
@@ -649,6 +650,425 @@ class RoutingTestCase(WerkzeugTestCase):
         self.assert_equal(endpoint, 'foo')
         self.assert_equal(values, {'bar': 'bäär'})
 
+    def test_trie_matching(self):
+        class PairConverter(r.BaseConverter):
+            regex = '[^/]+/[^/]+'
+
+        def make_map(**options):
+            return r.Map([
+                r.Rule('/', endpoint='index'),
+                r.Rule('/foo', endpoint='foo', strict_slashes=False),
+                r.Rule('/foo/<int:id>', endpoint='foo_show', methods=['GET']),
+                r.Rule('/foo/<int:id>', endpoint='foo_edit', methods=['POST']),
+                r.Rule('/bar/', endpoint='bar'),
+                r.Rule('/bar/<x>-<y>/edit', endpoint='bar_edit'),
+                r.Rule('/all/', defaults={'page': 1}, endpoint='all'),
+                r.Rule('/all/page/<int:page>', endpoint='all'),
+                r.Rule('/files/<path:name>', endpoint='files'),
+                r.Rule('/files/<path:name>/raw', endpoint='files_raw'),
+                r.Rule('/<any(about, help):page>', endpoint='page'),
+                r.Rule('/<any("a/b", c):page>/x', endpoint='slash_page'),
+                r.Rule('/build', endpoint='build', build_only=True),
+                r.Rule('/<string(length=2):lang>/', endpoint='lang'),
+                r.Rule('/x/<pair:pair>', endpoint='pair'),
+                r.Subdomain('kb', [
+                    r.Rule('/', endpoint='kb_index'),
+                    r.Rule('/browse/<int:id>/', endpoint='kb_browse')
+                ]),
+                r.Subdomain('<user>', [
+                    r.Rule('/profile', endpoint='profile')
+                ])
+            ], converters={'pair': PairConverter}, **options)
+
+        def outcome(adapter, path, method):
+            try:
+                return adapter.match(path, method)
+            except r.RequestRedirect as e:
+                return 'redirect', e.new_url
+            except r.MethodNotAllowed as e:
+                return 'method not allowed', sorted(e.valid_methods)
+            except r.NotFound:
+                return 'not found'
+
+        paths = ['/', '/foo', '/foo/', '/foo/42', '/foo/42/', '/foo/x',
+                 '/bar', '/bar/', '/bar/a-b/edit', '/bar/a-b/edit/',
+                 '/all/', '/all/page/1', '/all/page/2', '/files/a/b/c',
+                 '/files/a/b/raw', '/files/', '/about', '/help/', '/a/b/x',
+                 '/c/x', '/build', '/de', '/de/', '/foo\n', '/about\n',
+                 '/missing/path', '//foo//42', '/profile', '/x/a/b']
+        linear = make_map()
+        trie = make_map(trie_matching=True)
+        for subdomain in '', 'kb', 'peter':
+            for path in paths + ['/browse/23', '/browse/23/']:
+                for method in 'GET', 'POST':
+                    a = linear.bind('example.com', subdomain=subdomain)
+                    b = trie.bind('example.com', subdomain=subdomain)
+                    self.assert_equal(outcome(a, path, method),
+                                      outcome(b, path, method))
+
+        a = trie.bind('example.com')
+        assert a.match('/files/a/b/raw') == ('files_raw', {'name': 'a/b'})
+        assert a.match('/a/b/x') == ('slash_page', {'page': 'a/b'})
+        assert a.match('/foo/42', 'POST') == ('foo_edit', {'id': 42})
+        # the converter can match slashes although it doesn't say so
+        assert a.match('/x/a/b') == ('pair', {'pair': 'a/b'})
+
+        linear = r.Map([
+            r.Rule('/', endpoint='index', host='www.<domain>'),
+            r.Rule('/<int:page>', host='files.<domain>', endpoint='x'),
+            r.Rule('/about', host='static.example.com', endpoint='about')
+        ], host_matching=True)
+        trie = r.Map([x.empty() for x in linear.iter_rules()],
+                     host_matching=True, trie_matching=True)
+        for host in 'www.example.com', 'files.example.com', \
+                    'static.example.com':
+            for path in '/', '/2', '/about', '/missing':
+                self.assert_equal(outcome(linear.bind(host), path, 'GET'),
+                                  outcome(trie.bind(host), path, 'GET'))
+
+    def test_static_rules(self):
+        m = r.Map([
+            r.Rule('/status', endpoint='status', methods=['GET']),
+            r.Rule('/status', endpoint='update_status', methods=['PUT']),
+            r.Rule('/api/', endpoint='api', methods=['POST']),
+            r.Rule('/api/<int:version>', endpoint='api'),
+            r.Rule('/loose', endpoint='loose', strict_slashes=False),
+            r.Rule('/static', endpoint='static', build_only=True),
+            r.Rule('/<name>', endpoint='page', methods=['DELETE']),
+            r.Rule('/kb', endpoint='kb', subdomain='kb')
+        ])
+        a = m.bind('example.com')
+        assert a.match('/status') == ('status', {})
+        assert a.match('/status', 'PUT') == ('update_status', {})
+        try:
+            a.match('/status', 'POST')
+        except r.MethodNotAllowed as e:
+            self.assert_equal(sorted(e.valid_methods),
+                              ['DELETE', 'GET', 'HEAD', 'PUT'])
+        else:
+            self.fail('Expected method not allowed')
+        try:
+            a.match('/api', 'GET')
+        except r.RequestRedirect as e:
+            self.assert_equal(e.new_url, 'http://example.com/api/')
+        else:
+            self.fail('Expected request redirect')
+        assert a.match('/api/', 'POST') == ('api', {})
+        assert a.match('/loose/') == ('loose', {})
+        assert a.match('/static', 'DELETE') == ('page', {'name': 'static'})
+        self.assert_raises(r.MethodNotAllowed, lambda: a.match('/static'))
+        self.assert_raises(r.MethodNotAllowed, lambda: a.match('/kb'))
+        a = m.bind('example.com', subdomain='kb')
+        assert a.match('/kb') == ('kb', {})
+
+    def test_build_cache(self):
+        m = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/page/<page>', endpoint='page', methods=['GET']),
+            r.Rule('/edit/<page>', endpoint='page', methods=['POST'])
+        ], build_cache_size=3)
+        a = m.bind('example.com', '/app')
+        assert a.build('page', {'page': 1}) == '/app/page/1'
+        assert a.build('page', {'page': True}) == '/app/page/True'
+        assert a.build('page', {'page': 1}, method='POST') == '/app/edit/1'
+        assert a.build('page', {'page': 1}) == '/app/page/1'
+        self.assert_equal(m.get_cache_info()['build'],
+                          {'hits': 1, 'misses': 3, 'size': 3, 'maxsize': 3})
+
+        # only plain values are cached
+        assert a.build('page', {'page': 1, 'x': [1, 2]}) == \
+            '/app/page/1?x=1&x=2'
+        self.assert_equal(m.get_cache_info()['build']['misses'], 3)
+
+        assert a.build('page', {'page': '../x'}) == '/app/x'
+        assert a.build('page', {'page': '.'}) == '/app/page/'
+        assert a.build('index', force_external=True) == \
+            'http://example.com/app/'
+
+        m.add(r.Rule('/p/<page>', defaults={'x': 1}, endpoint='page'))
+        assert a.build('page', {'page': 1}) == '/app/p/1'
+
+    def test_match_cache(self):
+        class CounterConverter(r.BaseConverter):
+            cacheable = False
+            def to_python(self, value):
+                return int(value) + len(calls)
+
+        calls = []
+        def redirect_to(adapter, **values):
+            calls.append(values)
+            return 'new'
+
+        m = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/item/<int:id>', endpoint='item', methods=['GET']),
+            r.Rule('/folder/', endpoint='folder'),
+            r.Rule('/counter/<counter:x>', endpoint='counter'),
+            r.Rule('/old/<int:id>', redirect_to=redirect_to)
+        ], match_cache_size=10, converters={'counter': CounterConverter})
+        a = m.bind('example.com')
+
+        rv = a.match('/item/42')
+        self.assert_equal(rv, ('item', {'id': 42}))
+        rv[1]['id'] = 23
+        self.assert_equal(a.match('/item/42'), ('item', {'id': 42}))
+        rule, values = a.match('/item/42', return_rule=True)
+        self.assert_equal(rule.rule, '/item/<int:id>')
+        for x in range(2):
+            self.assert_raises(r.MethodNotAllowed,
+                               lambda: a.match('/item/42', 'POST'))
+            self.assert_raises(r.NotFound, lambda: a.match('/missing'))
+            try:
+                a.match('/folder')
+            except r.RequestRedirect as e:
+                self.assert_equal(e.new_url, 'http://example.com/folder/')
+            else:
+                self.fail('Expected request redirect')
+        self.assert_equal(sorted(a.allowed_methods('/item/42')),
+                          ['GET', 'HEAD'])
+        self.assert_equal(m.get_cache_info()['match'],
+                          {'hits': 5, 'misses': 5, 'size': 5, 'maxsize': 10})
+
+        # the query arguments end up in redirects
+        try:
+            a.match('/folder', query_args='foo=bar')
+        except r.RequestRedirect as e:
+            self.assert_equal(e.new_url,
+                              'http://example.com/folder/?foo=bar')
+        else:
+            self.fail('Expected request redirect')
+
+        # as do other server names
+        a = m.bind('example.org')
+        try:
+            a.match('/folder')
+        except r.RequestRedirect as e:
+            self.assert_equal(e.new_url, 'http://example.org/folder/')
+        else:
+            self.fail('Expected request redirect')
+
+        # rules that opted out are matched every time
+        self.assert_equal(a.match('/counter/1'), ('counter', {'x': 1}))
+        for x in range(2):
+            self.assert_raises(r.RequestRedirect, lambda: a.match('/old/1'))
+        self.assert_equal(len(calls), 2)
+        self.assert_equal(a.match('/counter/1'), ('counter', {'x': 3}))
+
+        m.add(r.Rule('/item/<int:id>', endpoint='item_post',
+                     methods=['POST']))
+        self.assert_equal(a.match('/item/42', 'POST'),
+                          ('item_post', {'id': 42}))
+        self.assert_equal(m.get_cache_info()['match']['size'], 1)
+
+    def test_incremental_add(self):
+        def make_rules():
+            return [
+                r.Rule('/', endpoint='index'),
+                r.Rule('/<path:path>', endpoint='page'),
+                r.Rule('/<name>', endpoint='page'),
+                r.Rule('/<name>/edit', endpoint='edit'),
+                r.Rule('/about', endpoint='page'),
+                r.Rule('/page/<int:id>', endpoint='page'),
+                r.Rule('/page/<name>', endpoint='page', defaults={'x': 1}),
+                r.Rule('/page/<int:id>', endpoint='page', alias=True),
+                r.Rule('/<name>/edit', endpoint='edit_again'),
+            ]
+
+        expected = r.Map(make_rules())
+        paths = ['/', '/about', '/foo', '/foo/edit', '/page/1', '/page/x',
+                 '/a/b/c']
+        for trie_matching in False, True:
+            m = r.Map(trie_matching=trie_matching)
+            for rule in make_rules():
+                m.add(rule)
+                list(m.iter_rules())
+            self.assert_equal([x.rule for x in m.iter_rules()],
+                              [x.rule for x in expected.iter_rules()])
+            self.assert_equal([x.endpoint for x in m.iter_rules()],
+                              [x.endpoint for x in expected.iter_rules()])
+            for endpoint in 'page', 'edit':
+                self.assert_equal(list(m.iter_rules(endpoint)),
+                                  list(expected.iter_rules(endpoint)))
+            a = m.bind('example.com')
+            b = expected.bind('example.com')
+            for path in paths:
+                self.assert_equal(a.match(path), b.match(path))
+
+        m = r.Map([r.Rule('/', endpoint='index')])
+        m.add_many([r.Rule('/<name>', endpoint='page'),
+                    r.Submount('/sub', [r.Rule('/', endpoint='sub')])])
+        a = m.bind('example.com')
+        self.assert_equal(a.match('/sub/'), ('sub', {}))
+        self.assert_equal(a.match('/foo'), ('page', {'name': 'foo'}))
+        self.assert_equal(a.build('sub'), '/sub/')
+
+    def test_adapter_cache(self):
+        m = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/<name>', endpoint='page', subdomain='<user>')
+        ], adapter_cache_size=2)
+        env = create_environ('/foo', 'http://joe.example.com/app/',
+                             method='POST', query_string='x=1')
+        a1 = m.bind_to_environ(env, server_name='example.com')
+        env = create_environ('/bar', 'http://joe.example.com/app/')
+        a2 = m.bind_to_environ(env, server_name='example.com')
+        self.assert_equal(m.get_cache_info()['adapter']['hits'], 1)
+        assert a1 is not a2
+        self.assert_equal((a1.path_info, a1.default_method, a1.query_args),
+                          ('/foo', 'POST', 'x=1'))
+        self.assert_equal((a2.path_info, a2.default_method, a2.query_args),
+                          ('/bar', 'GET', ''))
+        for a in a1, a2:
+            self.assert_equal((a.server_name, a.subdomain, a.script_name),
+                              ('example.com', 'joe', '/app/'))
+        self.assert_equal(a2.match(), ('page', {'user': 'joe',
+                                                'name': 'bar'}))
+
+        env = create_environ('/foo', 'https://example.com/')
+        a = m.bind_to_environ(env, server_name='example.com')
+        self.assert_equal((a.subdomain, a.url_scheme), ('', 'https'))
+        self.assert_equal(a.build('page', {'user': 'joe', 'name': 'x'}),
+                          'https://joe.example.com/x')
+        a = m.bind_to_environ(env)
+        self.assert_equal(a.match('/'), ('index', {}))
+        self.assert_raises(r.NotFound, lambda: a.match('/foo'))
+
+        m = r.Map([r.Rule('/', endpoint='index')], adapter_cache_size=0)
+        a = m.bind_to_environ(create_environ('/'))
+        self.assert_equal(a.match(), ('index', {}))
+        self.assert_equal(m.get_cache_info()['adapter'], None)
+
+    def test_method_partitioning(self):
+        for trie_matching in False, True:
+            m = r.Map([
+                r.Rule('/<name>/', endpoint='folder', methods=['GET']),
+                r.Rule('/<int:id>', endpoint='show', methods=['GET']),
+                r.Rule('/<int:id>', endpoint='update', methods=['PUT']),
+                r.Rule('/page/<name>', endpoint='any'),
+                r.Rule('/new/<int:id>', endpoint='new', methods=['POST']),
+                r.Rule('/old/<int:id>', endpoint='new', alias=True,
+                       methods=['GET'])
+            ], trie_matching=trie_matching)
+            a = m.bind('example.com')
+            self.assert_equal(a.match('/42', 'PUT'), ('update', {'id': 42}))
+            self.assert_equal(a.match('/page/x', 'DELETE'),
+                              ('any', {'name': 'x'}))
+            self.assert_equal(a.match('/foo/', 'GET'), ('folder',
+                                                        {'name': 'foo'}))
+            self.assert_equal(a.match('/new/1', 'POST'), ('new', {'id': 1}))
+            # redirects happen before the methods are checked
+            self.assert_raises(r.RequestRedirect,
+                               lambda: a.match('/foo', 'POST'))
+            self.assert_raises(r.RequestRedirect,
+                               lambda: a.match('/old/1', 'POST'))
+            for method in 'GET', 'PATCH':
+                try:
+                    a.match('/new/1', method)
+                except r.MethodNotAllowed as e:
+                    self.assert_equal(e.valid_methods, ['POST'])
+                else:
+                    self.fail('Expected method not allowed')
+            self.assert_raises(r.NotFound, lambda: a.match('/new/x', 'GET'))
+            m.add(r.Rule('/new/<int:id>', endpoint='patch',
+                         methods=['PATCH']))
+            self.assert_equal(a.match('/new/1', 'PATCH'), ('patch',
+                                                            {'id': 1}))
+            self.assert_equal(sorted(a.allowed_methods('/new/1')),
+                              ['PATCH', 'POST'])
+
+    def test_match_many(self):
+        m = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/page/<int:id>', endpoint='page', methods=['GET']),
+            r.Rule('/folder/', endpoint='folder')
+        ])
+        a = m.bind('example.com')
+        paths = ['/', '/page/42', b'/page/23', '/folder', '/missing']
+        for processes in None, 2:
+            rv = a.match_many(paths, processes=processes)
+            self.assert_equal(rv[:3], [('index', {}), ('page', {'id': 42}),
+                                       ('page', {'id': 23})])
+            assert isinstance(rv[3], r.RequestRedirect)
+            self.assert_equal(rv[3].new_url, 'http://example.com/folder/')
+            assert isinstance(rv[4], r.NotFound)
+            rv = a.match_many(['/page/1'], 'post', return_rule=True,
+                              processes=processes)
+            assert isinstance(rv[0], r.MethodNotAllowed)
+            self.assert_equal(sorted(rv[0].valid_methods), ['GET', 'HEAD'])
+            rule, values = a.match_many(['/page/1'], return_rule=True,
+                                        processes=processes)[0]
+            self.assert_equal((rule.endpoint, values), ('page', {'id': 1}))
+
+    def test_build_many(self):
+        m = r.Map([r.Rule('/page/<int:id>', endpoint='page')])
+        a = m.bind('example.com')
+        for processes in None, 2:
+            rv = a.build_many('page', [{'id': 1}, {}, {'id': 2, 'x': 'y'}],
+                              processes=processes)
+            self.assert_equal(rv[0], '/page/1')
+            assert isinstance(rv[1], r.BuildError)
+            self.assert_equal(rv[2], '/page/2?x=y')
+            rv = a.build_many('page', iter([{'id': 1}]), force_external=True,
+                              processes=processes)
+            self.assert_equal(rv, ['http://example.com/page/1'])
+
+    def test_compiled_state(self):
+        def make_rules():
+            return [
+                r.Rule('/', endpoint='index'),
+                r.Rule('/page/<int(min=1):page>', endpoint='page'),
+                r.Rule('/<any(about, help):name>/', endpoint='info'),
+                r.Rule('/files/<path:file>', endpoint='file',
+                       subdomain='static'),
+                r.Rule('/feed/<name>', build_only=True, endpoint='feed')
+            ]
+
+        m = r.Map(make_rules(), default_subdomain='www')
+        f = BytesIO()
+        m.dump_compiled(f)
+
+        rules = make_rules()
+        rules[0] = r.Rule('/index', endpoint='index')
+        m = r.Map(default_subdomain='www')
+        f.seek(0)
+        assert m.load_compiled(f)
+        m.add_many(rules)
+        assert rules[0]._regex is not None
+        for rule in rules[1:]:
+            assert rule._regex is None
+
+        a = m.bind('example.com')
+        self.assert_equal(a.match('/index'), ('index', {}))
+        self.assert_equal(a.match('/page/2'), ('page', {'page': 2}))
+        self.assert_raises(r.NotFound, lambda: a.match('/page/0'))
+        self.assert_raises(r.RequestRedirect, lambda: a.match('/about'))
+        self.assert_equal(a.build('info', {'name': 'help'}), '/help/')
+        self.assert_equal(a.build('file', {'file': 'a/b.css'}),
+                          'http://static.example.com/files/a/b.css')
+        self.assert_equal(a.build('feed', {'name': 'x'}), '/feed/x')
+        self.assert_equal(m.bind('example.com', subdomain='static')
+                          .match('/files/a/b.css'),
+                          ('file', {'file': 'a/b.css'}))
+
+        # other converters invalidate the whole file
+        m = r.Map(converters={'int': r.PathConverter})
+        f.seek(0)
+        assert not m.load_compiled(f)
+        m.add(r.Rule('/page/<int:page>', endpoint='page'))
+        self.assert_equal(m.bind('example.com').match('/page/a/b'),
+                          ('page', {'page': 'a/b'}))
+
+        # so does another charset as it is used for the static parts
+        m = r.Map([r.Rule(u'/caf\xe9/<int:id>', endpoint='cafe')])
+        f = BytesIO()
+        m.dump_compiled(f)
+        m = r.Map(charset='latin1')
+        f.seek(0)
+        assert not m.load_compiled(f)
+        m.add(r.Rule(u'/caf\xe9/<int:id>', endpoint='cafe'))
+        self.assert_equal(m.bind('example.com').build('cafe', {'id': 1}),
+                          '/caf%E9/1')
+
 
 def suite():
     suite = unittest.TestSuite()
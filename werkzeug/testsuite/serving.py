@@ -8,9 +8,14 @@
     :copyright: (c) 2011 by Armin Ronacher.
     :license: BSD, see LICENSE for more details.
 """
+import os
 import sys
 import time
+import signal
+import socket
+import tempfile
 import urllib.request, urllib.parse, urllib.error
+import http.client
 import unittest
 from functools import update_wrapper
 from io import StringIO
@@ -19,7 +24,8 @@ from werkzeug.testsuite import WerkzeugTestCase
 
 from werkzeug import __version__ as version, serving
 from werkzeug.testapp import test_app
-from threading import Thread
+import threading
+from threading import Thread, Event
 
 
 real_make_server = serving.make_server
@@ -80,6 +86,427 @@ class ServingTestCase(WerkzeugTestCase):
         rv = opener.open('http://%s/?foo=bar&baz=blah' % addr).read()
         assert b'Internal Server Error' in rv
 
+    @silencestderr
+    def test_chunked_request_body(self):
+        def echo_app(environ, start_response):
+            data = environ['wsgi.input'].read()
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', str(len(data)))])
+            return [data]
+        server, addr = run_dev_server(echo_app)
+        conn = http.client.HTTPConnection(addr)
+        conn.putrequest('POST', '/')
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+        conn.send(b'3\r\nfoo\r\n4;ext=1\r\n bar\r\n0\r\n\r\n')
+        self.assert_equal(conn.getresponse().read(), b'foo bar')
+        conn.close()
+
+    @silencestderr
+    def test_keep_alive(self):
+        def app(environ, start_response):
+            if environ['PATH_INFO'] == '/stream':
+                start_response('200 OK', [('Content-Type', 'text/plain')])
+                return [b'foo', b'', b'bar']
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '2')])
+            return [b'OK']
+        class RequestHandler(serving.WSGIRequestHandler):
+            keep_alive_timeout = 0.2
+        server = serving.make_server('localhost', 0, app,
+                                     request_handler=RequestHandler)
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        try:
+            sock = socket.create_connection(server.server_address[:2])
+            sock.sendall(b'GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         b'POST / HTTP/1.1\r\nHost: localhost\r\n'
+                         b'Content-Length: 5\r\n\r\nhello'
+                         b'HEAD / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            started = time.time()
+            data = b''
+            while 1:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            sock.close()
+            # the connection was closed by the keep alive timeout
+            self.assertTrue(time.time() - started >= 0.2)
+            responses = data.split(b'HTTP/1.1 200 OK\r\n')
+            self.assert_equal(len(responses), 5)
+            self.assertTrue(b'Transfer-Encoding: chunked' in responses[1])
+            self.assertTrue(responses[1].endswith(
+                b'\r\n\r\n3\r\nfoo\r\n3\r\nbar\r\n0\r\n\r\n'))
+            self.assertTrue(responses[2].endswith(b'\r\n\r\nOK'))
+            # the response to the HEAD request has no body
+            self.assertTrue(b'Content-Length: 2\r\n' in responses[3])
+            self.assertTrue(responses[3].endswith(b'\r\n\r\n'))
+            self.assertTrue(responses[4].endswith(b'\r\n\r\nOK'))
+
+            conn = http.client.HTTPConnection('localhost:%d' %
+                                              server.server_address[1])
+            conn.request('GET', '/stream', headers={'Connection': 'close'})
+            self.assert_equal(conn.getresponse().read(), b'foobar')
+            conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    @silencestderr
+    def test_idle_connections_of_busy_servers(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '2')])
+            return [b'OK']
+        for options in {}, {'threaded': True, 'max_threads': 1}:
+            server = serving.make_server('localhost', 0, app, **options)
+            t = Thread(target=server.serve_forever)
+            t.setDaemon(True)
+            t.start()
+            addr = 'localhost:%d' % server.server_address[1]
+            try:
+                idle = http.client.HTTPConnection(addr)
+                idle.request('GET', '/')
+                self.assert_equal(idle.getresponse().read(), b'OK')
+                # the idle connection is closed for the new one
+                started = time.time()
+                conn = http.client.HTTPConnection(addr)
+                conn.request('GET', '/')
+                self.assert_equal(conn.getresponse().read(), b'OK')
+                self.assertTrue(time.time() - started < 1)
+                conn.close()
+                idle.request('GET', '/')
+                self.assert_raises(socket.error, idle.getresponse)
+                idle.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    @silencestderr
+    def test_file_wrapper(self):
+        data = os.urandom(100000)
+        fd, filename = tempfile.mkstemp()
+        os.write(fd, data)
+        os.close(fd)
+        def app(environ, start_response):
+            f = open(filename, 'rb')
+            f.seek(10)
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '50000')])
+            return environ['wsgi.file_wrapper'](f)
+        server, addr = run_dev_server(app)
+        conn = http.client.HTTPConnection(addr)
+        try:
+            for method in 'GET', 'HEAD', 'GET':
+                conn.request(method, '/')
+                response = conn.getresponse()
+                self.assert_equal(response.getheader('Content-Length'),
+                                  '50000')
+                self.assert_equal(response.read(), method == 'GET' and
+                                  data[10:50010] or b'')
+        finally:
+            conn.close()
+            os.remove(filename)
+
+    def test_write_buffers(self):
+        server_side, client_side = socket.socketpair()
+        handler = serving.WSGIRequestHandler.__new__(serving.WSGIRequestHandler)
+        handler.connection = server_side
+        handler.server = serving.BaseWSGIServer.__new__(serving.BaseWSGIServer)
+        handler.server.ssl_context = None
+        handler.max_send_buffers = 3
+        buffers = [os.urandom(x) for x in (10, 0, 200000, 1, 70000, 5)] * 3
+        received = []
+        def receive():
+            size = sum(map(len, buffers))
+            while size:
+                received.append(client_side.recv(size))
+                size -= len(received[-1])
+        t = Thread(target=receive)
+        t.start()
+        handler.write_buffers(buffers)
+        t.join()
+        server_side.close()
+        client_side.close()
+        self.assert_equal(b''.join(received), b''.join(buffers))
+
+    @silencestderr
+    def test_asyncio_server(self):
+        def app(environ, start_response):
+            if environ['PATH_INFO'] == '/stream':
+                start_response('200 OK', [('Content-Type', 'text/plain')])
+                return iter([b'foo', b'', b'bar'])
+            if environ['PATH_INFO'] == '/static':
+                start_response('200 OK', [('Content-Type', 'text/plain'),
+                                          ('Content-Length', '2')])
+                return [b'OK']
+            data = environ['wsgi.input'].read()
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', str(len(data)))])
+            return [data]
+        server = serving.make_server('localhost', 0, app, use_asyncio=True,
+                                     max_threads=2)
+        self.assertTrue(isinstance(server, serving.AsyncioWSGIServer))
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        addr = 'localhost:%d' % server.server_address[1]
+        try:
+            sock = socket.create_connection(server.server_address[:2])
+            sock.sendall(b'GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         b'POST / HTTP/1.1\r\nHost: localhost\r\n'
+                         b'Transfer-Encoding: chunked\r\n\r\n'
+                         b'3\r\nfoo\r\n4\r\n bar\r\n0\r\n\r\n'
+                         b'HEAD /static HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                         b'POST / HTTP/1.1\r\nHost: localhost\r\n'
+                         b'Content-Length: 5\r\nConnection: close\r\n\r\n'
+                         b'hello')
+            data = b''
+            while 1:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            sock.close()
+            responses = data.split(b'HTTP/1.1 200 OK\r\n')
+            self.assert_equal(len(responses), 5)
+            self.assertTrue(responses[1].endswith(
+                b'\r\n\r\n3\r\nfoo\r\n3\r\nbar\r\n0\r\n\r\n'))
+            self.assertTrue(responses[2].endswith(b'\r\n\r\nfoo bar'))
+            self.assertTrue(b'Content-Length: 2\r\n' in responses[3])
+            self.assertTrue(responses[3].endswith(b'\r\n\r\n'))
+            self.assertTrue(responses[4].endswith(b'\r\n\r\nhello'))
+
+            # idle connections don't need threads
+            threads = threading.active_count()
+            conns = []
+            for x in range(50):
+                conn = http.client.HTTPConnection(addr)
+                conn.request('POST', '/', body=b'x' * 100000)
+                self.assert_equal(len(conn.getresponse().read()), 100000)
+                conns.append(conn)
+            self.assert_equal(len(server.connections), 50)
+            self.assertTrue(threading.active_count() <= threads + 2)
+            for conn in conns:
+                conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        t.join(5)
+        self.assertTrue(not t.is_alive())
+
+    @silencestderr
+    def test_thread_pool(self):
+        started = Event()
+        done = Event()
+        def app(environ, start_response):
+            if environ['PATH_INFO'] == '/wait':
+                started.set()
+                done.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '2')])
+            return [b'OK']
+        server = serving.make_server('localhost', 0, app, threaded=True,
+                                     max_threads=1, backlog=1)
+        self.assertTrue(isinstance(server, serving.ThreadPoolWSGIServer))
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        addr = 'localhost:%d' % server.socket.getsockname()[1]
+        try:
+            busy = http.client.HTTPConnection(addr)
+            busy.request('GET', '/wait')
+            self.assertTrue(started.wait(5))
+            queued = http.client.HTTPConnection(addr)
+            queued.request('GET', '/')
+            for x in range(50):
+                if server.get_stats()['queued'] == 1:
+                    break
+                time.sleep(0.01)
+            self.assert_equal(server.get_stats()['busy'], 1)
+            self.assert_equal(server.get_stats()['queued'], 1)
+
+            refused = http.client.HTTPConnection(addr)
+            refused.request('GET', '/')
+            response = refused.getresponse()
+            self.assert_equal(response.status, 503)
+            self.assertTrue(b'Service Unavailable' in response.read())
+            self.assert_equal(server.get_stats()['rejected'], 1)
+
+            done.set()
+            self.assert_equal(busy.getresponse().read(), b'OK')
+            # the worker waits for the next request until it's closed
+            busy.close()
+            self.assert_equal(queued.getresponse().read(), b'OK')
+            queued.close()
+            refused.close()
+        finally:
+            done.set()
+            server.shutdown()
+            server.server_close()
+
+    def test_thread_pool_limits(self):
+        self.assert_raises(ValueError, serving.ThreadPoolWSGIServer,
+                           'localhost', 0, None, max_threads=1, backlog=-1)
+
+        started = Event()
+        done = Event()
+        def app(environ, start_response):
+            started.set()
+            done.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '2')])
+            return [b'OK']
+        server = serving.make_server('localhost', 0, app, threaded=True,
+                                     max_threads=1, backlog=0)
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        addr = 'localhost:%d' % server.socket.getsockname()[1]
+        try:
+            busy = http.client.HTTPConnection(addr)
+            busy.request('GET', '/')
+            self.assertTrue(started.wait(5))
+            # without a backlog a connection is refused if no thread is free
+            refused = http.client.HTTPConnection(addr)
+            refused.request('GET', '/')
+            self.assert_equal(refused.getresponse().status, 503)
+            refused.close()
+        finally:
+            done.set()
+            server.shutdown()
+            server.server_close()
+        busy.close()
+
+        started.clear()
+        done.clear()
+        server = serving.make_server('localhost', 0, app, threaded=True,
+                                     max_threads=1, backlog=2)
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        addr = 'localhost:%d' % server.socket.getsockname()[1]
+        try:
+            busy = http.client.HTTPConnection(addr)
+            busy.request('GET', '/')
+            self.assertTrue(started.wait(5))
+            queued = []
+            for x in range(2):
+                conn = http.client.HTTPConnection(addr)
+                conn.request('GET', '/')
+                queued.append(conn)
+            for x in range(50):
+                if server.get_stats()['queued'] == 2:
+                    break
+                time.sleep(0.01)
+            self.assert_equal(server.get_stats()['queued'], 2)
+            server.shutdown()
+            # the queued connections are closed, the busy one is finished
+            closer = Thread(target=server.server_close)
+            closer.start()
+            for x in range(50):
+                if server.get_stats()['queued'] == 0:
+                    break
+                time.sleep(0.01)
+            done.set()
+            self.assert_equal(busy.getresponse().read(), b'OK')
+            busy.close()
+            closer.join(5)
+            self.assertTrue(not closer.is_alive())
+            for conn in queued:
+                self.assert_raises(socket.error, conn.getresponse)
+                conn.close()
+        finally:
+            done.set()
+            server.server_close()
+        busy.close()
+
+    @silencestderr
+    def test_prefork(self):
+        if not hasattr(os, 'fork'):
+            return
+        def app(environ, start_response):
+            pid = str(os.getpid()).encode('ascii')
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', str(len(pid)))])
+            return [pid]
+        server = serving.make_server('localhost', 0, app, processes=2,
+                                     prefork=True, max_requests=1)
+        self.assertTrue(isinstance(server, serving.PreforkWSGIServer))
+        t = Thread(target=server.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        addr = 'localhost:%d' % server.server_address[1]
+        try:
+            pids = set()
+            for x in range(4):
+                conn = http.client.HTTPConnection(addr)
+                conn.request('GET', '/')
+                pids.add(int(conn.getresponse().read()))
+                conn.close()
+            self.assert_equal(len(pids), 4)
+            self.assertTrue(os.getpid() not in pids)
+        finally:
+            server.shutdown()
+            t.join(5)
+            server.server_close()
+        self.assert_equal(server.workers, {})
+
+    @silencestderr
+    def test_prefork_leaves_other_children(self):
+        if not hasattr(os, 'fork'):
+            return
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Length', '0')])
+            return []
+        server = serving.make_server('localhost', 0, app, processes=1,
+                                     prefork=True)
+        handler = signal.getsignal(signal.SIGTERM)
+        child = os.fork()
+        if not child:
+            os._exit(3)
+        timer = threading.Timer(0.5, server.shutdown)
+        timer.start()
+        try:
+            server.serve_forever()
+        finally:
+            timer.join()
+            server.server_close()
+        # the exit status of the child is not reaped by the server
+        self.assert_equal(os.waitpid(child, 0)[1] >> 8, 3)
+        self.assertTrue(signal.getsignal(signal.SIGTERM) is handler)
+
+
+    @silencestderr
+    def test_prefork_shutdown_from_worker(self):
+        if not hasattr(os, 'fork'):
+            return
+        def app(environ, start_response):
+            environ['werkzeug.server.shutdown']()
+            start_response('200 OK', [('Content-Length', '0')])
+            return []
+        server = serving.make_server('localhost', 0, app, processes=1,
+                                     prefork=True)
+        handler = signal.getsignal(signal.SIGTERM)
+        def request():
+            conn = http.client.HTTPConnection('localhost:%d' %
+                                              server.server_address[1])
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+        t = Thread(target=request)
+        t.start()
+        try:
+            # returns normally instead of raising SystemExit
+            server.serve_forever()
+        finally:
+            t.join(5)
+            server.server_close()
+        self.assert_equal(server.workers, {})
+        self.assertTrue(signal.getsignal(signal.SIGTERM) is handler)
 
 def suite():
     suite = unittest.TestSuite()
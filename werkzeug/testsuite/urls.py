@@ -43,6 +43,23 @@ class URLsTestCase(WerkzeugTestCase):
         x = urls.url_decode('%C3%9Ch=H%C3%A4nsel', decode_keys=True)
         assert x['Üh'] == 'Hänsel'
 
+    def test_url_decoding_without_escapes(self):
+        for qs in 'a=1&b=foo+bar&&c&=d', 'a=1&b=foo%20bar&&c&=d':
+            x = urls.url_decode(qs)
+            self.assert_equal(list(x.items(multi=True)),
+                              [('a', '1'), ('b', 'foo bar'), ('c', ''), ('', 'd')])
+            x = urls.url_decode(qs, include_empty=False)
+            self.assert_equal(list(x.keys()), ['a', 'b', ''])
+        x = urls.url_decode('a=\xe4', charset='latin1')
+        self.assert_equal(x['a'], '\xe4')
+
+    def test_quoting_tables(self):
+        self.assert_equal(urls.url_quote('a b/c:d?', safe='/'), 'a%20b/c%3Ad%3F')
+        self.assert_equal(urls.url_quote('a b/c:d?', safe=' ?'), 'a b%2Fc%3Ad?')
+        self.assert_equal(urls.url_quote_plus('a b+c/d', safe=b'/'), 'a+b%2Bc/d')
+        self.assert_equal(urls.url_quote_plus('a b', safe=b' '), 'a+b')
+        self.assert_equal(urls.url_unquote('%41%zz%4%c3%a4'), 'A%zz%4\xe4')
+
     def test_streamed_url_decoding(self):
         item1 = 'a' * 100000
         item2 = 'b' * 400
@@ -55,6 +72,39 @@ class URLsTestCase(WerkzeugTestCase):
             self.assert_equal(next(gen), ('c', item2))
             self.assert_raises(StopIteration, gen.__next__)
 
+    def test_incremental_url_decoding(self):
+        data = b'a=%C3%A4+b&empty&&c=%41%4x&d=' + b'x' * 1000 + b'&=e'
+        decoder = urls.IncrementalURLDecoder()
+        events = []
+        for idx in range(len(data)):
+            events.extend(decoder.feed(data[idx:idx + 1]))
+        events.extend(decoder.close())
+        pairs = []
+        for event, value in events:
+            if event == 'key':
+                pairs.append([value, b''])
+            elif event == 'value':
+                pairs[-1][1] += value
+        self.assert_equal(pairs, [['a', '\xe4 b'.encode('utf-8')],
+                                  ['empty', b''], ['c', b'A%4x'],
+                                  ['d', b'x' * 1000], ['', b'e']])
+
+        gen = urls.iter_url_decode_stream(BytesIO(data), limit=len(data),
+                                          include_empty=False, buffer_size=7)
+        key, chunks = next(gen)
+        self.assert_equal(key, 'a')
+        self.assert_equal(b''.join(chunks), '\xe4 b'.encode('utf-8'))
+        self.assert_equal(next(gen)[0], 'c')
+        key, chunks = next(gen)
+        self.assert_equal(key, 'd')
+        chunk = next(chunks)
+        self.assertTrue(0 < len(chunk) < 1000)
+        self.assert_equal(chunk, b'x' * len(chunk))
+        key, chunks = next(gen)
+        self.assert_equal(key, '')
+        self.assert_equal(list(chunks), [b'e'])
+        self.assert_raises(StopIteration, gen.__next__)
+
     def test_url_encoding(self):
         assert urls.url_encode({'foo': 'bar 45'}) == 'foo=bar+45'
         d = {'foo': 1, 'bar': 23, 'blah': 'Hänsel'}
@@ -19,6 +19,7 @@ from werkzeug import wrappers
 from werkzeug.datastructures import MultiDict, ImmutableOrderedMultiDict, \
      ImmutableList, ImmutableTypeConversionDict, CharsetAccept, \
      CombinedMultiDict
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.test import Client, create_environ, run_wsgi_app
 
 
@@ -483,6 +484,27 @@ class WrappersTestCase(WerkzeugTestCase):
         assert req.data == data
         assert isinstance(req.stream, wrappers.LimitedStream)
 
+    def test_chunked_request_body(self):
+        data = b'9\r\nfoo=bar&b\r\n5\r\naz=42\r\n0\r\n\r\n'
+        environ = create_environ(input_stream=BytesIO(data), method='POST',
+                                 content_type='application/x-www-form-urlencoded')
+        environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        req = wrappers.Request(environ)
+        self.assert_equal(req.form['foo'], 'bar')
+        self.assert_equal(req.form['baz'], '42')
+
+        environ = create_environ(input_stream=BytesIO(data), method='PUT',
+                                 content_type='text/plain')
+        environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        req = wrappers.Request(environ)
+        self.assert_equal(req.stream.read(), b'foo=bar&baz=42')
+
+        environ = create_environ(input_stream=BytesIO(data), method='GET')
+        environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        req = wrappers.Request(environ)
+        req.max_content_length = 10
+        self.assert_raises(RequestEntityTooLarge, req.stream.read)
+
     def test_urlfication(self):
         resp = wrappers.Response()
         resp.headers['Location'] = 'http://üser:pässword@☃.net/påth'
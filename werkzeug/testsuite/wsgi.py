@@ -18,7 +18,8 @@ from io import BytesIO
 from werkzeug.testsuite import WerkzeugTestCase
 
 from werkzeug.wrappers import BaseResponse
-from werkzeug.exceptions import BadRequest, ClientDisconnected
+from werkzeug.exceptions import BadRequest, ClientDisconnected, \
+     RequestEntityTooLarge
 from werkzeug.test import Client, create_environ, run_wsgi_app
 from werkzeug import wsgi
 import collections
@@ -148,6 +149,34 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         stream = wsgi.LimitedStream(io, 3)
         self.assert_equal(stream.read(-1), b'123')
 
+    def test_limited_stream_readinto(self):
+        class NoReadinto(object):
+            def __init__(self, data):
+                self.read = BytesIO(data).read
+                self.readline = None
+
+        for io in BytesIO(b'123456'), NoReadinto(b'123456'):
+            stream = wsgi.LimitedStream(io, 5)
+            buffer = bytearray(2)
+            self.assert_equal(stream.readinto(buffer), 2)
+            self.assert_equal(buffer, b'12')
+            self.assert_equal(stream.read_view(buffer), b'34')
+            self.assert_equal(stream.read_view(buffer), b'5')
+            self.assert_equal(stream.tell(), 5)
+            self.assert_equal(stream.readinto(buffer), 0)
+
+        stream = wsgi.LimitedStream(BytesIO(b'123'), 5)
+        with self.assert_raises(ClientDisconnected):
+            stream.readinto(bytearray(5))
+
+        data = b'abc\r\ndef'
+        read = wsgi.make_chunk_iter_func(BytesIO(data), len(data), 4, True)
+        first = read()
+        self.assertTrue(isinstance(first, memoryview))
+        self.assert_equal(bytes(first), b'abc\r')
+        self.assert_equal(read(), b'\ndef')
+        self.assert_equal(read(), b'')
+
     def test_limited_stream_disconnection(self):
         io = BytesIO(b'A bit of content')
 
@@ -163,6 +192,55 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         with self.assert_raises(ClientDisconnected):
             stream.read()
 
+    def test_chunked_input_stream(self):
+        data = b'4\r\nabc\n\r\n6;name=value\r\ndef\r\ng\r\n0\r\nFoo: bar\r\n\r\nnext'
+        io = BytesIO(data)
+        stream = wsgi.ChunkedInputStream(io)
+        self.assert_equal(stream.readline(), b'abc\n')
+        self.assert_equal(stream.read(2), b'de')
+        self.assert_equal(stream.read(), b'f\r\ng')
+        self.assert_equal(stream.read(), b'')
+        self.assertTrue(stream.is_exhausted)
+        self.assert_equal(stream.tell(), 10)
+        self.assert_equal(io.read(), b'next')
+
+        stream = wsgi.ChunkedInputStream(BytesIO(data))
+        self.assert_equal(list(stream), [b'abc\n', b'def\r\n', b'g'])
+        stream = wsgi.ChunkedInputStream(BytesIO(data))
+        buffer = bytearray(5)
+        self.assert_equal(stream.read_view(buffer), b'abc\nd')
+        self.assert_equal(stream.read_view(buffer), b'ef\r\ng')
+        self.assert_equal(stream.readinto(buffer), 0)
+        lines = wsgi.make_line_iter(wsgi.ChunkedInputStream(BytesIO(data)))
+        self.assert_equal(list(lines), [b'abc\n', b'def\r\n', b'g'])
+
+        stream = wsgi.ChunkedInputStream(BytesIO(data), max_size=8)
+        self.assert_equal(stream.read(4), b'abc\n')
+        self.assert_raises(RequestEntityTooLarge, stream.read)
+        stream.exhaust()
+        self.assert_equal(stream.read(), b'')
+        for data in b'x\r\nabc', b'4\r\nabcdef\r\n0\r\n\r\n':
+            stream = wsgi.ChunkedInputStream(BytesIO(data))
+            self.assert_raises(BadRequest, stream.read)
+        # chunk sizes that int() accepts but proxies might not
+        for size in b'0x10', b'+a', b'-1', b'1_0', b' a', b'a ', b'a ;x', b'':
+            stream = wsgi.ChunkedInputStream(BytesIO(size + b'\r\n' +
+                                                     b'x' * 16 + b'\r\n'))
+            self.assert_raises(BadRequest, stream.read)
+        stream = wsgi.ChunkedInputStream(BytesIO(b'4\r\nab'))
+        self.assert_raises(ClientDisconnected, stream.read)
+
+    def test_wrap_chunked_input(self):
+        environ = create_environ(input_stream=BytesIO(b'3\r\nfoo\r\n0\r\n\r\n'))
+        self.assert_equal(wsgi.wrap_chunked_input(environ), None)
+        environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        stream = wsgi.wrap_chunked_input(environ, 100)
+        self.assertTrue(environ['wsgi.input'] is stream)
+        self.assertTrue(environ['wsgi.input_terminated'])
+        self.assertTrue(wsgi.wrap_chunked_input(environ, 10) is stream)
+        self.assert_equal(stream.max_size, 10)
+        self.assert_equal(stream.read(), b'foo')
+
     def test_path_info_extraction(self):
         x = wsgi.extract_path_info('http://example.com/app', '/app/hello')
         self.assert_equal(x, '/hello')
@@ -237,6 +315,13 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         rv = list(wsgi.make_chunk_iter(test_stream, 'X', limit=len(data), buffer_size=4))
         self.assert_equal(rv, [b'abcdef', b'ghijkl', b'mnopqrstuvwxyz', b'ABCDEFGHIJK'])
 
+    def test_make_chunk_iter_separator_on_buffer_edge(self):
+        data = b'abc<>defg<>hi<>'
+        for bufsize in range(1, 10):
+            rv = list(wsgi.make_chunk_iter(BytesIO(data), '<>', limit=len(data),
+                                           buffer_size=bufsize))
+            self.assert_equal(rv, [b'abc', b'defg', b'hi', b''])
+
     def test_lines_longer_buffer_size(self):
         data = b'1234567890\n1234567890\n'
         for bufsize in range(1, 15):
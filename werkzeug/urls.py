@@ -9,11 +9,12 @@
     :license: BSD, see LICENSE for more details.
 """
 import io
+import re
 import urllib.parse
 
 from werkzeug._internal import _decode_unicode
 from werkzeug.datastructures import MultiDict, iter_multi_items
-from werkzeug.wsgi import make_chunk_iter
+from werkzeug.wsgi import make_chunk_iter, make_chunk_iter_func
 
 
 #: list of characters that are always safe in URLs.
@@ -25,31 +26,49 @@ for i in range(0x100):
     if i not in _safe_map:
         _safe_map[i] = '%%%02X' % i
 _safe_map.update((i, '%%%02X' % i) for i in range(0x80, 0x100))
-_safemaps = {}
+_quote_tables = {}
 
-#: lookup table for encoded characters.
+#: lookup table for encoded characters.  The bytes are stored as latin1
+#: characters so that the unquoted string is encoded once.
 _hexdig = '0123456789ABCDEFabcdef'
-_hextochr = dict((a + b, bytes([int(a + b, 16)]))
+_hextochr = dict((a + b, chr(int(a + b, 16)))
                  for a in _hexdig for b in _hexdig)
 
+#: ascii compatible charsets by name, see :func:`_is_ascii_compatible`.
+_ascii_compatible = {}
 
-def _quote(s, safe=b'/', _join=''.join):
+#: finds the first non ASCII character, `str.isascii` needs Python 3.7.
+_find_non_ascii = re.compile('[\x80-\U0010ffff]').search
+
+
+def _get_quote_table(safe, plus=False):
+    """Returns a table for :meth:`str.translate` that maps the 256 latin1
+    characters to their quoted form, and the space to a plus if `plus` is
+    set.  The tables are cached by `safe`.
+    """
+    try:
+        return _quote_tables[safe, plus]
+    except KeyError:
+        table = [_safe_map[c] for c in range(0x100)]
+        for c in safe:
+            table[c] = chr(c)
+        if plus:
+            table[ord(' ')] = '+'
+        _quote_tables[safe, plus] = table
+        return table
+
+
+def _quote(s, safe=b'/'):
     assert isinstance(s, bytes), 'quote only works on bytes'
     if not s or not s.rstrip(_always_safe + safe):
         return s.decode('ascii')
-    try:
-        quoter = _safemaps[safe]
-    except KeyError:
-        safe_map = _safe_map.copy()
-        safe_map.update([(c, chr(c)) for c in safe])
-        _safemaps[safe] = quoter = safe_map.__getitem__
-    return _join(map(quoter, s))
+    return s.decode('latin1').translate(_get_quote_table(safe))
 
 
 def _quote_plus(s, safe=b''):
-    if b' ' in s:
-        return _quote(s, safe + b' ').replace(' ', '+')
-    return _quote(s, safe)
+    if not s or (b' ' not in s and not s.rstrip(_always_safe + safe)):
+        return s.decode('ascii')
+    return s.decode('latin1').translate(_get_quote_table(safe, True))
 
 
 def _safe_urlsplit(s):
@@ -73,16 +92,18 @@ def _unquote(s, unsafe=b''):
     rv = s.split('%')
     if len(rv) == 1:
         return s.encode('latin1')
-    s = rv[0].encode('ascii')
+    unsafe = unsafe.decode('latin1')
+    result = [rv[0]]
+    append = result.append
     for item in rv[1:]:
-        try:
-            char = _hextochr[item[:2]]
-            if char in unsafe:
-                raise KeyError()
-            s += char + item[2:].encode('ascii')
-        except KeyError:
-            s += b'%' + item.encode('ascii')
-    return s
+        char = _hextochr.get(item[:2])
+        if char is None or char in unsafe:
+            append('%')
+            append(item)
+        else:
+            append(char)
+            append(item[2:])
+    return ''.join(result).encode('latin1')
 
 
 def _unquote_plus(s):
@@ -235,8 +256,8 @@ def url_decode(s, charset='utf-8', decode_keys=False, include_empty=True,
     """
     if cls is None:
         cls = MultiDict
-    return cls(_url_decode_impl(str(s).split(separator), charset, decode_keys,
-                                include_empty, errors))
+    return cls(_url_decode_string(str(s), separator, charset, decode_keys,
+                                  include_empty, errors))
 
 
 def url_decode_stream(stream, charset='utf-8', decode_keys=False,
@@ -286,6 +307,229 @@ def url_decode_stream(stream, charset='utf-8', decode_keys=False,
                                 include_empty, errors))
 
 
+def iter_url_decode_stream(stream, charset='utf-8', decode_keys=False,
+                           include_empty=True, errors='replace',
+                           separator=b'&', limit=None, buffer_size=10 * 1024):
+    """Works like :func:`url_decode_stream` but does not keep the values
+    in memory.  It yields ``(key, chunks)`` pairs where `chunks` is an
+    iterator over the unquoted bytes of the value as they are read from
+    the stream.  The bytes are not decoded from the `charset` because a
+    chunk might end in the middle of a character.  The chunks have to be
+    consumed before the next pair is requested, otherwise the rest of the
+    value is skipped::
+
+        for key, chunks in iter_url_decode_stream(stream):
+            with open(key, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+
+    .. versionadded:: 0.9
+
+    :param stream: a binary stream with the encoded querystring
+    :param charset: the charset of the query string.
+    :param decode_keys: set to `True` if you want the keys to be decoded
+                        as well.
+    :param include_empty: Set to `False` if you don't want empty values to
+                          appear.
+    :param errors: the decoding error behavior.
+    :param separator: the pair separator to be used, defaults to ``&``
+    :param limit: the content length of the URL data.  Not necessary if
+                  a limited stream is provided.
+    :param buffer_size: the number of bytes read from the stream at once.
+    """
+    decoder = IncrementalURLDecoder(charset, errors, separator,
+                                    decode_keys, include_empty)
+    read = make_chunk_iter_func(stream, limit, buffer_size)
+
+    def iter_events():
+        for data in iter(read, b''):
+            for event in decoder.feed(data):
+                yield event
+        for event in decoder.close():
+            yield event
+    events = iter_events()
+
+    def iter_value():
+        for event, value in events:
+            if event == 'end':
+                break
+            yield value
+
+    for event, key in events:
+        if event == 'key':
+            chunks = iter_value()
+            yield key, chunks
+            # skip whatever the caller did not consume
+            for chunk in chunks:
+                pass
+
+
+class IncrementalURLDecoder(object):
+    """Decodes url encoded data that is fed in chunks of any size without
+    buffering the values.  Only the keys are kept until they are complete.
+    The events are tuples in the form ``('key', key)`` when a key is
+    complete, ``('value', data)`` for the unquoted bytes of the value as
+    they arrive and ``('end', None)`` at the end of the pair.  Pairs
+    without a value have no ``'value'`` events.
+
+    >>> decoder = IncrementalURLDecoder()
+    >>> decoder.feed(b'foo=Hello+W%')
+    [('key', 'foo'), ('value', b'Hello W')]
+    >>> decoder.feed(b'C3%B6rld&bar')
+    [('value', b'\\xc3\\xb6rld'), ('end', None)]
+    >>> decoder.close()
+    [('key', 'bar'), ('end', None)]
+
+    .. versionadded:: 0.9
+
+    :param charset: the charset of the keys if `decode_keys` is set.
+    :param errors: the decoding error behavior.
+    :param separator: the pair separator to be used, defaults to ``&``
+    :param decode_keys: set to `True` if you want the keys to be decoded
+                        from the `charset`.
+    :param include_empty: Set to `False` if pairs without ``=`` should be
+                          skipped.
+    """
+
+    def __init__(self, charset='utf-8', errors='replace', separator=b'&',
+                 decode_keys=False, include_empty=True):
+        self.charset = charset
+        self.errors = errors
+        self.separator = separator
+        self.decode_keys = decode_keys
+        self.include_empty = include_empty
+        #: the number of bytes buffered for the key that is not complete
+        #: yet.  Keys are not limited so this can be checked after
+        #: feeding data.
+        self.buffered_size = 0
+        # the parts of the current key or `None` while in a value
+        self._key = []
+        # a partial separator or escape from the end of the last chunk
+        self._tail = b''
+
+    def feed(self, data):
+        """Decodes the next chunk of data and returns the events."""
+        data = self._tail + data
+        separator = self.separator
+        events = []
+        pos = 0
+        while 1:
+            end = data.find(separator, pos)
+            if self._key is None:
+                if end == -1:
+                    keep = self._get_tail_size(data, pos, True)
+                    self._add_value(events, data[pos:len(data) - keep])
+                    self._tail = data[len(data) - keep:]
+                    break
+                self._add_value(events, data[pos:end])
+                events.append(('end', None))
+                self._key = []
+            else:
+                eq = data.find(b'=', pos, len(data) if end == -1 else end)
+                if eq != -1:
+                    self._key.append(data[pos:eq])
+                    self._add_key(events)
+                    self._key = None
+                    pos = eq + 1
+                    continue
+                if end == -1:
+                    keep = self._get_tail_size(data, pos, False)
+                    self._key.append(data[pos:len(data) - keep])
+                    self.buffered_size += len(data) - keep - pos
+                    self._tail = data[len(data) - keep:]
+                    break
+                self._key.append(data[pos:end])
+                self._end_key_without_value(events)
+            pos = end + len(separator)
+        return events
+
+    def close(self):
+        """Signals the end of the data and returns the remaining events."""
+        data = self._tail
+        self._tail = b''
+        events = []
+        if self._key is None:
+            self._add_value(events, data)
+            events.append(('end', None))
+        else:
+            self._key.append(data)
+            self._end_key_without_value(events)
+        self._key = []
+        return events
+
+    def _get_tail_size(self, data, pos, in_value):
+        """The number of bytes at the end of the data that have to wait
+        for the next chunk because they could be the start of a separator
+        or an escape in a value.
+        """
+        size = len(data) - pos
+        for keep in range(min(len(self.separator) - 1, size), 0, -1):
+            if data.endswith(self.separator[:keep]):
+                break
+        else:
+            keep = 0
+        if in_value:
+            escape = data.find(b'%', max(len(data) - 2, pos))
+            if escape != -1:
+                keep = max(keep, len(data) - escape)
+        return keep
+
+    def _add_value(self, events, data):
+        if not data:
+            return
+        if b'%' in data or b'+' in data:
+            data = _unquote(data.decode('latin1').replace('+', ' '))
+        events.append(('value', bytes(data)))
+
+    def _add_key(self, events):
+        key = _unquote(b''.join(self._key).decode('latin1').replace('+', ' '))
+        if self.decode_keys:
+            key = _decode_unicode(key, self.charset, self.errors)
+        else:
+            # XXX: Python 2 behaviour
+            key = _decode_unicode(key, 'ascii', self.errors)
+        self.buffered_size = 0
+        events.append(('key', key))
+
+    def _end_key_without_value(self, events):
+        if any(self._key) and self.include_empty:
+            self._add_key(events)
+            events.append(('end', None))
+        self._key = []
+        self.buffered_size = 0
+
+
+def _is_ascii_compatible(charset):
+    """Checks if the ASCII characters decode to themselves in the charset."""
+    try:
+        return _ascii_compatible[charset]
+    except KeyError:
+        ascii = bytes(range(0x80))
+        try:
+            rv = ascii.decode(charset) == ascii.decode('ascii')
+        except (LookupError, UnicodeError):
+            rv = False
+        _ascii_compatible[charset] = rv
+        return rv
+
+
+def _url_decode_string(s, separator, charset, decode_keys, include_empty,
+                       errors):
+    """Decodes a whole query string.  If it has no escapes and only ASCII
+    characters nothing has to be unquoted or decoded, so the pairs are
+    just split.  Otherwise they are decoded one by one.
+    """
+    if '%' in s or _find_non_ascii(s) or not _is_ascii_compatible(charset):
+        return _url_decode_impl(s.split(separator), charset, decode_keys,
+                                include_empty, errors)
+    rv = []
+    for pair in s.replace('+', ' ').split(separator):
+        key, has_value, value = pair.partition('=')
+        if has_value or (pair and include_empty):
+            rv.append((key, value))
+    return rv
+
+
 def _url_decode_impl(pair_iter, charset, decode_keys, include_empty,
                      errors):
     for pair in pair_iter:
@@ -293,20 +537,16 @@ def _url_decode_impl(pair_iter, charset, decode_keys, include_empty,
             continue
         if isinstance(pair, bytes):
             pair = pair.decode('ascii')
-        if '=' in pair:
-            key, value = pair.split('=', 1)
-        else:
-            if not include_empty:
-                continue
-            key = pair
-            value = ''
-        key = _unquote_plus(key)
+        key, has_value, value = pair.replace('+', ' ').partition('=')
+        if not has_value and not include_empty:
+            continue
+        key = _unquote(key)
         if decode_keys:
             key = _decode_unicode(key, charset, errors)
         else:
             # XXX: Python 2 behaviour
             key = _decode_unicode(key, 'ascii', errors)
-        yield key, url_unquote_plus(value, charset, errors)
+        yield key, _decode_unicode(_unquote(value), charset, errors)
 
 
 def url_encode(obj, charset='utf-8', encode_keys=False, sort=False, key=None,
@@ -366,20 +606,33 @@ def _url_encode_impl(obj, charset, encode_keys, sort, key):
     if sort:
         _key = lambda item: [str(_) for _ in item]
         iterable = sorted(iterable, key=key or _key)
+    # quote like _quote and _quote_plus but without the function calls.
+    # The strings are quoted as latin1 strings and ASCII strings are the
+    # same in every ascii compatible charset.
+    key_table = _get_quote_table(b'/')
+    value_table = _get_quote_table(b'', True)
+    ascii_compatible = _is_ascii_compatible(charset)
     for key, value in iterable:
         if value is None:
             continue
         if encode_keys and isinstance(key, str):
-            key = key.encode(charset)
+            key = key.encode(charset).decode('latin1')
         else:
-            key = str(key).encode('ascii')
+            key = str(key)
+            if _find_non_ascii(key):
+                # only ASCII keys are supported without encode_keys
+                key.encode('ascii')
         if isinstance(value, str):
-            value = value.encode(charset)
+            if not ascii_compatible or _find_non_ascii(value):
+                value = value.encode(charset).decode('latin1')
         elif isinstance(value, bytes):
-            pass
+            value = value.decode('latin1')
         else:
-            value = str(value).encode('ascii')
-        yield '%s=%s' % (_quote(key), _quote_plus(value))
+            value = str(value)
+            if _find_non_ascii(value):
+                value.encode('ascii')
+        yield '%s=%s' % (key.translate(key_table),
+                         value.translate(value_table))
 
 
 def url_quote(s, charset='utf-8', safe='/:'):
@@ -36,12 +36,12 @@ from werkzeug.formparser import FormDataParser, default_stream_factory
 from werkzeug.utils import cached_property, environ_property, \
      header_property, get_content_type
 from werkzeug.wsgi import get_current_url, get_host, LimitedStream, \
-     ClosingIterator
+     ClosingIterator, wrap_chunked_input
 from werkzeug.datastructures import MultiDict, CombinedMultiDict, Headers, \
      EnvironHeaders, ImmutableMultiDict, ImmutableTypeConversionDict, \
      ImmutableList, MIMEAccept, CharsetAccept, LanguageAccept, \
      ResponseCacheControl, RequestCacheControl, CallbackDict, \
-     ContentRange
+     ContentRange, iter_multi_items
 from werkzeug._internal import _empty_stream, \
      _patch_wrapper, _get_environ
 
@@ -124,6 +124,9 @@ class BaseRequest(object):
     #: :attr:`form` or :attr:`files` attribute is accessed and the
     #: parsing fails because more than the specified value is transmitted
     #: a :exc:`~werkzeug.exceptions.RequestEntityTooLarge` exception is raised.
+    #: Bodies sent with ``Transfer-Encoding: chunked`` are decoded by a
+    #: :class:`~werkzeug.wsgi.ChunkedInputStream` that raises it while the
+    #: body is read.
     #:
     #: Have a look at :ref:`dealing-with-request-data` for more details.
     #:
@@ -141,6 +144,35 @@ class BaseRequest(object):
     #: .. versionadded:: 0.5
     max_form_memory_size = None
 
+    #: the maximum size of uploaded files.  This is forwarded to the form
+    #: data parsing function (:func:`parse_form_data`).  When set and the
+    #: :attr:`form` or :attr:`files` attribute is accessed and a file is
+    #: bigger than the specified value a
+    #: :exc:`~werkzeug.exceptions.RequestEntityTooLarge` exception is raised.
+    #:
+    #: .. versionadded:: 0.9
+    max_file_size = None
+
+    #: the maximum size of url encoded form values that are kept in
+    #: memory.  This is forwarded to the form data parsing function
+    #: (:func:`parse_form_data`).  When set url encoded values that are
+    #: bigger are written to the stream of :meth:`_get_file_stream` and
+    #: put into :attr:`files` instead of :attr:`form`.
+    #:
+    #: .. versionadded:: 0.9
+    max_value_memory_size = None
+
+    #: an optional function that returns a sink to stream an uploaded file
+    #: to instead of spooling it with :meth:`_get_file_stream`.  It's called
+    #: with the name of the field, the filename and the headers of the part
+    #: and can be set on the request before the :attr:`form` or
+    #: :attr:`files` attribute is accessed or be implemented as method.
+    #: Have a look at :class:`~werkzeug.formparser.FormDataParser` for the
+    #: details.
+    #:
+    #: .. versionadded:: 0.9
+    file_handler = None
+
     #: the class to use for `args` and `form`.  The default is an
     #: :class:`~werkzeug.datastructures.ImmutableMultiDict` which supports
     #: multiple values per key.  alternatively it makes sense to use an
@@ -294,7 +326,11 @@ class BaseRequest(object):
                                            self.encoding_errors,
                                            self.max_form_memory_size,
                                            self.max_content_length,
-                                           self.parameter_storage_class)
+                                           self.parameter_storage_class,
+                                           file_handler=self.file_handler,
+                                           max_file_size=self.max_file_size,
+                                           max_value_memory_size=
+                                               self.max_value_memory_size)
 
     def _load_form_data(self):
         """Method used internally to retrieve submitted data.  After calling
@@ -321,7 +357,11 @@ class BaseRequest(object):
             # guard the incoming stream, no matter what request method is
             # used.
             content_length = self.headers.get('content-length', type=int)
-            if content_length is not None:
+            chunked_stream = wrap_chunked_input(self.environ,
+                                                self.max_content_length)
+            if chunked_stream is not None:
+                stream = chunked_stream
+            elif content_length is not None:
                 stream = LimitedStream(self.environ['wsgi.input'],
                                        content_length)
 
@@ -411,6 +451,24 @@ class BaseRequest(object):
         self._load_form_data()
         return self.files
 
+    def close(self):
+        """Closes the files that were uploaded with the request.  This
+        gives back the memory of the uploads that are kept in memory right
+        away instead of when they are garbage collected.  The request can
+        also be used in a `with` statement which closes it afterwards.
+
+        .. versionadded:: 0.9
+        """
+        files = self.__dict__.get('files')
+        for key, value in iter_multi_items(files or ()):
+            value.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
     @cached_property
     def cookies(self):
         """Read only access to the retrieved cookie values as dictionary."""
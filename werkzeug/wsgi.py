@@ -8,8 +8,8 @@
     :copyright: (c) 2011 by the Werkzeug Team, see AUTHORS for more details.
     :license: BSD, see LICENSE for more details.
 """
-import re
 import os
+import re
 import urllib.request, urllib.parse, urllib.error
 import urllib.parse
 import posixpath
@@ -25,6 +25,11 @@ from werkzeug.http import is_resource_modified, http_date
 import collections
 
 
+#: the size of a chunk, only hex digits without signs, prefixes or
+#: whitespace are accepted as a proxy might read anything else differently.
+_chunk_size_re = re.compile(br'[0-9A-Fa-f]+\Z')
+
+
 def responder(f):
     """Marks a function as responder.  Decorate a function with it and it
     will automatically call the return value as WSGI application.
@@ -578,18 +583,56 @@ class FileWrapper(object):
 
 
 def make_limited_stream(stream, limit):
-    """Makes a stream limited."""
-    if not isinstance(stream, LimitedStream):
+    """Makes a stream limited.  A :class:`ChunkedInputStream` ends with the
+    last chunk and is returned as it is.
+    """
+    if not isinstance(stream, (LimitedStream, ChunkedInputStream)):
         if limit is None:
             raise TypeError('stream not limited and no limit provided.')
         stream = LimitedStream(stream, limit)
     return stream
 
 
-def make_chunk_iter_func(stream, limit, buffer_size):
-    """Helper for the line and chunk iter functions."""
+def wrap_chunked_input(environ, max_size=None):
+    """If the request body is sent with ``Transfer-Encoding: chunked``
+    this wraps the ``wsgi.input`` of the environment in a
+    :class:`ChunkedInputStream` that decodes it, unless the server already
+    did that, and returns it.  For other requests `None` is returned.
+
+    The stream is stored in the environment so that everyone reading the
+    body afterwards gets the decoded data.
+
+    .. versionadded:: 0.9
+
+    :param environ: the WSGI environment of the request.
+    :param max_size: the maximum size of the body or `None`.  If the
+                     stream already has a lower maximum size that one is
+                     kept.
+    """
+    stream = environ['wsgi.input']
+    if not isinstance(stream, ChunkedInputStream):
+        transfer_encoding = environ.get('HTTP_TRANSFER_ENCODING', '')
+        if environ.get('wsgi.input_terminated') or \
+           transfer_encoding.split(',')[-1].strip().lower() != 'chunked':
+            return None
+        stream = environ['wsgi.input'] = ChunkedInputStream(stream)
+        environ['wsgi.input_terminated'] = True
+    if max_size is not None and (stream.max_size is None or
+                                 stream.max_size > max_size):
+        stream.max_size = max_size
+    return stream
+
+
+def make_chunk_iter_func(stream, limit, buffer_size, reuse_buffer=False):
+    """Helper for the line and chunk iter functions.  If `reuse_buffer` is
+    enabled and the stream supports `readinto` the chunks are memoryviews
+    of a single buffer that are only valid until the next chunk is read.
+    """
     if hasattr(stream, 'read'):
-        return partial(make_limited_stream(stream, limit).read, buffer_size)
+        stream = make_limited_stream(stream, limit)
+        if reuse_buffer and stream._readinto is not None:
+            return partial(stream.read_view, bytearray(buffer_size))
+        return partial(stream.read, buffer_size)
     return iter(chain(stream, repeat(''))).__next__
 
 
@@ -618,35 +661,33 @@ def make_line_iter(stream, limit=None, buffer_size=10 * 1024):
                   is a :class:`LimitedStream`.
     :param buffer_size: The optional buffer size.
     """
-    def _iter_basic_lines():
-        _read = make_chunk_iter_func(stream, limit, buffer_size)
-        buffer = []
-        while 1:
-            new_data = _read()
-            if not new_data:
-                break
-            new_buf = []
-            for item in chain(buffer, new_data.splitlines(True)):
-                new_buf.append(item)
-                if item and item[-1:] in b'\r\n':
-                    yield b''.join(new_buf)
-                    new_buf = []
-            buffer = new_buf
-        if buffer:
-            yield b''.join(buffer)
-
-    # This hackery is necessary to merge 'foo\r' and '\n' into one item
-    # of 'foo\r\n' if we were unlucky and we hit a chunk boundary.
-    previous = b''
-    for item in _iter_basic_lines():
-        if item == b'\n' and previous[-1:] == b'\r':
-            previous += b'\n'
-            item = b''
-        if previous:
-            yield previous
-        previous = item
-    if previous:
-        yield previous
+    _read = make_chunk_iter_func(stream, limit, buffer_size, True)
+    buffer = bytearray()
+    # the part of the buffer before `search` holds no line endings so that
+    # long lines are not searched again for every chunk.
+    search = 0
+    while 1:
+        new_data = _read()
+        if not new_data:
+            break
+        buffer += new_data
+        if buffer.find(b'\n', search) < 0 and \
+           buffer.find(b'\r', search) < 0:
+            search = len(buffer)
+            continue
+        # split the buffer in one go.  The last line stays in the buffer
+        # unless it ends with a newline because a carriage return at the
+        # end could be followed by a newline in the next chunk.
+        lines = bytes(buffer).splitlines(True)
+        if lines[-1][-1:] == b'\n':
+            del buffer[:]
+        else:
+            buffer[:] = lines.pop()
+        for line in lines:
+            yield line
+        search = max(len(buffer) - 1, 0)
+    if buffer:
+        yield bytes(buffer)
 
 
 def make_chunk_iter(stream, separator, limit=None, buffer_size=10 * 1024):
@@ -667,26 +708,36 @@ def make_chunk_iter(stream, separator, limit=None, buffer_size=10 * 1024):
                   is a :class:`LimitedStream`.
     :param buffer_size: The optional buffer size.
     """
-    _read = make_chunk_iter_func(stream, limit, buffer_size)
+    _read = make_chunk_iter_func(stream, limit, buffer_size, True)
     if isinstance(separator, str):
         separator = separator.encode('latin1')
-    _split = re.compile(b'(' + re.escape(separator) + b')').split
-    buffer = []
+    buffer = bytearray()
+    # the part of the buffer before `search` holds no separators
+    search = 0
+    have_data = False
     while 1:
         new_data = _read()
         if not new_data:
             break
-        chunks = _split(new_data)
-        new_buf = []
-        for item in chain(buffer, chunks):
-            if item == separator:
-                yield b''.join(new_buf)
-                new_buf = []
-            else:
-                new_buf.append(item)
-        buffer = new_buf
-    if buffer:
-        yield b''.join(buffer)
+        have_data = True
+        buffer += new_data
+        if buffer.find(separator, search) < 0:
+            # the end of the buffer could be the start of a separator
+            search = max(len(buffer) - len(separator) + 1, 0)
+            continue
+        chunks = bytes(buffer).split(separator)
+        buffer[:] = chunks.pop()
+        for chunk in chunks:
+            yield chunk
+        search = max(len(buffer) - len(separator) + 1, 0)
+    if have_data:
+        yield bytes(buffer)
+
+
+def _copy_into(view, data):
+    """Copies `data` into the start of `view` and returns its length."""
+    view[:len(data)] = data
+    return len(data)
 
 
 class LimitedStream(object):
@@ -735,6 +786,7 @@ class LimitedStream(object):
 
     def __init__(self, stream, limit, silent=True):
         self._read = stream.read
+        self._readinto = getattr(stream, 'readinto', None)
         self._readline = stream.readline
         self._pos = 0
         self.limit = limit
@@ -807,6 +859,45 @@ class LimitedStream(object):
         self._pos += len(read)
         return read
 
+    def readinto(self, buffer):
+        """Reads up to ``len(buffer)`` bytes into the writable `buffer` and
+        returns the number of bytes read.  If the wrapped stream supports
+        `readinto` the data is read into the buffer without allocating a
+        new string.
+
+        .. versionadded:: 0.9
+
+        :param buffer: a writable buffer like a :class:`bytearray`.
+        """
+        view = memoryview(buffer).cast('B')
+        if self._pos >= self.limit:
+            return _copy_into(view, self.on_exhausted())
+        to_read = min(self.limit - self._pos, len(view))
+        try:
+            if self._readinto is not None:
+                read = self._readinto(view[:to_read])
+            else:
+                read = _copy_into(view, self._read(to_read))
+        except (IOError, ValueError):
+            return _copy_into(view, self.on_disconnect())
+        if to_read and read != to_read:
+            return _copy_into(view, self.on_disconnect())
+        self._pos += read
+        return read
+
+    def read_view(self, buffer):
+        """Works like :meth:`readinto` but returns a memoryview of the part
+        of the `buffer` that was filled.  The view changes if the buffer is
+        filled again, so if the same buffer is used for every call nothing
+        is allocated for the data read.
+
+        .. versionadded:: 0.9
+
+        :param buffer: a writable buffer like a :class:`bytearray`.
+        """
+        view = memoryview(buffer).cast('B')
+        return view[:self.readinto(view)]
+
     def readline(self, size=None):
         """Reads one line from the stream."""
         if self._pos >= self.limit:
@@ -858,3 +949,191 @@ class LimitedStream(object):
         if line is None:
             raise StopIteration()
         return line
+
+
+class ChunkedInputStream(object):
+    """Decodes a request body that is sent with ``Transfer-Encoding:
+    chunked``.  Such a body has no content length, the stream ends with
+    the last chunk instead, so unlike the :class:`LimitedStream` it is safe
+    to read until an empty string is returned.
+
+    The chunk headers are checked against `max_size` before the data of
+    a chunk is read.  If the body would be larger a
+    :exc:`~werkzeug.exceptions.RequestEntityTooLarge` error is raised, for
+    malformed chunks a :exc:`~werkzeug.exceptions.BadRequest` error.
+
+    .. versionadded:: 0.9
+
+    :param stream: the stream to decode.  It has to support `read` and
+                   `readline` with a size argument.
+    :param max_size: the maximum size of the decoded body in bytes or
+                     `None` for no limit.
+    """
+
+    #: the maximum length of a chunk header or trailer line.
+    max_line_length = 4096
+
+    def __init__(self, stream, max_size=None):
+        self._read = stream.read
+        self._readinto = getattr(stream, 'readinto', None)
+        self._readline = stream.readline
+        self.max_size = max_size
+        self._pos = 0
+        self._size = 0
+        self._left = 0
+        self._in_chunk = False
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    @property
+    def is_exhausted(self):
+        """If the last chunk was read this attribute is `True`."""
+        return self._done
+
+    def on_disconnect(self):
+        """Called if the stream ends before the last chunk.  Works like
+        :meth:`LimitedStream.on_disconnect`.
+        """
+        from werkzeug.exceptions import ClientDisconnected
+        raise ClientDisconnected()
+
+    def _fail(self, exc=None):
+        # nothing is read after an error, not even by exhaust()
+        self._left = 0
+        self._done = True
+        if exc is not None:
+            raise exc
+        return self.on_disconnect()
+
+    def _read_control_line(self):
+        try:
+            line = self._readline(self.max_line_length)
+        except (IOError, ValueError):
+            line = b''
+        if not line.endswith(b'\n'):
+            if len(line) < self.max_line_length:
+                return self._fail()
+            from werkzeug.exceptions import BadRequest
+            self._fail(BadRequest('chunk header too long'))
+        if line.endswith(b'\r\n'):
+            return line[:-2]
+        return line[:-1]
+
+    def _fill(self):
+        """Reads the next chunk header if the current chunk is used up and
+        returns `False` at the end of the body.
+        """
+        if self._left:
+            return True
+        if self._done:
+            return False
+        if self._in_chunk and self._read_control_line():
+            from werkzeug.exceptions import BadRequest
+            self._fail(BadRequest('missing line break after chunk'))
+        size = self._read_control_line().split(b';', 1)[0]
+        if _chunk_size_re.match(size) is None:
+            from werkzeug.exceptions import BadRequest
+            self._fail(BadRequest('invalid chunk size'))
+        size = int(size, 16)
+        if size == 0:
+            # skip the trailers
+            while self._read_control_line():
+                pass
+            self._done = True
+            return False
+        self._size += size
+        if self.max_size is not None and self._size > self.max_size:
+            from werkzeug.exceptions import RequestEntityTooLarge
+            self._fail(RequestEntityTooLarge())
+        self._left = size
+        self._in_chunk = True
+        return True
+
+    def _consumed(self, data):
+        if not data:
+            return self._fail()
+        self._left -= len(data)
+        self._pos += len(data)
+        return data
+
+    def exhaust(self, chunk_size=1024 * 16):
+        """Reads and discards the rest of the body."""
+        while self._fill():
+            self.read(min(self._left, chunk_size))
+
+    def read(self, size=None):
+        """Reads `size` bytes or everything up to the end of the body if
+        `size` is not provided.  Less data is only returned at the end of
+        the body.
+        """
+        if size is not None and size < 0:
+            size = None
+        rv = []
+        while (size is None or size > 0) and self._fill():
+            to_read = size is None and self._left or min(size, self._left)
+            try:
+                data = self._read(to_read)
+            except (IOError, ValueError):
+                return self._fail()
+            rv.append(self._consumed(data))
+            if size is not None:
+                size -= len(data)
+        return b''.join(rv)
+
+    def readinto(self, buffer):
+        """Reads up to ``len(buffer)`` bytes into the writable `buffer` and
+        returns the number of bytes read.
+        """
+        view = memoryview(buffer).cast('B')
+        pos = 0
+        while pos < len(view) and self._fill():
+            to_read = min(len(view) - pos, self._left)
+            if self._readinto is None:
+                data = self.read(to_read)
+                view[pos:pos + len(data)] = data
+                pos += len(data)
+                continue
+            try:
+                read = self._readinto(view[pos:pos + to_read])
+            except (IOError, ValueError):
+                return self._fail()
+            self._consumed(view[pos:pos + (read or 0)])
+            pos += read
+        return pos
+
+    def read_view(self, buffer):
+        """Works like :meth:`LimitedStream.read_view`."""
+        view = memoryview(buffer).cast('B')
+        return view[:self.readinto(view)]
+
+    def readline(self, size=None):
+        """Reads one line from the body."""
+        rv = []
+        while (size is None or size > 0) and self._fill():
+            to_read = size is None and self._left or min(size, self._left)
+            try:
+                line = self._readline(to_read)
+            except (IOError, ValueError):
+                return self._fail()
+            rv.append(self._consumed(line))
+            if line.endswith(b'\n'):
+                break
+            if size is not None:
+                size -= len(line)
+        return b''.join(rv)
+
+    def readlines(self):
+        """Reads the rest of the body into a list of lines."""
+        return list(self)
+
+    def tell(self):
+        """Returns the number of decoded bytes read so far."""
+        return self._pos
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration()
+        return line